@@ -0,0 +1,74 @@
+"""
+DragonFit - In-process cache of resolved principals (token -> User)
+
+Bounded LRU with a per-entry TTL. An entry never outlives the token it was
+resolved from (JWT `exp` / OAuth session `expires_at`).
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+class PrincipalCache:
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # token -> (expires_at_monotonic, user)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, token: str) -> Optional[Any]:
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires, user = entry
+        if expires <= time.monotonic():
+            del self._entries[token]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return user
+
+    def set(self, token: str, user: Any, token_expires_at: Optional[float] = None):
+        """Cache `user`; `token_expires_at` is a unix timestamp capping the TTL"""
+        if self.maxsize <= 0:
+            return
+        ttl = self.ttl
+        if token_expires_at is not None:
+            ttl = min(ttl, token_expires_at - time.time())
+        if ttl <= 0:
+            return
+        self._entries[token] = (time.monotonic() + ttl, user)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, token: str):
+        self._entries.pop(token, None)
+
+    def invalidate_user(self, user_id: str):
+        for token in [t for t, (_, user) in self._entries.items() if user.user_id == user_id]:
+            del self._entries[token]
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+principal_cache = PrincipalCache(
+    maxsize=int(os.environ.get("AUTH_CACHE_SIZE", "1024")),
+    ttl=float(os.environ.get("AUTH_CACHE_TTL_SECONDS", "60")),
+)
@@ -0,0 +1,235 @@
+"""
+DragonFit - Per-user exercise catalogue and stable exercise ids
+
+Every exercise in a workout plan carries an `exercise_id` from the user's
+catalogue, and session entries store it next to the positional
+`exercise_index`, so history survives reordering and renaming:
+
+    exercises: {"exercise_id": "ex_...", "user_id": "user_...",
+                "name": "Press Banca", "name_key": "press banca", "created_at"}
+
+Exercises with the same name (case and spacing ignored) share one id across
+a user's workouts, including repeats within a day; an exercise with no name
+yet (a blank row being edited) has no id. Renaming a slot renames its
+catalogue entry (history follows) only while no other slot uses it;
+otherwise the slot moves to a new entry and the others keep their name.
+Names for analytics come from one indexed `$in` lookup here instead of
+walking `workout.days[...].exercises[...]`.
+
+Resolving a plan (`plan`) only reads: the new entries and renames it
+decides on are written by `apply`, once the workout write they belong to
+has succeeded, so a rejected write (404, 409, 412) changes no names.
+
+Backfill existing workouts and sessions with:
+
+    python -m app.catalogue --migrate
+"""
+import argparse
+import asyncio
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from .database import db, to_list
+
+CATALOGUE_PROJECTION = {"_id": 0, "exercise_id": 1, "name": 1}
+
+
+def name_key(name: str) -> str:
+    return " ".join((name or "").split()).casefold()
+
+
+async def _plan_slots(user_id: str, exercise_ids: list, workout_id: Optional[str],
+                      day_index: Optional[int]) -> Dict[str, int]:
+    """Plan slots using each id, minus the ones `resolve` is rewriting"""
+    query = {"user_id": user_id, "days.exercises.exercise_id": {"$in": exercise_ids}}
+    if workout_id and day_index is None:
+        query["workout_id"] = {"$ne": workout_id}
+    slots = {}
+    async for workout in db.workouts.find(query, {"_id": 0, "workout_id": 1, "days.exercises.exercise_id": 1}):
+        for i, day in enumerate(workout.get("days", [])):
+            if workout["workout_id"] == workout_id and i == day_index:
+                continue
+            for ex in day.get("exercises", []):
+                if ex.get("exercise_id") in exercise_ids:
+                    slots[ex["exercise_id"]] = slots.get(ex["exercise_id"], 0) + 1
+    return slots
+
+
+class CatalogueChanges(NamedTuple):
+    user_id: str
+    days: list
+    new: list = []
+    renames: Dict[str, str] = {}  # exercise_id -> new name
+
+
+async def plan(user_id: str, days: list, workout_id: Optional[str] = None,
+               day_index: Optional[int] = None) -> CatalogueChanges:
+    """Fill in `exercise_id` on every exercise of `days` (plain dicts); returns the catalogue writes to `apply`.
+
+    An id the client sent back is kept; with a new name it renames its
+    catalogue entry unless another plan slot still uses it, in which case the
+    exercise moves to the entry of the new name (created if needed). Anything
+    else is matched by name. `days` replace the days of `workout_id` (only
+    day `day_index` of it when given); slots there do not count as other
+    uses. Exercises with a blank name get no id.
+    """
+    exercises = []
+    for day in days:
+        for ex in day.get("exercises", []):
+            if name_key(ex.get("name")):
+                exercises.append(ex)
+            else:
+                ex["exercise_id"] = None
+    if not exercises:
+        return CatalogueChanges(user_id, days)
+    sent_ids = list({ex["exercise_id"] for ex in exercises if ex.get("exercise_id")})
+    keys = list({name_key(ex["name"]) for ex in exercises})
+    known = await to_list(db.exercises.find(
+        {"user_id": user_id, "$or": [{"exercise_id": {"$in": sent_ids}}, {"name_key": {"$in": keys}}]},
+        {"_id": 0, "exercise_id": 1, "name": 1, "name_key": 1}
+    ))
+    by_id = {e["exercise_id"]: e for e in known}
+    by_key = {e["name_key"]: e["exercise_id"] for e in known}
+
+    # Slots in `days` that stay on each entry, and other slots where a rename would show
+    kept = {}
+    for ex in exercises:
+        entry = by_id.get(ex.get("exercise_id"))
+        key = name_key(ex["name"])
+        if entry:
+            exercise_id = entry["exercise_id"] if entry["name_key"] == key else None
+        else:
+            exercise_id = by_key.get(key)
+        if exercise_id:
+            kept[exercise_id] = kept.get(exercise_id, 0) + 1
+    changed = list({ex["exercise_id"] for ex in exercises
+                    if ex.get("exercise_id") in by_id and by_id[ex["exercise_id"]]["name"] != ex["name"]})
+    slots = await _plan_slots(user_id, changed, workout_id, day_index) if changed else {}
+
+    def shared(exercise_id: str, own: int) -> bool:
+        return slots.get(exercise_id, 0) + kept.get(exercise_id, 0) - own > 0
+
+    renames = {}
+    renamed_to = {}
+    new = {}
+    for ex in exercises:
+        entry = by_id.get(ex.get("exercise_id"))
+        key = name_key(ex["name"])
+        if entry:
+            exercise_id = entry["exercise_id"]
+            if key == renamed_to.get(exercise_id, entry["name_key"]):
+                if exercise_id not in renamed_to and entry["name"] != ex["name"] and not shared(exercise_id, 1):
+                    renames[exercise_id] = ex["name"]
+                continue
+            if exercise_id not in renamed_to and key not in by_key and key not in new and not shared(exercise_id, 0):
+                renames[exercise_id] = ex["name"]
+                renamed_to[exercise_id] = key
+                by_key[key] = exercise_id
+                continue
+            # Used elsewhere, or the new name is another entry's: move this slot to that name
+        if key not in by_key and key not in new:
+            new[key] = {"exercise_id": f"ex_{uuid.uuid4().hex[:12]}", "user_id": user_id, "name": ex["name"],
+                        "name_key": key, "created_at": datetime.now(timezone.utc).isoformat()}
+        ex["exercise_id"] = by_key.get(key) or new[key]["exercise_id"]
+
+    return CatalogueChanges(user_id, days, list(new.values()), renames)
+
+
+async def apply(changes: CatalogueChanges, workout_id: Optional[str] = None):
+    """Write what `plan` decided; `workout_id` is the workout already saved with `changes.days`"""
+    user_id = changes.user_id
+    if changes.new:
+        try:
+            await db.exercises.insert_many([dict(e) for e in changes.new], ordered=False)
+        except BulkWriteError:
+            # Another request created some of the same names meanwhile: use theirs
+            ours = {e["name_key"]: e["exercise_id"] for e in changes.new}
+            winners = await to_list(db.exercises.find(
+                {"user_id": user_id, "name_key": {"$in": list(ours)}}, {"_id": 0, "exercise_id": 1, "name_key": 1}
+            ))
+            remap = {ours[w["name_key"]]: w["exercise_id"] for w in winners if ours[w["name_key"]] != w["exercise_id"]}
+            for day in changes.days:
+                for ex in day.get("exercises", []):
+                    ex["exercise_id"] = remap.get(ex["exercise_id"], ex["exercise_id"])
+            for lost, winner in (remap.items() if workout_id else ()):
+                await db.workouts.update_one(
+                    {"workout_id": workout_id, "user_id": user_id},
+                    {"$set": {"days.$[].exercises.$[ex].exercise_id": winner}},
+                    array_filters=[{"ex.exercise_id": lost}]
+                )
+    for exercise_id, name in changes.renames.items():
+        await db.exercises.update_one({"exercise_id": exercise_id, "user_id": user_id},
+                                      {"$set": {"name": name, "name_key": name_key(name)}})
+
+
+async def resolve(user_id: str, days: list, **options) -> list:
+    """`plan` and `apply` in one go, for callers with nothing to roll back"""
+    changes = await plan(user_id, days, **options)
+    await apply(changes)
+    return changes.days
+
+
+async def names(user_id: str, exercise_ids) -> Dict[str, str]:
+    """Current catalogue name of each exercise id"""
+    ids = [i for i in set(exercise_ids) if i]
+    if not ids:
+        return {}
+    entries = await to_list(db.exercises.find({"user_id": user_id, "exercise_id": {"$in": ids}}, CATALOGUE_PROJECTION))
+    return {e["exercise_id"]: e["name"] for e in entries}
+
+
+async def list_exercises(user_id: str) -> list:
+    return await to_list(db.exercises.find({"user_id": user_id}, CATALOGUE_PROJECTION).sort("name_key", 1))
+
+
+async def migrate(batch_size: int = 500) -> Tuple[int, int]:
+    """Give existing workouts and session entries exercise ids; returns (workouts, sessions) updated"""
+    workouts_updated = 0
+    day_ids = {}  # workout_id -> [[exercise_id per position] per day]
+    async for workout in db.workouts.find({}, {"_id": 0, "workout_id": 1, "user_id": 1, "days": 1}):
+        days = workout.get("days", [])
+        if any(not ex.get("exercise_id") and name_key(ex.get("name")) for day in days for ex in day.get("exercises", [])):
+            await resolve(workout["user_id"], days)
+            await db.workouts.update_one({"workout_id": workout["workout_id"]}, {"$set": {"days": days}})
+            workouts_updated += 1
+        day_ids[workout["workout_id"]] = [[ex["exercise_id"] for ex in day.get("exercises", [])] for day in days]
+
+    # Sessions: map positions through the plan as it is now (the best record there is)
+    sessions_updated = 0
+    ops = []
+    cursor = db.training_sessions.find(
+        {"exercises": {"$elemMatch": {"exercise_id": {"$exists": False}}}},
+        {"_id": 1, "workout_id": 1, "day_index": 1, "exercises": 1}
+    )
+    async for session in cursor:
+        days = day_ids.get(session["workout_id"], [])
+        day = days[session["day_index"]] if 0 <= session.get("day_index", -1) < len(days) else []
+        exercises = [
+            dict(ex, exercise_id=day[ex["exercise_index"]]) if not ex.get("exercise_id") and 0 <= ex["exercise_index"] < len(day) else ex
+            for ex in session.get("exercises", [])
+        ]
+        ops.append(UpdateOne({"_id": session["_id"]}, {"$set": {"exercises": exercises}}))
+        if len(ops) >= batch_size:
+            sessions_updated += (await db.training_sessions.bulk_write(ops, ordered=False)).modified_count
+            ops = []
+    if ops:
+        sessions_updated += (await db.training_sessions.bulk_write(ops, ordered=False)).modified_count
+    return workouts_updated, sessions_updated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="DragonFit exercise catalogue")
+    parser.add_argument("--migrate", action="store_true", help="assign exercise ids to existing workouts and sessions")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    if args.migrate:
+        workouts, sessions = asyncio.run(migrate(args.batch_size))
+        print(f"Updated {workouts} workout(s) and {sessions} session(s)")
+        print("Run 'python -m app.records --rebuild' to key personal records by exercise id")
+        print("With SESSION_LAYOUT=buckets, also run 'python -m app.session_store --migrate'")
+    else:
+        parser.print_help()
@@ -0,0 +1,132 @@
+"""
+DragonFit - Negotiated response compression (brotli / gzip)
+
+Compresses complete (non-streaming) responses above a size threshold with
+the best encoding the client accepts. Streaming responses (exports) are
+passed through untouched. brotli is optional: without it only gzip is used.
+
+Responses of compressible types always say `Vary: Accept-Encoding`, whether
+or not this one was compressed, so shared caches keep the variants apart.
+A compressed response gets its own ETag (see conditional.encoded_etag); a
+304 answering a client that holds a compressed copy repeats that tag.
+"""
+import gzip
+import os
+
+from .conditional import ENCODINGS, encoded_etag
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", "4"))
+
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+
+def _accepted(headers) -> set:
+    for name, value in headers:
+        if name == b"accept-encoding":
+            encodings = set()
+            for item in value.decode("latin-1").split(","):
+                coding, _, params = item.strip().partition(";")
+                if params.strip().replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+                    encodings.add(coding.strip().lower())
+            return encodings
+    return set()
+
+
+def choose_encoding(accepted: set):
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def _header(headers, name: bytes) -> bytes:
+    return next((v for k, v in headers if k.lower() == name), b"")
+
+
+def _with_vary(headers: list) -> list:
+    vary = _header(headers, b"vary")
+    if b"accept-encoding" in vary.lower():
+        return headers
+    headers = [(k, v) for k, v in headers if k.lower() != b"vary"]
+    return headers + [(b"vary", vary + b", Accept-Encoding" if vary else b"Accept-Encoding")]
+
+
+def _not_modified_etag(etag: bytes, if_none_match: bytes) -> bytes:
+    """The tag of the variant the client revalidated (compressed or not)"""
+    for encoding in ENCODINGS:
+        tag = encoded_etag(etag.decode("latin-1"), encoding).encode("latin-1")
+        if tag != etag and tag in if_none_match:
+            return tag
+    return etag
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(_accepted(scope["headers"]))
+        if_none_match = _header(scope["headers"], b"if-none-match")
+
+        start = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            raw = start.get("headers", [])
+            content_type = _header(raw, b"content-type").decode("latin-1")
+            etag = _header(raw, b"etag")
+            if start["status"] == 304 and etag and if_none_match:
+                raw = [(k, _not_modified_etag(v, if_none_match) if k.lower() == b"etag" else v) for k, v in raw]
+            if content_type.startswith(COMPRESSIBLE_TYPES) or start["status"] == 304:
+                raw = _with_vary(raw)
+            if (
+                encoding is None
+                or message.get("more_body", False)
+                or len(body) < self.minimum_size
+                or _header(raw, b"content-encoding")
+                or not content_type.startswith(COMPRESSIBLE_TYPES)
+            ):
+                passthrough = True
+                await send(dict(start, headers=raw))
+                await send(message)
+                return
+
+            compressed = compress(body, encoding)
+            raw = [(k, v) for k, v in raw if k.lower() not in (b"content-length", b"etag")]
+            raw += [
+                (b"content-encoding", encoding.encode()),
+                (b"content-length", str(len(compressed)).encode()),
+            ]
+            if etag:
+                raw.append((b"etag", encoded_etag(etag.decode("latin-1"), encoding).encode("latin-1")))
+            await send(dict(start, headers=raw))
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
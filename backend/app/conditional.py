@@ -0,0 +1,98 @@
+"""
+DragonFit - ETag helpers for conditional requests (If-None-Match / If-Match)
+"""
+import hashlib
+from typing import Optional
+
+from fastapi import Response
+
+# Clients may reuse a cached copy but must revalidate it every time
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.sha1("|".join(str(p) for p in parts).encode()).hexdigest()[:20]
+    return f'"{digest}"'
+
+
+# Compressed responses carry the ETag with the encoding appended ("…-br"), so
+# each representation has its own tag; comparisons strip it again.
+ENCODINGS = ("br", "gzip")
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    return f'{etag[:-1]}-{encoding}"' if etag.endswith('"') else etag
+
+
+def _identity_tag(tag: str) -> str:
+    for encoding in ENCODINGS:
+        if tag.endswith(f'-{encoding}"'):
+            return tag[:-len(encoding) - 2] + '"'
+    return tag
+
+
+def _tags(header: Optional[str]) -> list:
+    return [_identity_tag(t.strip()) for t in (header or "").split(",") if t.strip()]
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison, as required for If-None-Match"""
+    for tag in _tags(if_none_match):
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def set_etag(response: Response, etag: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+
+
+# --- Entity versions ---
+#
+# Workout and session documents carry an integer `version` (1 on insert,
+# +1 on every write). Their ETag is "<entity id>.v<version>", so an If-Match
+# header maps straight back to a version filter for optimistic concurrency.
+
+def entity_etag(entity_id: str, version: Optional[int]) -> str:
+    return f'"{entity_id}.v{version or 0}"'
+
+
+def if_match_filter(if_match: Optional[str], entity_id: str) -> Optional[dict]:
+    """Mongo filter for the versions listed in If-Match (None: no precondition)"""
+    tags = _tags(if_match)
+    if not tags or "*" in tags:
+        return None
+    versions = []
+    for tag in tags:
+        entity, _, version = tag.strip('"').rpartition(".v")
+        if entity == entity_id and version.isdigit():
+            versions.append(int(version))
+    if 0 in versions:
+        versions.append(None)  # documents written before versioning
+    return {"version": {"$in": versions}}
+
+
+async def find_one_conditional(collection, query: dict, projection: dict, id_field: str,
+                               if_none_match: Optional[str], sort=None):
+    """(document, etag); document is None when the client's copy is current.
+
+    With If-None-Match only the id and version are read first, so a 304
+    never loads or serializes the full document.
+    """
+    if if_none_match:
+        head = await collection.find_one(query, {"_id": 0, id_field: 1, "version": 1}, sort=sort)
+        if head is None:
+            return None, None
+        etag = entity_etag(head[id_field], head.get("version"))
+        if etag_matches(if_none_match, etag):
+            return None, etag
+        query = {id_field: head[id_field], **query}
+    doc = await collection.find_one(query, projection, sort=sort)
+    if doc is None:
+        return None, None
+    return doc, entity_etag(doc[id_field], doc.get("version"))
@@ -0,0 +1,80 @@
+"""
+DragonFit - MongoDB data access layer (async, Motor)
+
+The client is created by `connect()` (app startup) or on first use, never
+at import time, so importing the app stays cheap on serverless cold starts.
+`db` forwards collection access to the real database once it exists.
+"""
+import os
+from typing import Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+
+from .metrics import command_listener
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+# Pool sizes and timeouts (all overridable from the environment)
+MONGO_OPTIONS = {
+    "maxPoolSize": _env_int("MONGO_MAX_POOL_SIZE", 100),
+    "minPoolSize": _env_int("MONGO_MIN_POOL_SIZE", 0),
+    "maxIdleTimeMS": _env_int("MONGO_MAX_IDLE_TIME_MS", 60000),
+    "waitQueueTimeoutMS": _env_int("MONGO_WAIT_QUEUE_TIMEOUT_MS", 5000),
+    "connectTimeoutMS": _env_int("MONGO_CONNECT_TIMEOUT_MS", 5000),
+    "socketTimeoutMS": _env_int("MONGO_SOCKET_TIMEOUT_MS", 20000),
+    "serverSelectionTimeoutMS": _env_int("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000),
+}
+
+_client: Optional[AsyncIOMotorClient] = None
+_db: Optional[AsyncIOMotorDatabase] = None
+
+
+def connect() -> AsyncIOMotorClient:
+    global _client, _db
+    if _client is None:
+        _client = AsyncIOMotorClient(os.environ["MONGO_URL"], event_listeners=[command_listener], **MONGO_OPTIONS)
+        _db = _client[os.environ["DB_NAME"]]
+    return _client
+
+
+def get_db() -> AsyncIOMotorDatabase:
+    if _db is None:
+        connect()
+    return _db
+
+
+class _Database:
+    """`db.workouts` / `db["workouts"]` without creating the client at import"""
+
+    def __getattr__(self, name):
+        return getattr(get_db(), name)
+
+    def __getitem__(self, name):
+        return get_db()[name]
+
+
+db = _Database()
+
+
+async def to_list(cursor) -> list:
+    """Drain a Motor cursor without blocking the event loop"""
+    return await cursor.to_list(length=None)
+
+
+async def ping() -> bool:
+    try:
+        await connect().admin.command("ping")
+        return True
+    except Exception:
+        return False
+
+
+def close():
+    global _client, _db
+    if _client is not None:
+        _client.close()
+        _client = _db = None
@@ -0,0 +1,63 @@
+"""
+DragonFit - Downsampling of chart series (/api/progress?max_points=)
+
+Both methods take max_points >= 3, always keep the first and last point and
+return points in their original order, so the client charts the result
+unchanged. The inner points are split into max_points - 2 equal buckets and
+one point is kept per bucket:
+
+- "lttb": Largest-Triangle-Three-Buckets, keeps the visual shape of the line
+- "max": the heaviest point of the bucket
+"""
+from datetime import date
+from typing import List
+
+
+def _x(point: dict) -> int:
+    try:
+        return date.fromisoformat(point["date"]).toordinal()
+    except (TypeError, ValueError):
+        return 0
+
+
+def _y(point: dict) -> float:
+    return point.get("weight") or 0
+
+
+def _buckets(points: list, count: int) -> List[list]:
+    """Split points[1:-1] into `count` contiguous, nearly equal buckets"""
+    inner = points[1:-1]
+    size = len(inner) / count
+    return [inner[int(i * size):int((i + 1) * size)] for i in range(count)]
+
+
+def lttb(points: list, max_points: int) -> list:
+    if max_points >= len(points):
+        return points
+    buckets = _buckets(points, max_points - 2)
+    result = [points[0]]
+    for i, bucket in enumerate(buckets):
+        # Average of the next bucket (or the last point) is the third triangle vertex
+        following = buckets[i + 1] if i + 1 < len(buckets) else [points[-1]]
+        avg_x = sum(_x(p) for p in following) / len(following)
+        avg_y = sum(_y(p) for p in following) / len(following)
+        prev_x, prev_y = _x(result[-1]), _y(result[-1])
+        result.append(max(bucket, key=lambda p: abs(
+            (prev_x - avg_x) * (_y(p) - prev_y) - (prev_x - _x(p)) * (avg_y - prev_y)
+        )))
+    result.append(points[-1])
+    return result
+
+
+def bucket_max(points: list, max_points: int) -> list:
+    if max_points >= len(points):
+        return points
+    buckets = _buckets(points, max_points - 2)
+    return [points[0]] + [max(bucket, key=_y) for bucket in buckets] + [points[-1]]
+
+
+METHODS = {"lttb": lttb, "max": bucket_max}
+
+
+def downsample(points: list, max_points: int, method: str = "lttb") -> list:
+    return METHODS[method](points, max_points)
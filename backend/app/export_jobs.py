@@ -0,0 +1,195 @@
+"""
+DragonFit - Export jobs and cached artifact store
+
+Rendering runs in a process pool (reportlab/openpyxl are CPU-bound). Rendered
+files are stored in GridFS (bucket `export_artifacts`) under
+`<workout_id>/<content_version>.<format>`; `content_version` is bumped on
+the workout whenever the workout or any of its sessions change, so repeated
+downloads of an unchanged workout are served straight from the store.
+
+Job state lives in `export_jobs` so any worker can answer status polls:
+
+    {"job_id", "user_id", "workout_id", "format", "content_version",
+     "status": "pending" | "done" | "failed", "file_id", "error",
+     "created_at", "updated_at"}
+"""
+import asyncio
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone, timedelta
+from typing import AsyncIterator, Optional
+
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+
+from .database import db, get_db, to_list
+from .exports import EXPORT_SESSION_PROJECTION, MEDIA_TYPES, SessionGrid, render_to_file
+
+EXPORT_WORKERS = int(os.environ.get("EXPORT_PROCESS_WORKERS", "2"))
+# A pending job older than this was lost (worker restart) and may be resubmitted
+JOB_STALE_AFTER = timedelta(seconds=int(os.environ.get("EXPORT_JOB_STALE_SECONDS", "600")))
+
+JOB_PROJECTION = {"_id": 0, "job_id": 1, "workout_id": 1, "format": 1, "content_version": 1,
+                  "status": 1, "error": 1, "created_at": 1, "updated_at": 1}
+
+_executor: Optional[ProcessPoolExecutor] = None
+_bucket: Optional[AsyncIOMotorGridFSBucket] = None
+_tasks = set()
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=EXPORT_WORKERS)
+    return _executor
+
+
+def _artifacts() -> AsyncIOMotorGridFSBucket:
+    global _bucket
+    if _bucket is None:
+        _bucket = AsyncIOMotorGridFSBucket(get_db(), bucket_name="export_artifacts")
+    return _bucket
+
+
+def artifact_name(workout_id: str, content_version: int, fmt: str) -> str:
+    return f"{workout_id}/{content_version}.{fmt}"
+
+
+async def bump_content_version(user_id: str, workout_id: str):
+    """Invalidate cached exports of a workout (call after any write touching it)"""
+    await db.workouts.update_one(
+        {"workout_id": workout_id, "user_id": user_id},
+        {"$inc": {"content_version": 1}}
+    )
+
+
+async def find_artifact(workout_id: str, content_version: int, fmt: str):
+    files = await to_list(_artifacts().find(
+        {"filename": artifact_name(workout_id, content_version, fmt)}
+    ).sort("uploadDate", -1).limit(1))
+    return files[0] if files else None
+
+
+async def delete_artifacts(workout_id: str, query: Optional[dict] = None):
+    files = await to_list(_artifacts().find(dict(query or {}, **{"metadata.workout_id": workout_id})))
+    for f in files:
+        await _artifacts().delete(f["_id"])
+
+
+async def render_artifact(user_id: str, workout: dict, fmt: str):
+    """Render `workout` in the process pool and store it; returns the GridFS file id"""
+    grid = SessionGrid()
+    if fmt == "xlsx":
+        async for session in db.training_sessions.find(
+            {"workout_id": workout["workout_id"], "user_id": user_id},
+            EXPORT_SESSION_PROJECTION
+        ).sort("date", 1):
+            grid.add(session)
+
+    # The worker writes a temp file and sends back its path; GridFS reads it in chunks
+    loop = asyncio.get_running_loop()
+    path = await loop.run_in_executor(_pool(), render_to_file, fmt, workout, grid)
+
+    version = workout.get("content_version", 0)
+    try:
+        with open(path, "rb") as rendered:
+            file_id = await _artifacts().upload_from_stream(
+                artifact_name(workout["workout_id"], version, fmt),
+                rendered,
+                metadata={"user_id": user_id, "workout_id": workout["workout_id"],
+                          "content_version": version, "format": fmt,
+                          "content_type": MEDIA_TYPES[fmt]}
+            )
+    finally:
+        os.remove(path)
+    # Older versions of this workout's exports are no longer reachable
+    await delete_artifacts(workout["workout_id"], {
+        "metadata.format": fmt,
+        "metadata.content_version": {"$lt": version}
+    })
+    return file_id
+
+
+async def get_or_render(user_id: str, workout: dict, fmt: str):
+    """GridFS file id of the export for the workout's current content version"""
+    cached = await find_artifact(workout["workout_id"], workout.get("content_version", 0), fmt)
+    if cached:
+        return cached["_id"]
+    return await render_artifact(user_id, workout, fmt)
+
+
+async def _run_job(job_id: str, user_id: str, workout: dict, fmt: str):
+    try:
+        file_id = await render_artifact(user_id, workout, fmt)
+        update = {"status": "done", "file_id": file_id}
+    except Exception as e:
+        update = {"status": "failed", "error": str(e)}
+    update["updated_at"] = datetime.now(timezone.utc)
+    await db.export_jobs.update_one({"job_id": job_id}, {"$set": update})
+
+
+async def submit_job(user_id: str, workout: dict, fmt: str) -> dict:
+    version = workout.get("content_version", 0)
+    now = datetime.now(timezone.utc)
+
+    # Same export already queued (and not lost to a restart)
+    pending = await db.export_jobs.find_one({
+        "user_id": user_id, "workout_id": workout["workout_id"], "format": fmt,
+        "content_version": version, "status": "pending",
+        "created_at": {"$gt": now - JOB_STALE_AFTER}
+    }, JOB_PROJECTION)
+    if pending:
+        return pending
+
+    job = {
+        "job_id": f"export_{uuid.uuid4().hex[:12]}",
+        "user_id": user_id,
+        "workout_id": workout["workout_id"],
+        "format": fmt,
+        "content_version": version,
+        "status": "pending",
+        "created_at": now,
+        "updated_at": now
+    }
+    cached = await find_artifact(workout["workout_id"], version, fmt)
+    if cached:
+        job.update({"status": "done", "file_id": cached["_id"]})
+    await db.export_jobs.insert_one(job)
+
+    if not cached:
+        task = asyncio.create_task(_run_job(job["job_id"], user_id, workout, fmt))
+        _tasks.add(task)
+        task.add_done_callback(_tasks.discard)
+    return {k: v for k, v in job.items() if JOB_PROJECTION.get(k)}
+
+
+async def get_job(user_id: str, job_id: str, include_file: bool = False) -> Optional[dict]:
+    projection = dict(JOB_PROJECTION, file_id=1) if include_file else JOB_PROJECTION
+    job = await db.export_jobs.find_one({"job_id": job_id, "user_id": user_id}, projection)
+    if job and job["status"] == "pending":
+        created_at = job["created_at"]
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        if created_at < datetime.now(timezone.utc) - JOB_STALE_AFTER:
+            job["status"] = "failed"
+            job["error"] = "Export job was interrupted, submit it again"
+    return job
+
+
+async def open_artifact(file_id):
+    """(length, async chunk iterator) for a stored artifact"""
+    grid_out = await _artifacts().open_download_stream(file_id)
+
+    async def chunks() -> AsyncIterator[bytes]:
+        while True:
+            chunk = await grid_out.readchunk()
+            if not chunk:
+                break
+            yield chunk
+
+    return grid_out.length, chunks()
+
+
+def shutdown():
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,161 @@
+"""
+DragonFit - Workout export rendering (XLSX / PDF)
+
+The render_* functions are pure (plain dicts in, a file written out) so they
+can run in a worker process; see export_jobs.py, which calls `render_to_file`
+there so only a temp-file path comes back, not the rendered bytes. openpyxl
+and reportlab are imported inside them: together they are most of the API's
+import time and only the export path needs them.
+"""
+import os
+import re
+import tempfile
+from typing import BinaryIO, Optional
+
+MEDIA_TYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "pdf": "application/pdf",
+}
+
+# Projection with just what the export needs from each session
+EXPORT_SESSION_PROJECTION = {
+    "_id": 0, "date": 1, "day_index": 1,
+    "exercises.exercise_index": 1, "exercises.exercise_id": 1, "exercises.weight": 1, "exercises.reps": 1
+}
+
+
+class SessionGrid:
+    """Sessions grouped by day in one pass: dates per day and one cell per (exercise, session)
+
+    Entries carrying an exercise_id follow the exercise wherever it sits in
+    the plan now (an exercise the day repeats stays on the position it was
+    logged at); older entries stay on the position they were logged at.
+    """
+
+    def __init__(self):
+        # day_index -> {"dates": [...], "cells": {exercise_index: {column: text}}, "ids": {exercise_id: {...}},
+        #               "slots": {(exercise_id, exercise_index): {...}}}
+        self.days = {}
+
+    def add(self, session: dict):
+        day = self.days.setdefault(session.get("day_index"), {"dates": [], "cells": {}, "ids": {}, "slots": {}})
+        column = len(day["dates"])
+        day["dates"].append(session.get("date", ""))
+        for ex in session.get("exercises", []):
+            cell = f"{ex.get('weight', '')} - {ex.get('reps', '')}"
+            if ex.get("exercise_id"):
+                day["ids"].setdefault(ex["exercise_id"], {}).setdefault(column, cell)
+                row = day["slots"].setdefault((ex["exercise_id"], ex.get("exercise_index")), {})
+            else:
+                row = day["cells"].setdefault(ex.get("exercise_index"), {})
+            # First entry wins if an exercise was logged twice in a session
+            row.setdefault(column, cell)
+
+    def dates(self, day_index: int) -> list:
+        return self.days.get(day_index, {}).get("dates", [])
+
+    def row(self, day_index: int, exercise_index: int, exercise_id: Optional[str] = None,
+            repeated: bool = False) -> list:
+        day = self.days.get(day_index)
+        if not day:
+            return []
+        cells = day["cells"].get(exercise_index, {})
+        if exercise_id and repeated:
+            cells = {**cells, **day["slots"].get((exercise_id, exercise_index), {})}
+        elif exercise_id:
+            cells = {**cells, **day["ids"].get(exercise_id, {})}
+        return [cells.get(column, "") for column in range(len(day["dates"]))]
+
+
+def sheet_title(name: str) -> str:
+    # Excel: max 31 chars, no []:*?/\
+    return re.sub(r"[\[\]:*?/\\]", "-", name)[:31] or "DragonFit"
+
+
+def render_excel(workout: dict, grid: SessionGrid, output: BinaryIO):
+    """Workout sheet with one column per session (openpyxl write-only mode)"""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_title(workout["name"]))
+
+    # Header
+    ws.append(["DragonFit - " + workout["name"]])
+    ws.append([])
+
+    for day in workout.get("days", []):
+        day_index = day["day_number"] - 1
+        ws.append([f"Día {day['day_number']}: {day['name']}"])
+        ws.append(["Ejercicio", "Series/Reps", "Notas"] + grid.dates(day_index))
+
+        ids = [exercise.get("exercise_id") for exercise in day.get("exercises", [])]
+        for i, exercise in enumerate(day.get("exercises", [])):
+            ws.append([exercise["name"], exercise.get("sets", ""), exercise.get("notes", "")]
+                      + grid.row(day_index, i, ids[i], ids.count(ids[i]) > 1))
+        ws.append([])
+
+    wb.save(output)
+
+
+def render_pdf(workout: dict, grid: SessionGrid, output: BinaryIO):
+    """Workout plan, one table per day"""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+
+    doc = SimpleDocTemplate(output, pagesize=A4)
+    elements = []
+    styles = getSampleStyleSheet()
+
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=18,
+        textColor=colors.HexColor('#22c55e')
+    )
+
+    elements.append(Paragraph(f"DragonFit - {workout['name']}", title_style))
+    elements.append(Spacer(1, 20))
+
+    for day in workout.get("days", []):
+        elements.append(Paragraph(f"Día {day['day_number']}: {day['name']}", styles['Heading2']))
+
+        table_data = [["Ejercicio", "Series/Reps", "Notas"]]
+        for exercise in day.get("exercises", []):
+            table_data.append([exercise["name"], exercise.get("sets", ""), exercise.get("notes", "")])
+
+        table = Table(table_data, colWidths=[200, 100, 150])
+        table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#22c55e')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#18181b')),
+            ('TEXTCOLOR', (0, 1), (-1, -1), colors.white),
+            ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#27272a'))
+        ]))
+        elements.append(table)
+        elements.append(Spacer(1, 20))
+
+    doc.build(elements)
+
+
+RENDERERS = {
+    "xlsx": render_excel,
+    "pdf": render_pdf,
+}
+
+
+def render_to_file(fmt: str, workout: dict, grid: SessionGrid) -> str:
+    """Render into a new temporary file and return its path; the caller deletes it"""
+    fd, path = tempfile.mkstemp(prefix="dragonfit-export-", suffix=f".{fmt}")
+    try:
+        with os.fdopen(fd, "wb") as output:
+            RENDERERS[fmt](workout, grid, output)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
@@ -0,0 +1,62 @@
+"""
+DragonFit - Password hashing off the event loop
+
+bcrypt is deliberately slow (~100-300 ms per call), so hashing and
+verification run in a small dedicated thread pool (bcrypt releases the GIL).
+Work beyond the pool size waits in a bounded queue; when that is full the
+request is rejected with 503 instead of piling up behind a login burst.
+passlib is imported on the first hash/verify, not at startup.
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+
+HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", "2"))
+HASH_MAX_QUEUE = int(os.environ.get("PASSWORD_HASH_MAX_QUEUE", "32"))
+BCRYPT_ROUNDS = int(os.environ.get("PASSWORD_BCRYPT_ROUNDS", "12"))
+
+_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="bcrypt")
+_in_flight = 0
+_pwd_context = None
+
+
+def pwd_context():
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+    return _pwd_context
+
+
+async def _run(func, *args):
+    global _in_flight
+    if _in_flight >= HASH_WORKERS + HASH_MAX_QUEUE:
+        raise HTTPException(status_code=503, detail="Server busy, try again",
+                            headers={"Retry-After": "1"})
+    _in_flight += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+    finally:
+        _in_flight -= 1
+
+
+async def hash_password(password: str) -> str:
+    return await _run(pwd_context().hash, password)
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Returns (valid, new_hash); new_hash is set when the stored hash uses an outdated cost factor"""
+    if not hashed_password:
+        return False, None
+    return await _run(pwd_context().verify_and_update, plain_password, hashed_password)
+
+
+def queue_depth() -> int:
+    return _in_flight
+
+
+def shutdown():
+    _executor.shutdown(wait=False)
@@ -0,0 +1,132 @@
+"""
+DragonFit - Streaming parsers for bulk session import (CSV / NDJSON)
+
+Both parsers consume the request body incrementally and yield
+`(line_number, payload)` pairs, where payload is a SessionCreate-shaped
+dict or the exception explaining why that line was rejected.
+
+NDJSON: one session per line, same JSON body as POST /api/sessions
+(`workout_id` may be omitted and given once as a query parameter).
+
+CSV: one exercise log per row, with a header line. Consecutive rows with
+the same (workout_id, date, day_index) form one session; a quoted field
+may span lines, and a row reports the line it starts on:
+
+    date,day_index,exercise_index,weight,reps,notes
+    2024-05-06,0,0,80kg,"10,10,8",
+    2024-05-06,0,1,50kg,"12,10,10","buen día,
+    subir peso"
+"""
+import codecs
+import collections
+import csv
+import json
+from typing import AsyncIterator, Tuple, Union
+
+CSV_REQUIRED_COLUMNS = {"date", "day_index", "exercise_index"}
+
+
+async def iter_lines(stream) -> AsyncIterator[Tuple[int, str]]:
+    """Decode a byte stream into (line_number, line) without buffering it all"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    line_no = 0
+    async for chunk in stream:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            line_no += 1
+            yield line_no, line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield line_no + 1, pending.rstrip("\r")
+
+
+async def parse_ndjson(lines) -> AsyncIterator[Tuple[int, Union[dict, Exception]]]:
+    async for line_no, line in lines:
+        if not line.strip():
+            continue
+        try:
+            payload = json.loads(line)
+            if not isinstance(payload, dict):
+                raise ValueError("expected a JSON object")
+            yield line_no, payload
+        except ValueError as e:
+            yield line_no, e
+
+
+class _PushedLines:
+    """Iterator one csv.reader pulls from while the request body pushes lines in"""
+
+    def __init__(self):
+        self.pending = collections.deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        if not self.pending:
+            raise StopIteration
+        return self.pending.popleft()
+
+
+async def _csv_rows(lines) -> AsyncIterator[Tuple[int, list]]:
+    """(first line number, fields) per CSV record, skipping blank lines between records"""
+    source = _PushedLines()
+    reader = csv.reader(source)
+    first = None
+    quotes = 0
+    async for line_no, line in lines:
+        if first is None:
+            if not line.strip():
+                continue
+            first = line_no
+        source.pending.append(line + "\n")
+        quotes += line.count('"')
+        if quotes % 2:
+            continue  # inside a quoted field: the record goes on in the next line
+        yield first, next(reader, [])
+        first, quotes = None, 0
+    if first is not None:
+        yield first, next(reader, [])  # unterminated quote at the end of the body
+
+
+async def parse_csv(lines) -> AsyncIterator[Tuple[int, Union[dict, Exception]]]:
+    header = None
+    current = None  # (first line number, session payload)
+    async for line_no, fields in _csv_rows(lines):
+        if header is None:
+            header = [h.strip().lower() for h in fields]
+            missing = CSV_REQUIRED_COLUMNS - set(header)
+            if missing:
+                yield line_no, ValueError(f"CSV header missing columns: {', '.join(sorted(missing))}")
+                return
+            continue
+
+        row = dict(zip(header, fields))
+        try:
+            key = (row.get("workout_id") or None, row["date"].strip(), int(row["day_index"]))
+            entry = {
+                "exercise_index": int(row["exercise_index"]),
+                "weight": row.get("weight", ""),
+                "reps": row.get("reps", ""),
+                "notes": row.get("notes", "")
+            }
+        except (KeyError, ValueError) as e:
+            yield line_no, ValueError(f"invalid row: {e}")
+            continue
+
+        if current and current[1]["_key"] == key:
+            current[1]["exercises"].append(entry)
+            continue
+        if current:
+            current[1].pop("_key")
+            yield current
+        payload = {"_key": key, "date": key[1] or None, "day_index": key[2], "exercises": [entry]}
+        if key[0]:
+            payload["workout_id"] = key[0]
+        current = (line_no, payload)
+
+    if current:
+        current[1].pop("_key")
+        yield current
@@ -0,0 +1,239 @@
+"""
+DragonFit - Declarative MongoDB index bootstrap
+
+Every index the API relies on is declared in INDEXES together with the
+query paths it serves. `ensure_indexes()` runs at startup and reconciles
+the live indexes with the declarations (creating missing ones and
+rebuilding those whose options changed). Print the report with:
+
+    python -m app.indexes [--report-only]
+"""
+import argparse
+import asyncio
+import logging
+from typing import List, NamedTuple, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError
+
+from .database import db
+from .sync import TOMBSTONE_DAYS
+
+logger = logging.getLogger("dragonfit.indexes")
+
+
+class IndexSpec(NamedTuple):
+    collection: str
+    keys: List[Tuple[str, int]]
+    name: str
+    serves: List[str]
+    unique: bool = False
+    expire_after_seconds: Optional[int] = None
+
+
+INDEXES = [
+    IndexSpec("users", [("email", ASCENDING)], "email_unique",
+              ["POST /api/auth/register", "POST /api/auth/login", "POST /api/auth/session"],
+              unique=True),
+    IndexSpec("users", [("user_id", ASCENDING)], "user_id_unique",
+              ["get_current_user"], unique=True),
+
+    IndexSpec("user_sessions", [("session_token", ASCENDING)], "session_token_unique",
+              ["get_current_user", "POST /api/auth/logout"], unique=True),
+    IndexSpec("user_sessions", [("user_id", ASCENDING)], "user_id",
+              ["POST /api/auth/session (drop previous sessions)"]),
+    # TTL: Mongo removes OAuth sessions once expires_at has passed
+    IndexSpec("user_sessions", [("expires_at", ASCENDING)], "expires_at_ttl",
+              ["TTL expiry of OAuth sessions"], expire_after_seconds=0),
+
+    IndexSpec("workouts", [("user_id", ASCENDING), ("workout_id", ASCENDING)], "user_workout_unique",
+              ["GET /api/workouts", "GET/DELETE /api/workouts/{id}", "POST /api/sessions",
+               "GET /api/progress (workout names)", "GET /api/export/*", "POST /api/sync (snapshot pages)"],
+              unique=True),
+    IndexSpec("workouts", [("user_id", ASCENDING), ("created_at", ASCENDING), ("workout_id", ASCENDING)],
+              "user_created_workout",
+              ["GET /api/workouts (keyset pagination)"]),
+    IndexSpec("workouts", [("workout_id", ASCENDING)], "workout_id_unique",
+              ["PUT /api/workouts/{id}"], unique=True),
+    IndexSpec("workouts", [("user_id", ASCENDING), ("sync_seq", ASCENDING)], "user_sync_seq",
+              ["POST /api/sync"]),
+
+    IndexSpec("training_sessions", [("session_id", ASCENDING)], "session_id_unique",
+              ["GET/DELETE /api/sessions/{id}"], unique=True),
+    IndexSpec("training_sessions",
+              [("user_id", ASCENDING), ("date", DESCENDING), ("session_id", DESCENDING)],
+              "user_date_session",
+              ["GET /api/sessions (keyset pagination)", "GET /api/progress (from/to)", "stats rebuild"]),
+    IndexSpec("training_sessions",
+              [("user_id", ASCENDING), ("workout_id", ASCENDING), ("date", DESCENDING),
+               ("session_id", DESCENDING)],
+              "user_workout_date_session",
+              ["GET /api/sessions?workout_id= (keyset pagination)", "GET /api/progress?workout_id=",
+               "DELETE /api/workouts/{id}", "GET /api/export/*"]),
+    IndexSpec("training_sessions",
+              [("user_id", ASCENDING), ("workout_id", ASCENDING), ("day_index", ASCENDING),
+               ("created_at", DESCENDING)],
+              "user_workout_day_created",
+              ["GET /api/sessions/last/{workout_id}/{day_index}"]),
+    IndexSpec("training_sessions", [("user_id", ASCENDING), ("sync_seq", ASCENDING)], "user_sync_seq",
+              ["POST /api/sync"]),
+    IndexSpec("training_sessions", [("user_id", ASCENDING), ("session_id", ASCENDING)], "user_session",
+              ["POST /api/sync (snapshot pages)"]),
+    IndexSpec("training_sessions",
+              [("user_id", ASCENDING), ("exercises.exercise_id", ASCENDING), ("date", DESCENDING)],
+              "user_exercise_date",
+              ["GET /api/progress?exercise_key=ex_...", "personal record recompute"]),
+
+    IndexSpec("exercises", [("user_id", ASCENDING), ("exercise_id", ASCENDING)], "user_exercise_unique",
+              ["exercise name lookups (progress, records)", "GET /api/exercises"], unique=True),
+    # One catalogue entry per name; concurrent creates of the same name collide here
+    IndexSpec("exercises", [("user_id", ASCENDING), ("name_key", ASCENDING)], "user_name_unique",
+              ["workout create/update (catalogue resolve)", "GET /api/exercises (sorted)"], unique=True),
+
+    # Only used with SESSION_LAYOUT=buckets (see session_store.py)
+    IndexSpec("session_buckets", [("user_id", ASCENDING), ("month", ASCENDING)], "user_month_unique",
+              ["GET /api/progress (bucket layout)", "session bucket updates", "stats rebuild (bucket layout)"],
+              unique=True),
+
+    IndexSpec("user_stats", [("user_id", ASCENDING)], "user_id_unique",
+              ["GET /api/stats", "stats rollup updates", "hiding sessions of workouts being purged"], unique=True),
+
+    IndexSpec("personal_records", [("user_id", ASCENDING), ("exercise_key", ASCENDING)],
+              "user_exercise_unique",
+              ["GET /api/records", "personal record updates"], unique=True),
+    IndexSpec("personal_records", [("user_id", ASCENDING), ("workout_ids", ASCENDING)],
+              "user_workouts",
+              ["GET /api/records?workout_id=", "records of a deleted workout"]),
+
+    IndexSpec("sync_counters", [("user_id", ASCENDING)], "user_id_unique",
+              ["sync sequence allocation"], unique=True),
+    IndexSpec("sync_tombstones",
+              [("user_id", ASCENDING), ("collection", ASCENDING), ("sync_seq", ASCENDING)],
+              "user_collection_seq",
+              ["POST /api/sync (deletes)"]),
+    # Clients whose token is older than this get a full snapshot instead
+    IndexSpec("sync_tombstones", [("deleted_at", ASCENDING)], "deleted_at_ttl",
+              ["TTL expiry of sync tombstones"], expire_after_seconds=TOMBSTONE_DAYS * 24 * 60 * 60),
+
+    IndexSpec("workout_purges", [("purge_id", ASCENDING)], "purge_id_unique",
+              ["workout purge progress updates"], unique=True),
+    IndexSpec("workout_purges",
+              [("user_id", ASCENDING), ("status", ASCENDING), ("workout_id", ASCENDING)],
+              "user_status_workout",
+              ["stats rollup rebuild (workouts being purged)"]),
+    IndexSpec("workout_purges",
+              [("user_id", ASCENDING), ("workout_id", ASCENDING), ("created_at", DESCENDING)],
+              "user_workout_created",
+              ["GET /api/workouts/{id}/deletion"]),
+    IndexSpec("workout_purges", [("status", ASCENDING), ("lease_until", ASCENDING)], "status_lease",
+              ["claiming purge jobs"]),
+    # Only finished jobs have finished_at; pending ones never expire
+    IndexSpec("workout_purges", [("finished_at", ASCENDING)], "finished_at_ttl",
+              ["TTL expiry of finished purge jobs"], expire_after_seconds=7 * 24 * 60 * 60),
+
+    IndexSpec("export_jobs", [("job_id", ASCENDING)], "job_id_unique",
+              ["GET /api/export/jobs/{job_id}", "export job completion"], unique=True),
+    IndexSpec("export_jobs",
+              [("user_id", ASCENDING), ("workout_id", ASCENDING), ("format", ASCENDING),
+               ("content_version", ASCENDING), ("status", ASCENDING)],
+              "user_workout_format_version",
+              ["POST /api/export/jobs (dedupe pending jobs)"]),
+    # Job records are only needed while the client polls; artifacts are kept
+    IndexSpec("export_jobs", [("created_at", ASCENDING)], "created_at_ttl",
+              ["TTL expiry of finished export jobs"], expire_after_seconds=24 * 60 * 60),
+    IndexSpec("export_artifacts.files", [("metadata.workout_id", ASCENDING)], "workout_id",
+              ["export artifact invalidation", "DELETE /api/workouts/{id}"]),
+]
+
+# Indexes superseded by a declaration above; dropped if still present
+RETIRED_INDEXES = [
+    ("training_sessions", "user_date"),
+    ("training_sessions", "user_workout_date"),
+    # Records were per workout; run `python -m app.records --rebuild` before this drop
+    ("personal_records", "user_workout_exercise_unique"),
+]
+
+
+def _options(spec: IndexSpec) -> dict:
+    options = {"name": spec.name}
+    if spec.unique:
+        options["unique"] = True
+    if spec.expire_after_seconds is not None:
+        options["expireAfterSeconds"] = spec.expire_after_seconds
+    return options
+
+
+def _matches(spec: IndexSpec, info: dict) -> bool:
+    return (
+        [tuple(k) for k in info.get("key", [])] == [tuple(k) for k in spec.keys]
+        and bool(info.get("unique", False)) == spec.unique
+        and info.get("expireAfterSeconds") == spec.expire_after_seconds
+    )
+
+
+async def ensure_indexes(database=db) -> List[dict]:
+    """Reconcile live indexes with INDEXES; returns one report row per spec"""
+    report = []
+    existing_by_collection = {}
+    for spec in INDEXES:
+        collection = database[spec.collection]
+        row = {"collection": spec.collection, "index": spec.name,
+               "keys": spec.keys, "serves": spec.serves}
+        try:
+            if spec.collection not in existing_by_collection:
+                existing_by_collection[spec.collection] = await collection.index_information()
+            existing = existing_by_collection[spec.collection]
+
+            same_keys = [name for name, info in existing.items()
+                         if [tuple(k) for k in info.get("key", [])] == [tuple(k) for k in spec.keys]]
+            if any(_matches(spec, existing[name]) for name in same_keys):
+                row["status"] = "ok"
+            else:
+                # Same name or same keys with different options: rebuild
+                stale = set(same_keys)
+                if spec.name in existing:
+                    stale.add(spec.name)
+                for name in stale:
+                    await collection.drop_index(name)
+                await collection.create_index(spec.keys, **_options(spec))
+                row["status"] = "rebuilt" if stale else "created"
+        except PyMongoError as e:
+            row["status"] = f"error: {e}"
+            logger.warning("Index %s.%s not reconciled: %s", spec.collection, spec.name, e)
+        report.append(row)
+
+    for collection_name, name in RETIRED_INDEXES:
+        try:
+            existing = existing_by_collection.get(collection_name)
+            if existing is None:
+                existing = await database[collection_name].index_information()
+            if name in existing:
+                await database[collection_name].drop_index(name)
+                report.append({"collection": collection_name, "index": name,
+                               "keys": existing[name]["key"], "serves": [], "status": "dropped"})
+        except PyMongoError as e:
+            logger.warning("Retired index %s.%s not dropped: %s", collection_name, name, e)
+    return report
+
+
+def format_report(report: List[dict]) -> str:
+    lines = []
+    for row in report:
+        keys = ", ".join(f"{field}:{direction}" for field, direction in row["keys"])
+        lines.append(f"[{row['status']}] {row['collection']}.{row['index']} ({keys})")
+        for path in row["serves"]:
+            lines.append(f"    serves: {path}")
+    return "\n".join(lines)
+
+
+def report_only() -> List[dict]:
+    return [{"collection": spec.collection, "index": spec.name, "keys": spec.keys,
+             "serves": spec.serves, "status": "declared"} for spec in INDEXES]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="DragonFit index manager")
+    parser.add_argument("--report-only", action="store_true", help="print declarations without touching Mongo")
+    args = parser.parse_args()
+    report = report_only() if args.report_only else asyncio.run(ensure_indexes())
+    print(format_report(report))
@@ -0,0 +1,193 @@
+"""
+DragonFit - Request and MongoDB instrumentation (GET /api/metrics)
+
+- `MetricsMiddleware` times every HTTP request per route template and
+  counts responses per status, tagging each request with an id
+  (X-Request-ID, taken from the client or generated).
+- `command_listener` is a pymongo CommandListener registered on the Motor
+  client. It records per-collection command durations and counts and logs
+  commands slower than MONGO_SLOW_QUERY_MS with the id of the request that
+  issued them (Motor runs commands with the caller's context, so the
+  request id context variable is visible in the listener).
+
+`render()` returns everything in the Prometheus text exposition format.
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from typing import Dict, Tuple
+
+from pymongo import monitoring
+
+logger = logging.getLogger("dragonfit.metrics")
+
+SLOW_QUERY_MS = float(os.environ.get("MONGO_SLOW_QUERY_MS", "100"))
+REQUEST_ID_HEADER = "X-Request-ID"
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+request_id_var: contextvars.ContextVar = contextvars.ContextVar("request_id", default=None)
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...]):
+        self.name, self.help, self.labels = name, help_text, labels
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def lines(self) -> list:
+        with self._lock:
+            values = dict(self._values)
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(values.items()):
+            out.append(f"{self.name}{_labels(self.labels, label_values)} {_number(value)}")
+        return out
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...], buckets: tuple):
+        self.name, self.help, self.labels, self.buckets = name, help_text, labels, buckets
+        # label values -> [per-bucket counts (+Inf last), sum]
+        self._values: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            entry = self._values.setdefault(label_values, [[0] * (len(self.buckets) + 1), 0.0])
+            entry[0][bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+
+    def lines(self) -> list:
+        with self._lock:
+            values = {k: (list(v[0]), v[1]) for k, v in self._values.items()}
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = _labels(self.labels + ("le",), label_values + (_number(bound) if bound != "+Inf" else bound,))
+                out.append(f"{self.name}_bucket{le} {cumulative}")
+            out.append(f"{self.name}_sum{_labels(self.labels, label_values)} {_number(total)}")
+            out.append(f"{self.name}_count{_labels(self.labels, label_values)} {cumulative}")
+        return out
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+http_requests = Counter("dragonfit_http_requests_total", "HTTP responses by route and status",
+                        ("method", "route", "status"))
+http_duration = Histogram("dragonfit_http_request_duration_seconds", "HTTP request latency by route",
+                          ("method", "route"), HTTP_BUCKETS)
+mongo_commands = Counter("dragonfit_mongo_commands_total", "MongoDB commands by collection and outcome",
+                         ("collection", "command", "outcome"))
+mongo_duration = Histogram("dragonfit_mongo_command_duration_seconds", "MongoDB command latency by collection",
+                           ("collection", "command"), MONGO_BUCKETS)
+mongo_slow = Counter("dragonfit_mongo_slow_commands_total",
+                     "MongoDB commands slower than MONGO_SLOW_QUERY_MS", ("collection", "command"))
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+        request_id = request_id or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((REQUEST_ID_HEADER.lower().encode(), request_id.encode("latin-1")))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(token)
+            # Route template (/api/workouts/{workout_id}) keeps label cardinality bounded
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            http_requests.inc(scope["method"], route, str(status))
+            http_duration.observe(time.perf_counter() - start, scope["method"], route)
+
+
+class CommandMetrics(monitoring.CommandListener):
+    def __init__(self):
+        self._pending: Dict[tuple, Tuple[str, str]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(event) -> tuple:
+        return (event.connection_id, event.request_id)
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        if not isinstance(collection, str):
+            collection = "-"  # admin / database-level commands (ping, listIndexes of a db...)
+        with self._lock:
+            self._pending[self._key(event)] = (collection, request_id_var.get())
+
+    def _finish(self, event, outcome: str):
+        with self._lock:
+            collection, request_id = self._pending.pop(self._key(event), ("-", None))
+        seconds = event.duration_micros / 1e6
+        mongo_commands.inc(collection, event.command_name, outcome)
+        mongo_duration.observe(seconds, collection, event.command_name)
+        if seconds * 1000 >= SLOW_QUERY_MS:
+            mongo_slow.inc(collection, event.command_name)
+            logger.warning("slow mongo command: %s.%s %.1fms (request %s)",
+                           collection, event.command_name, seconds * 1000, request_id or "-")
+
+    def succeeded(self, event):
+        self._finish(event, "ok")
+
+    def failed(self, event):
+        self._finish(event, "error")
+
+
+command_listener = CommandMetrics()
+
+
+def render(extra: Dict[str, Tuple[str, str, float]] = None) -> str:
+    """Prometheus text format; `extra` adds process-level values (name -> (type, help, value))"""
+    lines = []
+    for metric in (http_requests, http_duration, mongo_commands, mongo_duration, mongo_slow):
+        lines += metric.lines()
+    for name, (kind, help_text, value) in (extra or {}).items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {_number(value)}"]
+    return "\n".join(lines) + "\n"
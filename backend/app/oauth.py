@@ -0,0 +1,121 @@
+"""
+DragonFit - OAuth session exchange (POST /api/auth/session)
+
+One app-lifetime httpx client talks to the OAuth provider, so logins reuse
+pooled keep-alive connections instead of paying a TCP + TLS handshake each.
+Every call has explicit connect/read timeouts, and a circuit breaker stops
+calling a provider that keeps failing: after OAUTH_BREAKER_FAILURES
+consecutive errors logins fail fast with 503 for OAUTH_BREAKER_RESET_SECONDS,
+then a single trial request decides whether to close it again.
+
+Point OAUTH_SESSION_URL at a local stub for tests and benchmarks. httpx is
+imported with the first exchange, keeping it off the cold-start path.
+"""
+import asyncio
+import os
+import time
+from typing import Optional
+
+from fastapi import HTTPException
+
+OAUTH_SESSION_URL = os.environ.get(
+    "OAUTH_SESSION_URL", "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data"
+)
+CONNECT_TIMEOUT = float(os.environ.get("OAUTH_CONNECT_TIMEOUT", "3"))
+READ_TIMEOUT = float(os.environ.get("OAUTH_READ_TIMEOUT", "5"))
+MAX_CONNECTIONS = int(os.environ.get("OAUTH_MAX_CONNECTIONS", "50"))
+BREAKER_FAILURES = int(os.environ.get("OAUTH_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.environ.get("OAUTH_BREAKER_RESET_SECONDS", "30"))
+
+_client = None
+
+
+def _http():
+    global _client
+    if _client is None:
+        import httpx
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+        )
+    return _client
+
+
+class CircuitBreaker:
+    def __init__(self, failures: int = BREAKER_FAILURES, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.max_failures = failures
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial = asyncio.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def retry_after(self) -> int:
+        return max(1, int(self.reset_seconds - (time.monotonic() - self.opened_at)))
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def failure(self):
+        self.failures += 1
+        if self.failures >= self.max_failures or self.opened_at is not None:
+            self.opened_at = time.monotonic()
+
+
+breaker = CircuitBreaker()
+
+
+async def _exchange(session_id: str) -> dict:
+    import httpx
+
+    try:
+        resp = await _http().get(OAUTH_SESSION_URL, headers={"X-Session-ID": session_id})
+    except httpx.TimeoutException:
+        breaker.failure()
+        raise HTTPException(status_code=504, detail="OAuth provider timed out")
+    except httpx.HTTPError as e:
+        breaker.failure()
+        raise HTTPException(status_code=502, detail=f"OAuth error: {e}")
+
+    if resp.status_code >= 500:
+        breaker.failure()
+        raise HTTPException(status_code=502, detail=f"OAuth provider error ({resp.status_code})")
+    # The provider answered: a rejected session id is the client's problem, not an outage
+    breaker.success()
+    if resp.status_code != 200:
+        raise HTTPException(status_code=401, detail="Invalid session_id")
+    try:
+        return resp.json()
+    except ValueError:
+        raise HTTPException(status_code=502, detail="OAuth provider returned invalid JSON")
+
+
+async def fetch_session_data(session_id: str) -> dict:
+    """Exchange an OAuth session_id for the user's profile and session token"""
+    state = breaker.state
+    if state == "open":
+        raise HTTPException(status_code=503, detail="OAuth provider unavailable, try again later",
+                            headers={"Retry-After": str(breaker.retry_after())})
+    if state == "half-open":
+        # Only one trial request while the provider is suspect
+        if breaker._trial.locked():
+            raise HTTPException(status_code=503, detail="OAuth provider unavailable, try again later",
+                                headers={"Retry-After": "1"})
+        async with breaker._trial:
+            return await _exchange(session_id)
+    return await _exchange(session_id)
+
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
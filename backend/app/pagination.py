@@ -0,0 +1,54 @@
+"""
+DragonFit - Keyset (cursor) pagination helpers
+
+A cursor is the sort-key values of the last item of a page, encoded as
+url-safe base64 JSON. The next page is everything strictly after that key
+in the sort order, so pages stay stable while new documents are inserted.
+"""
+import base64
+import json
+from typing import List, Tuple
+
+from fastapi import HTTPException
+
+from .database import to_list
+
+MAX_PAGE_SIZE = 200
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(doc: dict, sort: List[Tuple[str, int]]) -> str:
+    values = [doc.get(field) for field, _ in sort]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: List[Tuple[str, int]]) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != len(sort):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def keyset_filter(sort: List[Tuple[str, int]], values: list) -> dict:
+    """Filter for documents after `values` in `sort` order"""
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        clause = {f: v for (f, _), v in zip(sort[:i], values[:i])}
+        clause[field] = {"$lt" if direction < 0 else "$gt": values[i]}
+        clauses.append(clause)
+    return {"$or": clauses}
+
+
+async def fetch_page(cursor_obj, sort: List[Tuple[str, int]], limit, response) -> list:
+    """Run a sorted find cursor, returning one page and setting the next-cursor header"""
+    if limit:
+        cursor_obj = cursor_obj.limit(limit + 1)
+    docs = await to_list(cursor_obj)
+    if limit and len(docs) > limit:
+        docs = docs[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(docs[-1], sort)
+    return docs
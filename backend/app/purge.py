@@ -0,0 +1,171 @@
+"""
+DragonFit - Background purge of deleted workouts
+
+DELETE /api/workouts/{id} removes the workout document, its sync tombstone
+and personal records right away, and queues a purge job for the sessions:
+years of history would otherwise be one long request and one large write
+burst. The worker deletes them in batches of PURGE_BATCH_SIZE with a pause
+between batches. From the start they are hidden from session and progress
+reads (see hide_purging) and left out of the stats rollup, which also
+lists the workouts being purged, so reads of a user with none pending add
+no query.
+
+    workout_purges: {"purge_id", "user_id", "workout_id", "status": "pending" | "done",
+                     "total", "deleted", "attempts", "lease_until",
+                     "created_at", "updated_at", "finished_at"}
+
+Each batch leaves sync tombstones, deletes the sessions and takes them out
+of the session buckets. A running job keeps renewing its lease; a job whose lease
+ran out (worker restarted) is claimed again on startup and carries on with
+whatever sessions are left.
+"""
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Optional
+
+from pymongo import ReturnDocument
+
+from . import export_jobs, session_store, stats, sync
+from .database import db, to_list
+
+logger = logging.getLogger("dragonfit.purge")
+
+PURGE_BATCH_SIZE = int(os.environ.get("PURGE_BATCH_SIZE", "500"))
+PURGE_BATCH_PAUSE = float(os.environ.get("PURGE_BATCH_PAUSE_SECONDS", "0.2"))
+PURGE_LEASE = timedelta(seconds=int(os.environ.get("PURGE_LEASE_SECONDS", "120")))
+
+PURGE_PROJECTION = {"_id": 0, "purge_id": 1, "workout_id": 1, "status": 1, "total": 1, "deleted": 1,
+                    "created_at": 1, "updated_at": 1, "finished_at": 1}
+PURGE_SESSION_PROJECTION = {"_id": 0, "session_id": 1, "date": 1, "exercises": 1}
+
+_tasks = set()
+_resumer: Optional[asyncio.Task] = None
+
+
+def _spawn(coro):
+    task = asyncio.create_task(coro)
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+async def purging_workouts(user_id: str) -> list:
+    return await stats.purging_workouts(user_id)
+
+
+async def hide_purging(user_id: str, query: dict) -> dict:
+    """`query` on training_sessions, minus sessions of workouts still being purged"""
+    hidden = await purging_workouts(user_id)
+    if not hidden:
+        return query
+    workout_id = query.get("workout_id")
+    if workout_id is None:
+        return dict(query, workout_id={"$nin": hidden})
+    if workout_id in hidden:
+        return dict(query, workout_id={"$in": []})
+    return query
+
+
+async def start(user_id: str, workout_id: str) -> dict:
+    """Queue the purge of a deleted workout's sessions and start working on it"""
+    now = datetime.now(timezone.utc)
+    job = {
+        "purge_id": f"purge_{uuid.uuid4().hex[:12]}",
+        "user_id": user_id,
+        "workout_id": workout_id,
+        "status": "pending",
+        "total": await db.training_sessions.count_documents({"user_id": user_id, "workout_id": workout_id}),
+        "deleted": 0,
+        "attempts": 0,
+        "lease_until": now,
+        "created_at": now,
+        "updated_at": now
+    }
+    await db.workout_purges.insert_one(job)
+    await stats.on_purge_started(user_id, workout_id)
+    _spawn(_work(job["purge_id"]))
+    return {k: v for k, v in job.items() if PURGE_PROJECTION.get(k)}
+
+
+async def get_purge(user_id: str, workout_id: str) -> Optional[dict]:
+    return await db.workout_purges.find_one({"user_id": user_id, "workout_id": workout_id}, PURGE_PROJECTION,
+                                            sort=[("created_at", -1)])
+
+
+async def _claim(purge_id: Optional[str] = None) -> Optional[dict]:
+    now = datetime.now(timezone.utc)
+    query = {"status": "pending", "lease_until": {"$lte": now}}
+    if purge_id:
+        query["purge_id"] = purge_id
+    return await db.workout_purges.find_one_and_update(
+        query,
+        {"$set": {"lease_until": now + PURGE_LEASE, "updated_at": now}, "$inc": {"attempts": 1}},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def _purge(job: dict):
+    user_id, workout_id = job["user_id"], job["workout_id"]
+    query = {"user_id": user_id, "workout_id": workout_id}
+    while True:
+        batch = await to_list(db.training_sessions.find(query, PURGE_SESSION_PROJECTION).limit(PURGE_BATCH_SIZE))
+        if not batch:
+            break
+        session_ids = [s["session_id"] for s in batch]
+        # Tombstones first: a duplicate is harmless, a missing one leaves the session on clients
+        await sync.record_deletes(user_id, "sessions", session_ids)
+        result = await db.training_sessions.delete_many({"user_id": user_id, "session_id": {"$in": session_ids}})
+        await session_store.on_sessions_deleted(user_id, batch)
+        now = datetime.now(timezone.utc)
+        await db.workout_purges.update_one(
+            {"purge_id": job["purge_id"]},
+            {"$inc": {"deleted": result.deleted_count}, "$set": {"lease_until": now + PURGE_LEASE, "updated_at": now}}
+        )
+        await asyncio.sleep(PURGE_BATCH_PAUSE)
+
+    await export_jobs.delete_artifacts(workout_id)
+    now = datetime.now(timezone.utc)
+    await db.workout_purges.update_one(
+        {"purge_id": job["purge_id"]},
+        {"$set": {"status": "done", "updated_at": now, "finished_at": now}}
+    )
+    if job["attempts"] > 1:
+        # An interrupted run may have deleted a batch without taking it out of the buckets
+        if session_store.LAYOUT == "buckets":
+            await session_store.rebuild_user_buckets(user_id)
+        await stats.rebuild_user_stats(user_id)
+    else:
+        await stats.on_purge_finished(user_id, workout_id)
+
+
+async def _work(purge_id: Optional[str] = None):
+    """Run one job, or with no id every job whose lease has run out"""
+    while True:
+        job = await _claim(purge_id)
+        if job is None:
+            return
+        try:
+            await _purge(job)
+        except Exception:
+            # Left pending: retried once its lease runs out
+            logger.exception("Workout purge %s failed", job["purge_id"])
+            resume()
+            return
+        if purge_id:
+            return
+
+
+async def _resume():
+    # Jobs still leased by a process that just died become claimable when the lease runs out
+    while await db.workout_purges.find_one({"status": "pending"}, {"_id": 1}):
+        await _work()
+        await asyncio.sleep(PURGE_LEASE.total_seconds())
+
+
+def resume():
+    """Carry on with interrupted or failed purges (call on startup)"""
+    global _resumer
+    if _resumer is None or _resumer.done():
+        _resumer = asyncio.create_task(_resume())
@@ -0,0 +1,223 @@
+"""
+DragonFit - Personal records and estimated 1RM
+
+`personal_records` holds one document per user and exercise, kept up to
+date on every session write so /api/records never scans history. A record
+belongs to the exercise, not to a workout: the same catalogue exercise in two
+routines has one record. `exercise_key` is the catalogue exercise id, or
+"<workout_id>:<day_index>_<exercise_index>" for entries logged before ids
+existed (positions only mean something within their workout).
+`workout_ids` lists the workouts the exercise was logged in, and each record
+names the workout of its set:
+
+    {
+        "user_id": "user_...", "exercise_key": "ex_...", "exercise_name": "Press Banca",
+        "workout_ids": ["workout_..."],
+        "top_weight":      {"value": 100.0, "weight": 100.0, "reps": 3, "date", "session_id", "workout_id"},
+        "best_set_volume": {"value": 800.0, "weight": 80.0, "reps": 10, "date", "session_id", "workout_id"},
+        "e1rm":            {"value": 106.7, "brzycki": 105.9, "weight": 100.0, "reps": 2, "date", "session_id",
+                            "workout_id"}
+    }
+
+New sessions only ever raise a record, so inserts are a conditional
+pipeline update per exercise. Deleting the session that holds a record
+recomputes that exercise alone, and so does deleting the workout of the
+session that holds it. Rebuild from scratch with:
+
+    python -m app.records --rebuild [--user USER_ID]
+"""
+import argparse
+import asyncio
+from typing import Optional
+
+from pymongo import UpdateOne
+
+from . import stats
+from .catalogue import names
+from .database import db, to_list
+from .sets import numeric
+
+METRICS = ("top_weight", "best_set_volume", "e1rm")
+RECORD_PROJECTION = {"_id": 0, "user_id": 0}
+RECORD_SESSION_PROJECTION = {"_id": 0, "session_id": 1, "workout_id": 1, "day_index": 1, "date": 1, "exercises": 1}
+
+
+def epley(weight: float, reps: int) -> float:
+    return weight if reps == 1 else weight * (1 + reps / 30)
+
+
+def brzycki(weight: float, reps: int) -> Optional[float]:
+    """Undefined from 37 reps on"""
+    return weight * 36 / (37 - reps) if reps < 37 else None
+
+
+def _set_record(value: float, weight: float, reps: int, session: dict) -> dict:
+    return {"value": round(value, 2), "weight": weight, "reps": reps,
+            "date": session.get("date"), "session_id": session.get("session_id"),
+            "workout_id": session.get("workout_id")}
+
+
+def session_records(session: dict) -> dict:
+    """Best set of each metric per exercise_key in one session"""
+    result = {}
+    for entry in session.get("exercises", []):
+        values = numeric(entry)
+        best = {}
+        for weight, reps in zip(values["weight_values"], values["rep_values"]):
+            if weight <= 0 or reps <= 0:
+                continue
+            candidates = {
+                "top_weight": _set_record(weight, weight, reps, session),
+                "best_set_volume": _set_record(weight * reps, weight, reps, session),
+                "e1rm": _set_record(epley(weight, reps), weight, reps, session),
+            }
+            e1rm_brzycki = brzycki(weight, reps)
+            candidates["e1rm"]["brzycki"] = round(e1rm_brzycki, 2) if e1rm_brzycki is not None else None
+            for metric, record in candidates.items():
+                if metric not in best or record["value"] > best[metric]["value"]:
+                    best[metric] = record
+        if best:
+            key = entry.get("exercise_id") or f"{session['workout_id']}:{session['day_index']}_{entry['exercise_index']}"
+            best["exercise_name"] = entry.get("exercise_name", "")
+            result[key] = best
+    return result
+
+
+def _raise_record(metric: str, record: dict) -> dict:
+    # Keep the stored record unless the new one beats it
+    return {"$cond": [
+        {"$gt": [record["value"], {"$ifNull": [f"${metric}.value", -1]}]},
+        {"$literal": record},
+        f"${metric}"
+    ]}
+
+
+async def on_sessions_created(user_id: str, sessions: list):
+    ops = []
+    for session in sessions:
+        for key, best in session_records(session).items():
+            update = {metric: _raise_record(metric, best[metric]) for metric in METRICS}
+            update["exercise_name"] = {"$literal": best["exercise_name"]}
+            update["workout_ids"] = {"$setUnion": [{"$ifNull": ["$workout_ids", []]},
+                                                   {"$literal": [session["workout_id"]]}]}
+            ops.append(UpdateOne(
+                {"user_id": user_id, "exercise_key": key},
+                [{"$set": update}],
+                upsert=True
+            ))
+    if ops:
+        await db.personal_records.bulk_write(ops, ordered=True)
+
+
+async def on_sessions_deleted(user_id: str, sessions: list):
+    """Recompute only the exercises whose record came from a deleted session"""
+    for session in sessions:
+        keys = list(session_records(session))
+        if not keys:
+            continue
+        held = await to_list(db.personal_records.find(
+            {"user_id": user_id, "exercise_key": {"$in": keys},
+             "$or": [{f"{metric}.session_id": session["session_id"]} for metric in METRICS]},
+            {"_id": 0, "exercise_key": 1}
+        ))
+        held = [r["exercise_key"] for r in held]
+        # The workout stays listed on an exercise while other sessions of it log that exercise
+        ids = [k for k in keys if k.startswith("ex_") and k not in held]
+        logged = set(await db.training_sessions.distinct("exercises.exercise_id", {
+            "user_id": user_id, "workout_id": session["workout_id"], "exercises.exercise_id": {"$in": ids}
+        })) if ids else set()
+        gone = [k for k in ids if k not in logged]
+        if gone:
+            await db.personal_records.update_many({"user_id": user_id, "exercise_key": {"$in": gone}},
+                                                  {"$pull": {"workout_ids": session["workout_id"]}})
+        if held:
+            await rebuild_user_records(user_id, held)
+
+
+async def on_workout_deleted(user_id: str, workout_id: str):
+    """Drop a deleted workout's sessions from the records (call after purge.start)"""
+    listed = await to_list(db.personal_records.find(
+        {"user_id": user_id, "workout_ids": workout_id},
+        {"_id": 0, "exercise_key": 1, **{f"{metric}.workout_id": 1 for metric in METRICS}}
+    ))
+    held = [r["exercise_key"] for r in listed
+            if any(r.get(metric, {}).get("workout_id") == workout_id for metric in METRICS)]
+    await db.personal_records.update_many(
+        {"user_id": user_id, "workout_ids": workout_id, "exercise_key": {"$nin": held}},
+        {"$pull": {"workout_ids": workout_id}}
+    )
+    if held:
+        await rebuild_user_records(user_id, held)
+
+
+async def rebuild_user_records(user_id: str, exercise_keys: Optional[list] = None) -> int:
+    """Recompute records from training_sessions (optionally some exercises only).
+
+    Sessions of workouts still being purged do not count.
+    """
+    query = {"user_id": user_id}
+    purging = await stats.purging_workouts(user_id)
+    if purging:
+        query["workout_id"] = {"$nin": purging}
+    if exercise_keys:
+        scopes = []
+        ids = [k for k in exercise_keys if k.startswith("ex_")]
+        if ids:
+            scopes.append({"exercises.exercise_id": {"$in": ids}})
+        for key in exercise_keys:
+            if not key.startswith("ex_"):
+                workout_id, _, slot = key.rpartition(":")
+                scopes.append({"workout_id": workout_id, "day_index": int(slot.split("_")[0])})
+        query["$or"] = scopes
+
+    best = {}
+    async for session in db.training_sessions.find(query, RECORD_SESSION_PROJECTION):
+        for key, records in session_records(session).items():
+            if exercise_keys and key not in exercise_keys:
+                continue
+            current = best.setdefault(key, {"exercise_name": records["exercise_name"], "workout_ids": set()})
+            current["workout_ids"].add(session["workout_id"])
+            for metric in METRICS:
+                if metric not in current or records[metric]["value"] > current[metric]["value"]:
+                    current[metric] = records[metric]
+
+    scope = {"user_id": user_id}
+    if exercise_keys:
+        scope["exercise_key"] = {"$in": list(exercise_keys)}
+    await db.personal_records.delete_many(scope)
+    if best:
+        await db.personal_records.insert_many([
+            {"user_id": user_id, "exercise_key": key, **records, "workout_ids": sorted(records["workout_ids"])}
+            for key, records in best.items()
+        ])
+    return len(best)
+
+
+async def get_records(user_id: str, workout_id: Optional[str] = None) -> list:
+    query = {"user_id": user_id}
+    if workout_id:
+        query["workout_ids"] = workout_id
+    result = await to_list(db.personal_records.find(query, RECORD_PROJECTION).sort("exercise_key", 1))
+    current = await names(user_id, (r["exercise_key"] for r in result if r["exercise_key"].startswith("ex_")))
+    for record in result:
+        record["exercise_name"] = current.get(record["exercise_key"], record.get("exercise_name", ""))
+    return result
+
+
+async def rebuild_all(user_id: Optional[str] = None) -> int:
+    user_ids = [user_id] if user_id else await db.users.distinct("user_id")
+    for uid in user_ids:
+        await rebuild_user_records(uid)
+    return len(user_ids)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="DragonFit personal records")
+    parser.add_argument("--rebuild", action="store_true", help="recompute records from training_sessions")
+    parser.add_argument("--user", help="only rebuild this user_id")
+    args = parser.parse_args()
+    if args.rebuild:
+        count = asyncio.run(rebuild_all(args.user))
+        print(f"Rebuilt personal records for {count} user(s)")
+    else:
+        parser.print_help()
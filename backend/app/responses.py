@@ -0,0 +1,40 @@
+"""
+DragonFit - Fast JSON responses (orjson)
+"""
+from typing import Any, Optional
+
+import orjson
+from bson import ObjectId
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+
+
+def _default(obj: Any):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(JSONResponse):
+    """App-wide default response class: orjson instead of json.dumps"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def json_response(content: Any, response: Optional[Response] = None) -> FastJSONResponse:
+    """Serialize Mongo documents straight to JSON, skipping FastAPI's jsonable_encoder.
+
+    Headers already set on the endpoint's injected `response` (ETag, cursors)
+    are carried over, since FastAPI does not merge them into returned Responses.
+    """
+    result = FastJSONResponse(content)
+    if response is not None:
+        result.raw_headers.extend(response.raw_headers)
+    return result
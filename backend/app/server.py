@@ -4,24 +4,42 @@ DragonFit API - Gym Training Tracker
 import os
 import uuid
 from datetime import datetime, timezone, timedelta
-from typing import Optional, List
-from fastapi import FastAPI, HTTPException, Depends, Request, Response
+from typing import Optional, List, Literal, Dict, Any, Union
+from fastapi import FastAPI, HTTPException, Depends, Request, Response, Query, Header, Path
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from pymongo import MongoClient
+from pydantic import BaseModel, Field, ValidationError
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-import httpx
-from io import BytesIO
-from fastapi.responses import StreamingResponse
-from openpyxl import Workbook
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from bson import ObjectId
+from .database import db, to_list, connect as connect_db, close as close_db
+from . import stats
+from . import sets
+from . import importer
+from . import sync
+from . import records
+from . import catalogue
+from . import purge
+from . import workout_edits
+from . import session_store
+from .downsample import downsample
+from .indexes import ensure_indexes, format_report
+from .auth_cache import principal_cache
+from . import hashing
+from . import oauth
+from .exports import MEDIA_TYPES
+from . import export_jobs
+from .conditional import (
+    make_etag, etag_matches, not_modified, set_etag,
+    entity_etag, if_match_filter, find_one_conditional
+)
+from .responses import FastJSONResponse, json_response
+from .compression import CompressionMiddleware
+from . import metrics
+from .pagination import MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, decode_cursor, keyset_filter, fetch_page
 
-app = FastAPI(title="DragonFit API")
+app = FastAPI(title="DragonFit API", default_response_class=FastJSONResponse)
 
 origins = [
     "https://dragon-fit-frontend.vercel.app",
@@ -36,22 +54,33 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, metrics.REQUEST_ID_HEADER],
 )
-
-# MongoDB
-MONGO_URL = os.environ['MONGO_URL']
-# DB_NAME = os.environ.get("DB_NAME", "dragonfit")
-client = MongoClient(MONGO_URL)
-db = client[os.environ['DB_NAME']]
+# gzip/brotli for large JSON payloads (progress, session lists) on mobile links
+app.add_middleware(CompressionMiddleware)
+# Outermost: latency per route and request ids (see metrics.py)
+app.add_middleware(metrics.MetricsMiddleware)
+
+# MongoDB (async access layer, see database.py)
+@app.on_event("startup")
+async def startup_indexes():
+    connect_db()
+    if os.environ.get("MONGO_ENSURE_INDEXES", "1") != "0":
+        print("DragonFit index report:\n" + format_report(await ensure_indexes()), flush=True)
+    purge.resume()
+
+@app.on_event("shutdown")
+async def shutdown():
+    close_db()
+    hashing.shutdown()
+    export_jobs.shutdown()
+    await oauth.close()
 
 # JWT Config
 JWT_SECRET = os.environ.get("JWT_SECRET", "dragonfit_secret_key")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_DAYS = 7
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 # --- Pydantic Models ---
 
 class UserRegister(BaseModel):
@@ -71,6 +100,7 @@ class User(BaseModel):
 
 class ExerciseBase(BaseModel):
     name: str
+    exercise_id: Optional[str] = None  # catalogue id; assigned by the server when missing
     sets: str = ""  # e.g. "3x10-12"
     notes: str = ""
 
@@ -94,8 +124,24 @@ class WorkoutUpdate(BaseModel):
     description: Optional[str] = None
     days: Optional[List[TrainingDayBase]] = None
 
+class DayUpdate(BaseModel):
+    day_number: Optional[int] = None
+    name: Optional[str] = None
+
+class ExerciseUpdate(BaseModel):
+    name: Optional[str] = None
+    sets: Optional[str] = None
+    notes: Optional[str] = None
+
+class DayOrder(BaseModel):
+    order: List[int]  # current day indexes, in their new order
+
+class ExerciseOrder(BaseModel):
+    order: Union[List[int], List[str]]  # the day's exercise positions (or ids), in their new order
+
 class SessionLogEntry(BaseModel):
     exercise_index: int
+    exercise_id: Optional[str] = None  # takes precedence over exercise_index when it is in the day (the index picks among repeats)
     weight: str
     reps: str
     notes: str = ""
@@ -108,11 +154,28 @@ class SessionCreate(BaseModel):
 
 class SessionExercise(BaseModel):
     exercise_index: int
+    exercise_id: Optional[str] = None
     exercise_name: str
     weight: str
     reps: str
     notes: str = ""
 
+class ExportJobCreate(BaseModel):
+    workout_id: str
+    format: Literal["xlsx", "pdf"]
+
+class SyncMutation(BaseModel):
+    client_id: str  # echoed back in the result; also names the temporary id of a create
+    collection: Literal["workouts", "sessions"]
+    op: Literal["create", "update", "delete"]
+    id: Optional[str] = None
+    data: Dict[str, Any] = {}
+    if_match: Optional[str] = None
+
+class SyncRequest(BaseModel):
+    tokens: Dict[Literal["workouts", "sessions"], Optional[str]] = {}
+    mutations: List[SyncMutation] = Field(default=[], max_length=500)
+
 class SessionResponse(BaseModel):
     session_id: str
     workout_name: Optional[str] = None
@@ -128,55 +191,65 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, JWT_SECRET, algorithm=ALGORITHM)
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+USER_PROJECTION = {"_id": 0, "user_id": 1, "email": 1, "name": 1, "picture": 1}
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
-
-async def get_current_user(request: Request) -> User:
+def get_request_token(request: Request) -> Optional[str]:
     # Try cookie first, then Authorization header
     token = request.cookies.get("session_token")
     if not token:
         auth_header = request.headers.get("Authorization")
         if auth_header and auth_header.startswith("Bearer "):
             token = auth_header.split(" ")[1]
-    
+    return token
+
+async def get_current_user(request: Request) -> User:
+    token = get_request_token(request)
     if not token:
         raise HTTPException(status_code=401, detail="Not authenticated")
-    
-    # Check if it's an OAuth session token
-    session = db.user_sessions.find_one({"session_token": token}, {"_id": 0})
-    if session:
-        expires_at = session.get("expires_at")
-        if isinstance(expires_at, str):
-            expires_at = datetime.fromisoformat(expires_at)
-        if expires_at.tzinfo is None:
-            expires_at = expires_at.replace(tzinfo=timezone.utc)
-        if expires_at < datetime.now(timezone.utc):
-            raise HTTPException(status_code=401, detail="Session expired")
-        user = db.users.find_one({"user_id": session["user_id"]}, {"_id": 0})
-        if user:
-            return User(**user)
-    
-    # Try JWT token
+
+    cached = principal_cache.get(token)
+    if cached is not None:
+        return cached
+
+    # Try JWT token (no database call needed to validate it)
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[ALGORITHM])
+    except JWTError:
+        payload = None
+    if payload is not None:
         user_id = payload.get("sub")
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid token")
-        user = db.users.find_one({"user_id": user_id}, {"_id": 0})
+        user = await db.users.find_one({"user_id": user_id}, USER_PROJECTION)
         if user is None:
             raise HTTPException(status_code=401, detail="User not found")
-        return User(**user)
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+        principal = User(**user)
+        principal_cache.set(token, principal, payload.get("exp"))
+        return principal
+
+    # Check if it's an OAuth session token (expired ones are purged by the
+    # expires_at TTL index; the filter covers the TTL monitor's ~60s lag)
+    session = await db.user_sessions.find_one(
+        {"session_token": token, "expires_at": {"$gt": datetime.now(timezone.utc)}},
+        {"_id": 0, "user_id": 1, "expires_at": 1}
+    )
+    if session:
+        user = await db.users.find_one({"user_id": session["user_id"]}, USER_PROJECTION)
+        if user:
+            principal = User(**user)
+            expires_at = session["expires_at"]
+            if expires_at.tzinfo is None:
+                expires_at = expires_at.replace(tzinfo=timezone.utc)
+            principal_cache.set(token, principal, expires_at.timestamp())
+            return principal
+
+    raise HTTPException(status_code=401, detail="Invalid token")
 
 # --- Auth Endpoints ---
 
 @app.post("/api/auth/register")
 async def register(user_data: UserRegister):
-    if db.users.find_one({"email": user_data.email}):
+    if await db.users.find_one({"email": user_data.email}):
         raise HTTPException(status_code=400, detail="Email already registered")
     
     user_id = f"user_{uuid.uuid4().hex[:12]}"
@@ -184,11 +257,11 @@ async def register(user_data: UserRegister):
         "user_id": user_id,
         "email": user_data.email,
         "name": user_data.name,
-        "password_hash": get_password_hash(user_data.password),
+        "password_hash": await hashing.hash_password(user_data.password),
         "picture": None,
         "created_at": datetime.now(timezone.utc)
     }
-    db.users.insert_one(user_doc)
+    await db.users.insert_one(user_doc)
     
     token = create_access_token({"sub": user_id})
     return {
@@ -198,9 +271,15 @@ async def register(user_data: UserRegister):
 
 @app.post("/api/auth/login")
 async def login(user_data: UserLogin, response: Response):
-    user = db.users.find_one({"email": user_data.email}, {"_id": 0})
-    if not user or not verify_password(user_data.password, user.get("password_hash", "")):
+    user = await db.users.find_one({"email": user_data.email}, {"_id": 0})
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    valid, new_hash = await hashing.verify_password(user_data.password, user.get("password_hash"))
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    if new_hash:
+        # Cost factor changed since this hash was stored
+        await db.users.update_one({"user_id": user["user_id"]}, {"$set": {"password_hash": new_hash}})
     
     token = create_access_token({"sub": user["user_id"]})
     response.set_cookie(
@@ -226,18 +305,8 @@ async def create_session(request: Request, response: Response):
     if not session_id:
         raise HTTPException(status_code=400, detail="session_id required")
     
-    # Exchange session_id for user data
-    async with httpx.AsyncClient() as client_http:
-        try:
-            resp = await client_http.get(
-                "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
-                headers={"X-Session-ID": session_id}
-            )
-            if resp.status_code != 200:
-                raise HTTPException(status_code=401, detail="Invalid session_id")
-            oauth_data = resp.json()
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"OAuth error: {str(e)}")
+    # Exchange session_id for user data (pooled client, timeouts, circuit breaker)
+    oauth_data = await oauth.fetch_session_data(session_id)
     
     email = oauth_data.get("email")
     name = oauth_data.get("name")
@@ -245,16 +314,16 @@ async def create_session(request: Request, response: Response):
     session_token = oauth_data.get("session_token")
     
     # Find or create user
-    existing_user = db.users.find_one({"email": email}, {"_id": 0})
+    existing_user = await db.users.find_one({"email": email}, {"_id": 0})
     if existing_user:
         user_id = existing_user["user_id"]
-        db.users.update_one(
+        await db.users.update_one(
             {"email": email},
             {"$set": {"name": name, "picture": picture}}
         )
     else:
         user_id = f"user_{uuid.uuid4().hex[:12]}"
-        db.users.insert_one({
+        await db.users.insert_one({
             "user_id": user_id,
             "email": email,
             "name": name,
@@ -263,9 +332,10 @@ async def create_session(request: Request, response: Response):
             "created_at": datetime.now(timezone.utc)
         })
     
-    # Store session
-    db.user_sessions.delete_many({"user_id": user_id})
-    db.user_sessions.insert_one({
+    # Store session (profile may have changed: drop cached principals)
+    principal_cache.invalidate_user(user_id)
+    await db.user_sessions.delete_many({"user_id": user_id})
+    await db.user_sessions.insert_one({
         "user_id": user_id,
         "session_token": session_token,
         "expires_at": datetime.now(timezone.utc) + timedelta(days=7),
@@ -294,373 +364,777 @@ async def get_me(user: User = Depends(get_current_user)):
 
 @app.post("/api/auth/logout")
 async def logout(request: Request, response: Response):
-    token = request.cookies.get("session_token")
+    token = get_request_token(request)
     if token:
-        db.user_sessions.delete_many({"session_token": token})
+        principal_cache.invalidate(token)
+        await db.user_sessions.delete_many({"session_token": token})
     response.delete_cookie("session_token", path="/")
     return {"message": "Logged out"}
 
 # --- Workout Endpoints ---
 
+# content_version only keys the export cache; it is not part of the API
+WORKOUT_PROJECTION = {"_id": 0, "content_version": 0}
+WORKOUT_SORT = [("created_at", 1), ("workout_id", 1)]
+WORKOUT_SUMMARY_PROJECTION = {
+    "_id": 0, "workout_id": 1, "user_id": 1, "name": 1, "description": 1, "created_at": 1,
+    "day_count": {"$size": {"$ifNull": ["$days", []]}}
+}
+
 @app.get("/api/workouts")
-async def get_workouts(user: User = Depends(get_current_user)):
-    workouts = list(db.workouts.find({"user_id": user.user_id}, {"_id": 0}))
-    return workouts
+async def get_workouts(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    view: Literal["full", "summary"] = "full",
+    user: User = Depends(get_current_user)
+):
+    """List workouts; pass `limit` to paginate (next page cursor in X-Next-Cursor)"""
+    query = {"user_id": user.user_id}
+    if cursor:
+        query.update(keyset_filter(WORKOUT_SORT, decode_cursor(cursor, WORKOUT_SORT)))
+    projection = WORKOUT_SUMMARY_PROJECTION if view == "summary" else WORKOUT_PROJECTION
+    workouts = await fetch_page(db.workouts.find(query, projection).sort(WORKOUT_SORT), WORKOUT_SORT, limit, response)
+    return json_response(workouts, response)
 
 @app.post("/api/workouts")
 async def create_workout(workout: WorkoutCreate, user: User = Depends(get_current_user)):
     workout_id = f"workout_{uuid.uuid4().hex[:12]}"
+    exercises = await catalogue.plan(user.user_id, [day.model_dump() for day in workout.days])
     workout_doc = {
         "workout_id": workout_id,
         "user_id": user.user_id,
         "name": workout.name,
         "description": workout.description,
-        "days": [day.model_dump() for day in workout.days],
+        "days": exercises.days,
+        "version": 1,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
-    db.workouts.insert_one(workout_doc)
+    async with sync.reserve(user.user_id) as sync_seq:
+        workout_doc["sync_seq"] = sync_seq
+        await db.workouts.insert_one(workout_doc)
+    await catalogue.apply(exercises, workout_id)
+    await stats.on_workout_created(user.user_id)
     workout_doc.pop("_id", None)
     return workout_doc
 
 @app.get("/api/workouts/{workout_id}")
-async def get_workout(workout_id: str, user: User = Depends(get_current_user)):
-    workout = db.workouts.find_one(
-        {"workout_id": workout_id, "user_id": user.user_id},
-        {"_id": 0}
+async def get_workout(workout_id: str, request: Request, response: Response, user: User = Depends(get_current_user)):
+    workout, etag = await find_one_conditional(
+        db.workouts, {"workout_id": workout_id, "user_id": user.user_id}, WORKOUT_PROJECTION,
+        "workout_id", request.headers.get("If-None-Match")
     )
-    if not workout:
+    if etag is None:
         raise HTTPException(status_code=404, detail="Workout not found")
+    if workout is None:
+        return not_modified(etag)
+    set_etag(response, etag)
     return workout
 
-@app.put("/api/workouts/{workout_id}")
-async def update_workout(workout_id: str, workout: WorkoutUpdate, user: User = Depends(get_current_user)):
-    existing = db.workouts.find_one({"workout_id": workout_id, "user_id": user.user_id})
-    if not existing:
-        raise HTTPException(status_code=404, detail="Workout not found")
+async def apply_workout_update(workout_id: str, workout: WorkoutUpdate, user_id: str, if_match: Optional[str]) -> dict:
+    query = {"workout_id": workout_id, "user_id": user_id}
+    precondition = if_match_filter(if_match, workout_id)
+    if precondition:
+        query.update(precondition)
     
     update_data = {}
+    exercises = None
     if workout.name is not None:
         update_data["name"] = workout.name
     if workout.description is not None:
         update_data["description"] = workout.description
     if workout.days is not None:
-        update_data["days"] = [day.model_dump() for day in workout.days]
+        exercises = await catalogue.plan(user_id, [day.model_dump() for day in workout.days], workout_id)
+        update_data["days"] = exercises.days
     
     if update_data:
-        db.workouts.update_one({"workout_id": workout_id}, {"$set": update_data})
+        async with sync.reserve(user_id) as sync_seq:
+            update_data["sync_seq"] = sync_seq
+            updated = await db.workouts.find_one_and_update(
+                query,
+                {"$set": update_data, "$inc": {"version": 1, "content_version": 1}},
+                projection=WORKOUT_PROJECTION,
+                return_document=ReturnDocument.AFTER
+            )
+    else:
+        updated = await db.workouts.find_one(query, WORKOUT_PROJECTION)
     
-    updated = db.workouts.find_one({"workout_id": workout_id}, {"_id": 0})
+    if not updated:
+        await raise_update_failed(workout_id, user_id, precondition)
+    if exercises:
+        await catalogue.apply(exercises, workout_id)
+    if update_data:
+        await stats.on_workout_updated(user_id)
     return updated
 
-@app.delete("/api/workouts/{workout_id}")
-async def delete_workout(workout_id: str, user: User = Depends(get_current_user)):
-    result = db.workouts.delete_one({"workout_id": workout_id, "user_id": user.user_id})
+async def raise_update_failed(workout_id: str, user_id: str, precondition: Optional[dict],
+                              missing: Optional[tuple] = None):
+    """Explain why a conditional workout update matched nothing (extra reads on failure only)"""
+    query = {"workout_id": workout_id, "user_id": user_id}
+    if not await db.workouts.find_one(query, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Workout not found")
+    if missing and (not precondition or await db.workouts.find_one(dict(query, **precondition), {"_id": 1})):
+        raise HTTPException(status_code=missing[0], detail=missing[1])
+    raise HTTPException(status_code=412, detail="Workout was modified, reload it and retry")
+
+async def apply_workout_edit(workout_id: str, edit: workout_edits.Edit, user_id: str,
+                             if_match: Optional[str], response: Response,
+                             exercises: Optional[catalogue.CatalogueChanges] = None) -> dict:
+    """Apply one granular plan edit in a single round trip; returns the updated workout.
+
+    `exercises` (from `catalogue.plan`) is written only once the edit has succeeded.
+    """
+    query = {"workout_id": workout_id, "user_id": user_id, **edit.filter}
+    precondition = if_match_filter(if_match, workout_id)
+    if precondition:
+        query.update(precondition)
+    options = {"array_filters": edit.array_filters} if edit.array_filters else {}
+    async with sync.reserve(user_id) as sync_seq:
+        updated = await db.workouts.find_one_and_update(
+            query,
+            workout_edits.with_version_bump(edit.update, sync_seq),
+            projection=WORKOUT_PROJECTION,
+            return_document=ReturnDocument.AFTER,
+            **options
+        )
+    if not updated:
+        await raise_update_failed(workout_id, user_id, precondition, edit.missing)
+    if exercises:
+        await catalogue.apply(exercises, workout_id)
+    await stats.on_workout_updated(user_id)
+    set_etag(response, entity_etag(workout_id, updated.get("version")))
+    return updated
+
+def changed_fields(update: BaseModel) -> dict:
+    fields = update.model_dump(exclude_none=True)
+    if not fields:
+        raise HTTPException(status_code=400, detail="No fields to update")
+    return fields
+
+@app.put("/api/workouts/{workout_id}")
+async def update_workout(
+    workout_id: str,
+    workout: WorkoutUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    user: User = Depends(get_current_user)
+):
+    """Update a workout; send If-Match with the ETag you read to avoid lost updates"""
+    updated = await apply_workout_update(workout_id, workout, user.user_id, if_match)
+    set_etag(response, entity_etag(workout_id, updated.get("version")))
+    return updated
+
+# Granular plan edits: one find_one_and_update each, If-Match supported like PUT
+
+# An exercise is addressed by its id when the day lists it once, else by position
+EXERCISE_REF_PATTERN = r"^(ex_[0-9a-f]+|\d+)$"
+
+def exercise_ref(exercise: str) -> workout_edits.ExerciseRef:
+    return int(exercise) if exercise.isdigit() else exercise
+
+@app.post("/api/workouts/{workout_id}/days")
+async def add_workout_day(
+    workout_id: str,
+    day: TrainingDayBase,
+    response: Response,
+    position: Optional[int] = Query(None, ge=0),
+    if_match: Optional[str] = Header(None),
+    user: User = Depends(get_current_user)
+):
+    """Add a day (at `position`, default last)"""
+    exercises = await catalogue.plan(user.user_id, [day.model_dump()])
+    edit = workout_edits.add_day(exercises.days[0], position)
+    return await apply_workout_edit(workout_id, edit, user.user_id, if_match, response, exercises)
+
+@app.put("/api/workouts/{workout_id}/days/order")
+async def reorder_workout_days(
+    workout_id: str,
+    body: DayOrder,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    user: User = Depends(get_current_user)
+):
+    if sorted(body.order) != list(range(len(body.order))):
+        raise HTTPException(status_code=400, detail="order must list each day index once")
+    return await apply_workout_edit(workout_id, workout_edits.reorder_days(body.order), user.user_id, if_match, response)
+
+@app.patch("/api/workouts/{workout_id}/days/{day_index}")
+async def update_workout_day(
+    workout_id: str,
+    day_index: int,
+    body: DayUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    user: User = Depends(get_current_user)
+):
+    edit = workout_edits.update_day(day_index, changed_fields(body))
+    return await apply_workout_edit(workout_id, edit, user.user_id, if_match, response)
+
+@app.delete("/api/workouts/{workout_id}/days/{day_index}")
+async def remove_workout_day(
+    workout_id: str,
+    day_index: int,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    user: User = Depends(get_current_user)
+):
+    """Remove a day; later days move up one position"""
+    return await apply_workout_edit(workout_id, workout_edits.remove_day(day_index), user.user_id, if_match, response)
+
+@app.post("/api/workouts/{workout_id}/days/{day_index}/exercises")
+async def add_workout_exercise(
+    workout_id: str,
+    day_index: int,
+    exercise: ExerciseBase,
+    response: Response,
+    position: Optional[int] = Query(None, ge=0),
+    if_match: Optional[str] = Header(None),
+    user: User = Depends(get_current_user)
+):
+    """Add an exercise to a day (at `position`, default last)"""
+    exercises = await catalogue.plan(user.user_id, [{"exercises": [exercise.model_dump()]}])
+    edit = workout_edits.add_exercise(day_index, exercises.days[0]["exercises"][0], position)
+    return await apply_workout_edit(workout_id, edit, user.user_id, if_match, response, exercises)
+
+@app.put("/api/workouts/{workout_id}/days/{day_index}/exercises/order")
+async def reorder_workout_exercises(
+    workout_id: str,
+    day_index: int,
+    body: ExerciseOrder,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    user: User = Depends(get_current_user)
+):
+    if len(set(body.order)) != len(body.order) or (
+            body.order and isinstance(body.order[0], int) and sorted(body.order) != list(range(len(body.order)))):
+        raise HTTPException(status_code=400, detail="order must list each exercise position (or id) once")
+    edit = workout_edits.reorder_exercises(day_index, body.order)
+    return await apply_workout_edit(workout_id, edit, user.user_id, if_match, response)
+
+@app.patch("/api/workouts/{workout_id}/days/{day_index}/exercises/{exercise}")
+async def update_workout_exercise(
+    workout_id: str,
+    day_index: int,
+    body: ExerciseUpdate,
+    response: Response,
+    exercise: str = Path(pattern=EXERCISE_REF_PATTERN),
+    if_match: Optional[str] = Header(None),
+    user: User = Depends(get_current_user)
+):
+    """Update an exercise; a new name renames or re-points its catalogue entry like PUT does"""
+    fields = changed_fields(body)
+    ref = exercise_ref(exercise)
+    exercises = current_id = None
+    if "name" in fields and isinstance(ref, int):
+        # By position: plan the whole day as it is now, so repeats of the id count as other uses
+        workout = await db.workouts.find_one({"workout_id": workout_id, "user_id": user.user_id},
+                                             {"_id": 0, "days": {"$slice": [max(day_index, 0), 1]}})
+        if not workout:
+            raise HTTPException(status_code=404, detail="Workout not found")
+        day = (workout.get("days") or [{}])[0] if day_index >= 0 else {}
+        if not 0 <= ref < len(day.get("exercises", [])):
+            raise HTTPException(status_code=404, detail="Exercise not found")
+        current_id = day["exercises"][ref].get("exercise_id")
+        day["exercises"][ref]["name"] = fields["name"]
+        exercises = await catalogue.plan(user.user_id, [day], workout_id, day_index)
+        fields["exercise_id"] = exercises.days[0]["exercises"][ref]["exercise_id"]
+    elif "name" in fields:
+        slot = {"exercise_id": ref, "name": fields["name"]}
+        exercises = await catalogue.plan(user.user_id, [{"exercises": [slot]}], workout_id, day_index)
+        fields["exercise_id"] = exercises.days[0]["exercises"][0]["exercise_id"]
+    edit = workout_edits.update_exercise(day_index, ref, fields, current_id)
+    return await apply_workout_edit(workout_id, edit, user.user_id, if_match, response, exercises)
+
+@app.delete("/api/workouts/{workout_id}/days/{day_index}/exercises/{exercise}")
+async def remove_workout_exercise(
+    workout_id: str,
+    day_index: int,
+    response: Response,
+    exercise: str = Path(pattern=EXERCISE_REF_PATTERN),
+    if_match: Optional[str] = Header(None),
+    user: User = Depends(get_current_user)
+):
+    edit = workout_edits.remove_exercise(day_index, exercise_ref(exercise))
+    return await apply_workout_edit(workout_id, edit, user.user_id, if_match, response)
+
+async def apply_workout_delete(workout_id: str, user_id: str) -> dict:
+    """Delete a workout document and queue the purge of its sessions; returns the purge job"""
+    result = await db.workouts.delete_one({"workout_id": workout_id, "user_id": user_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Workout not found")
-    # Also delete related sessions
-    db.training_sessions.delete_many({"workout_id": workout_id, "user_id": user.user_id})
-    return {"message": "Workout deleted"}
+    job = await purge.start(user_id, workout_id)
+    await stats.on_workout_deleted(user_id, [])
+    await records.on_workout_deleted(user_id, workout_id)
+    await sync.record_deletes(user_id, "workouts", [workout_id])
+    return job
+
+@app.delete("/api/workouts/{workout_id}")
+async def delete_workout(workout_id: str, response: Response, user: User = Depends(get_current_user)):
+    """Delete a workout now; its sessions are purged in the background (progress: GET .../deletion)"""
+    job = await apply_workout_delete(workout_id, user.user_id)
+    response.status_code = 202
+    return {"message": "Workout deleted", "deletion": job}
+
+@app.get("/api/workouts/{workout_id}/deletion")
+async def get_workout_deletion(workout_id: str, user: User = Depends(get_current_user)):
+    job = await purge.get_purge(user.user_id, workout_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="No deletion for this workout")
+    return job
 
 # --- Training Session Endpoints ---
 
+SESSION_SORT = [("date", -1), ("session_id", -1)]
+SESSION_SUMMARY_PROJECTION = {
+    "_id": 0, "session_id": 1, "user_id": 1, "workout_id": 1, "workout_name": 1,
+    "day_index": 1, "day_name": 1, "date": 1, "created_at": 1,
+    "exercise_count": {"$size": {"$ifNull": ["$exercises", []]}}
+}
+
 @app.get("/api/sessions")
-async def get_sessions(workout_id: Optional[str] = None, user: User = Depends(get_current_user)):
+async def get_sessions(
+    response: Response,
+    workout_id: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    view: Literal["full", "summary"] = "full",
+    user: User = Depends(get_current_user)
+):
+    """List sessions, newest first; pass `limit` to paginate (next page cursor in X-Next-Cursor)"""
     query = {"user_id": user.user_id}
     if workout_id:
         query["workout_id"] = workout_id
-    sessions = list(db.training_sessions.find(query, {"_id": 0}).sort("date", -1))
-    return sessions
-
-@app.post("/api/sessions")
-async def create_session(session: SessionCreate, user: User = Depends(get_current_user)):
-    # Verificar que el workout existe
-    workout = db.workouts.find_one({"workout_id": session.workout_id, "user_id": user.user_id})
-    if not workout:
-        raise HTTPException(status_code=404, detail="Workout not found")
-    
-    session_id = f"session_{uuid.uuid4().hex[:12]}"
+    query = await purge.hide_purging(user.user_id, query)
+    if cursor:
+        query.update(keyset_filter(SESSION_SORT, decode_cursor(cursor, SESSION_SORT)))
+    projection = SESSION_SUMMARY_PROJECTION if view == "summary" else {"_id": 0}
+    sessions = await fetch_page(db.training_sessions.find(query, projection).sort(SESSION_SORT), SESSION_SORT, limit, response)
+    return json_response(sessions, response)
+
+def build_session_doc(session: SessionCreate, workout: dict, user_id: str) -> dict:
+    days = workout.get("days", [])
+    day_exercises = days[session.day_index].get("exercises", []) if 0 <= session.day_index < len(days) else []
+    positions = {}
+    for i, ex in enumerate(day_exercises):
+        if ex.get("exercise_id"):
+            positions.setdefault(ex["exercise_id"], i)
 
     exercises_with_names = []
     for e in session.exercises:
-        # Obtener el nombre del ejercicio desde el workout
-        exercise_name = "Ejercicio"
-        if (
-            "days" in workout
-            and session.day_index < len(workout["days"])
-            and e.exercise_index < len(workout["days"][session.day_index]["exercises"])
-        ):
-            exercise_name = workout["days"][session.day_index]["exercises"][e.exercise_index]["name"]
+        exercise_index = e.exercise_index
+        exercise = day_exercises[exercise_index] if 0 <= exercise_index < len(day_exercises) else {}
+        if e.exercise_id and exercise.get("exercise_id") != e.exercise_id and e.exercise_id in positions:
+            # The plan was reordered since the client read it: follow the id
+            exercise_index = positions[e.exercise_id]
+            exercise = day_exercises[exercise_index]
         
         exercises_with_names.append({
-            "exercise_index": e.exercise_index,
-            "exercise_name": exercise_name,
+            "exercise_index": exercise_index,
+            "exercise_id": exercise.get("exercise_id"),
+            "exercise_name": exercise.get("name", "Ejercicio"),
             "weight": e.weight,
             "reps": e.reps,
-            "notes": e.notes
+            "notes": e.notes,
+            **sets.normalize(e.weight, e.reps)
         })
 
-    session_doc = {
-        "session_id": session_id,
-        "user_id": user.user_id,
+    return {
+        "session_id": f"session_{uuid.uuid4().hex[:12]}",
+        "user_id": user_id,
         "workout_id": session.workout_id,
         "workout_name": workout["name"],
         "day_index": session.day_index,
         "day_name": workout["days"][session.day_index]["name"] if session.day_index < len(workout["days"]) else "",
         "date": session.date or datetime.now(timezone.utc).strftime("%Y-%m-%d"),
         "exercises": exercises_with_names,
+        "version": 1,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
 
-    db.training_sessions.insert_one(session_doc)
+@app.post("/api/sessions")
+async def create_session(session: SessionCreate, user: User = Depends(get_current_user)):
+    # Verificar que el workout existe
+    workout = await db.workouts.find_one({"workout_id": session.workout_id, "user_id": user.user_id})
+    if not workout:
+        raise HTTPException(status_code=404, detail="Workout not found")
+    
+    session_doc = build_session_doc(session, workout, user.user_id)
+    async with sync.reserve(user.user_id) as sync_seq:
+        session_doc["sync_seq"] = sync_seq
+        await db.training_sessions.insert_one(session_doc)
+    await session_store.on_sessions_created(user.user_id, [session_doc])
+    await stats.on_sessions_created(user.user_id, [session_doc])
+    await records.on_sessions_created(user.user_id, [session_doc])
+    await export_jobs.bump_content_version(user.user_id, session.workout_id)
     session_doc.pop("_id", None)
     return session_doc
 
+def validation_message(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors())
+
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", "1000"))
+IMPORT_MAX_ERRORS = 100
+
+@app.post("/api/sessions/import")
+async def import_sessions(
+    request: Request,
+    workout_id: Optional[str] = None,
+    format: Optional[Literal["csv", "ndjson"]] = None,
+    user: User = Depends(get_current_user)
+):
+    """Bulk import sessions from a streamed CSV or NDJSON body (see importer.py)"""
+    if format is None:
+        format = "csv" if "csv" in request.headers.get("Content-Type", "") else "ndjson"
+    lines = importer.iter_lines(request.stream())
+    rows = importer.parse_csv(lines) if format == "csv" else importer.parse_ndjson(lines)
+
+    workouts = {}
+    touched = set()
+    result = {"imported": 0, "failed": 0, "errors": []}
+
+    def fail(line_no, error):
+        result["failed"] += 1
+        if len(result["errors"]) < IMPORT_MAX_ERRORS:
+            result["errors"].append({"line": line_no, "error": error})
+
+    async def flush(batch):
+        # Resolve every workout referenced by the batch in one query
+        missing = list({s.workout_id for _, s in batch} - workouts.keys())
+        if missing:
+            async for w in db.workouts.find({"workout_id": {"$in": missing}, "user_id": user.user_id}, {"_id": 0}):
+                workouts[w["workout_id"]] = w
+        docs, doc_lines = [], []
+        for line_no, session in batch:
+            workout = workouts.get(session.workout_id)
+            if not workout:
+                fail(line_no, "Workout not found")
+                continue
+            docs.append(build_session_doc(session, workout, user.user_id))
+            doc_lines.append(line_no)
+        if not docs:
+            return
+        inserted = []
+        async with sync.reserve(user.user_id, len(docs)) as last_seq:
+            for i, doc in enumerate(docs):
+                doc["sync_seq"] = last_seq - len(docs) + 1 + i
+            while docs:
+                try:
+                    await db.training_sessions.insert_many(docs, ordered=True)
+                    inserted, docs = inserted + docs, []
+                except BulkWriteError as e:
+                    # Ordered: everything before the first error is in, retry the rest
+                    first = e.details["writeErrors"][0]
+                    inserted += docs[:e.details["nInserted"]]
+                    fail(doc_lines[first["index"]], first.get("errmsg", "Write error"))
+                    docs = docs[first["index"] + 1:]
+                    doc_lines = doc_lines[first["index"] + 1:]
+        result["imported"] += len(inserted)
+        touched.update(d["workout_id"] for d in inserted)
+        await session_store.on_sessions_created(user.user_id, inserted)
+        await stats.on_sessions_created(user.user_id, inserted)
+        await records.on_sessions_created(user.user_id, inserted)
+
+    batch = []
+    async for line_no, payload in rows:
+        if isinstance(payload, Exception):
+            fail(line_no, str(payload))
+            continue
+        if workout_id and not payload.get("workout_id"):
+            payload["workout_id"] = workout_id
+        try:
+            batch.append((line_no, SessionCreate(**payload)))
+        except ValidationError as e:
+            fail(line_no, validation_message(e))
+            continue
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            await flush(batch)
+            batch = []
+    if batch:
+        await flush(batch)
+
+    for touched_workout_id in touched:
+        await export_jobs.bump_content_version(user.user_id, touched_workout_id)
+    return result
+
 
 @app.get("/api/sessions/{session_id}")
-async def get_session(session_id: str, user: User = Depends(get_current_user)):
-    session = db.training_sessions.find_one(
-        {"session_id": session_id, "user_id": user.user_id},
-        {"_id": 0}
+async def get_session(session_id: str, request: Request, response: Response, user: User = Depends(get_current_user)):
+    query = await purge.hide_purging(user.user_id, {"session_id": session_id, "user_id": user.user_id})
+    session, etag = await find_one_conditional(
+        db.training_sessions, query, {"_id": 0},
+        "session_id", request.headers.get("If-None-Match")
     )
-    if not session:
+    if etag is None:
         raise HTTPException(status_code=404, detail="Session not found")
+    if session is None:
+        return not_modified(etag)
+    set_etag(response, etag)
     return session
 
 @app.delete("/api/sessions/{session_id}")
 async def delete_session(session_id: str, user: User = Depends(get_current_user)):
-    result = db.training_sessions.delete_one({"session_id": session_id, "user_id": user.user_id})
-    if result.deleted_count == 0:
+    deleted = await db.training_sessions.find_one_and_delete(
+        await purge.hide_purging(user.user_id, {"session_id": session_id, "user_id": user.user_id}),
+        projection={"_id": 0, "session_id": 1, "workout_id": 1, "day_index": 1, "date": 1, "exercises": 1}
+    )
+    if not deleted:
         raise HTTPException(status_code=404, detail="Session not found")
+    await session_store.on_sessions_deleted(user.user_id, [deleted])
+    await stats.on_sessions_deleted(user.user_id, [deleted])
+    await records.on_sessions_deleted(user.user_id, [deleted])
+    await sync.record_deletes(user.user_id, "sessions", [session_id])
+    await export_jobs.bump_content_version(user.user_id, deleted["workout_id"])
     return {"message": "Session deleted"}
 
 # --- Progress/Stats Endpoints ---
 
+def progress_key(session: dict, entry: dict) -> str:
+    """Series key: the catalogue exercise id, or the day slot for entries logged before ids"""
+    return entry.get("exercise_id") or f"{session['day_index']}_{entry['exercise_index']}"
+
 @app.get("/api/progress")
-async def get_progress(user: User = Depends(get_current_user)):
-    """Get progress data for charts including exercise names"""
-    sessions = list(
-        db.training_sessions.find({"user_id": user.user_id}, {"_id": 0}).sort("date", 1)
+async def get_progress(
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    workout_id: Optional[str] = None,
+    exercise_key: Optional[str] = Query(None, pattern=r"^(\d+_\d+|ex_[0-9a-f]+)$"),
+    max_points: Optional[int] = Query(None, ge=3, le=1000),
+    method: Literal["lttb", "max"] = "lttb",
+    user: User = Depends(get_current_user)
+):
+    """Get progress data for charts including exercise names.
+
+    `from`/`to` (YYYY-MM-DD, inclusive), `workout_id` and `exercise_key`
+    (an exercise id, or "<day_index>_<exercise_index>") narrow the series;
+    `max_points` downsamples each series on the server.
+    """
+    sessions = await session_store.progress_sessions(
+        user.user_id, date_from, date_to, workout_id, exercise_key,
+        hidden=await purge.purging_workouts(user.user_id)
+    )
+
+    # Current exercise names in one catalogue lookup (renames apply to old sessions too)
+    names = await catalogue.names(
+        user.user_id, (ex.get("exercise_id") for session in sessions for ex in session.get("exercises", []))
     )
 
     progress_data = {}
 
     for session in sessions:
-        workout_id = session["workout_id"]
-
-        # Buscar workout para nombres de ejercicios
-        workout = db.workouts.find_one(
-            {"workout_id": workout_id, "user_id": user.user_id},
-            {"_id": 0}
-        )
-
-        if workout_id not in progress_data:
-            progress_data[workout_id] = {
-                "workout_name": session.get("workout_name", ""),
-                "sessions_count": 0,
-                "exercises": {}
-            }
-
-        progress_data[workout_id]["sessions_count"] += 1
+        workout_progress = progress_data.setdefault(session["workout_id"], {
+            "workout_name": session.get("workout_name", ""),
+            "sessions_count": 0,
+            "exercises": {}
+        })
+        workout_progress["sessions_count"] += 1
 
         for ex in session.get("exercises", []):
-            ex_idx = ex["exercise_index"]
-            day_idx = session["day_index"]
-
-            exercise_key = f"{day_idx}_{ex_idx}"
-
-
-            # Obtener nombre del ejercicio si existe
-            exercise_name = "Ejercicio"
-            if workout and "days" in workout:
-                if session["day_index"] < len(workout["days"]):
-                    day = workout["days"][session["day_index"]]
-                    if ex_idx < len(day.get("exercises", [])):
-                        exercise_name = day["exercises"][ex_idx]["name"]
-
-            if exercise_key not in progress_data[workout_id]["exercises"]:
-                progress_data[workout_id]["exercises"][exercise_key] = []
-
-
-            # Parse weight
-            weight_str = ex.get("weight", "0")
-            try:
-                weight = float(weight_str.replace("kg", "").replace(",", ".").split("x")[0].strip())
-            except:
-                weight = 0
-
-            progress_data[workout_id]["exercises"][exercise_key].append({
+            key = progress_key(session, ex)
+            if exercise_key and key != exercise_key and f"{session['day_index']}_{ex['exercise_index']}" != exercise_key:
+                continue
+            workout_progress["exercises"].setdefault(key, []).append({
                 "date": session["date"],
-                "weight": weight,
+                "weight": sets.top_weight(ex),
                 "reps": ex.get("reps", ""),
-                "exercise_name": exercise_name,
-                "exercise_id": exercise_key
+                "exercise_name": names.get(ex.get("exercise_id")) or ex.get("exercise_name", "Ejercicio"),
+                "exercise_id": key
             })
 
-    return progress_data
+    if max_points:
+        for workout_progress in progress_data.values():
+            for key, points in workout_progress["exercises"].items():
+                workout_progress["exercises"][key] = downsample(points, max_points, method)
+    return json_response(progress_data)
 
 @app.get("/api/stats")
 async def get_stats(user: User = Depends(get_current_user)):
-    """Get general statistics"""
-    total_workouts = db.workouts.count_documents({"user_id": user.user_id})
-    total_sessions = db.training_sessions.count_documents({"user_id": user.user_id})
-    
-    # Sessions this week
-    week_start = (datetime.now(timezone.utc) - timedelta(days=datetime.now(timezone.utc).weekday())).strftime("%Y-%m-%d")
-    sessions_this_week = db.training_sessions.count_documents({
-        "user_id": user.user_id,
-        "date": {"$gte": week_start}
-    })
+    """Get general statistics (from the user_stats rollup)"""
+    return await stats.get_user_stats(user.user_id)
+
+@app.get("/api/exercises")
+async def get_exercises(user: User = Depends(get_current_user)):
+    """The user's exercise catalogue (stable ids shared by workouts, sessions and analytics)"""
+    return json_response(await catalogue.list_exercises(user.user_id))
+
+@app.get("/api/records")
+async def get_records(workout_id: Optional[str] = None, user: User = Depends(get_current_user)):
+    """Personal records (top weight, best set volume, estimated 1RM) per exercise"""
+    return json_response(await records.get_records(user.user_id, workout_id))
+
+@app.get("/api/dashboard")
+async def get_dashboard(request: Request, response: Response, user: User = Depends(get_current_user)):
+    """Workouts and stats for the home screen in one call, with ETag/304 support"""
+    user_stats = await stats.load_user_stats(user.user_id)
+    etag = make_etag("dashboard", *stats.dashboard_etag_parts(user.user_id, user_stats))
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return not_modified(etag)
     
-    # Calculate total volume (simplified)
-    all_sessions = list(db.training_sessions.find({"user_id": user.user_id}, {"_id": 0}))
-    total_volume = 0
-    for session in all_sessions:
-        for ex in session.get("exercises", []):
-            try:
-                weight = float(ex.get("weight", "0").replace("kg", "").replace(",", ".").split("x")[0].strip())
-                reps_str = ex.get("reps", "0")
-                reps = sum([int(r.strip()) for r in reps_str.split(",") if r.strip().isdigit()])
-                total_volume += weight * reps
-            except:
-                pass
+    workouts = await to_list(db.workouts.find({"user_id": user.user_id}, WORKOUT_PROJECTION).sort(WORKOUT_SORT))
+    set_etag(response, etag)
+    return json_response({"workouts": workouts, "stats": stats.format_stats(user_stats)}, response)
+
+# --- Sync Endpoint ---
+
+async def apply_sync_mutation(mutation: SyncMutation, user: User, id_map: dict) -> dict:
+    """Run one queued offline write through the regular endpoint logic"""
+    # Later mutations may refer to a record created earlier in the batch by its temporary id
+    entity_id = id_map.get(mutation.id, mutation.id)
+    data = dict(mutation.data)
+    if data.get("workout_id") in id_map:
+        data["workout_id"] = id_map[data["workout_id"]]
+    result = {"client_id": mutation.client_id}
+    try:
+        if mutation.op != "create" and not entity_id:
+            raise HTTPException(status_code=400, detail="id is required")
+        doc = None
+        if mutation.collection == "workouts":
+            if mutation.op == "create":
+                doc = await create_workout(WorkoutCreate(**data), user)
+                entity_id = doc["workout_id"]
+            elif mutation.op == "update":
+                doc = await apply_workout_update(entity_id, WorkoutUpdate(**data), user.user_id, mutation.if_match)
+            else:
+                await apply_workout_delete(entity_id, user.user_id)
+        else:
+            if mutation.op == "create":
+                doc = await create_session(SessionCreate(**data), user)
+                entity_id = doc["session_id"]
+            elif mutation.op == "update":
+                raise HTTPException(status_code=400, detail="Sessions cannot be updated")
+            else:
+                await delete_session(entity_id, user)
+    except HTTPException as e:
+        return dict(result, status=e.status_code, error=e.detail)
+    except ValidationError as e:
+        return dict(result, status=422, error=validation_message(e))
+
+    if mutation.op == "create" and mutation.id:
+        id_map[mutation.id] = entity_id
+    result.update(status=200, id=entity_id)
+    if doc is not None:
+        result["version"] = doc.get("version")
+    return result
+
+@app.post("/api/sync")
+async def sync_changes(body: SyncRequest, user: User = Depends(get_current_user)):
+    """Apply queued offline mutations in order, then return what changed since each token.
+
+    Send `tokens` from the previous response (omit one for a full snapshot);
+    keep calling while any collection reports `has_more`.
+    """
+    id_map = {}
+    results = []
+    for mutation in body.mutations:
+        results.append(await apply_sync_mutation(mutation, user, id_map))
     
-    return {
-        "total_workouts": total_workouts,
-        "total_sessions": total_sessions,
-        "sessions_this_week": sessions_this_week,
-        "total_volume": round(total_volume, 1)
-    }
+    result = {}
+    for collection in sync.COLLECTIONS:
+        result[collection] = await sync.changes_since(user.user_id, collection, body.tokens.get(collection))
+    result["mutations"] = results
+    return json_response(result)
 
 # --- Export Endpoints ---
 
-@app.get("/api/export/excel/{workout_id}")
-async def export_excel(workout_id: str, user: User = Depends(get_current_user)):
-    workout = db.workouts.find_one({"workout_id": workout_id, "user_id": user.user_id}, {"_id": 0})
+async def get_export_workout(workout_id: str, user: User) -> dict:
+    workout = await db.workouts.find_one({"workout_id": workout_id, "user_id": user.user_id}, {"_id": 0})
     if not workout:
         raise HTTPException(status_code=404, detail="Workout not found")
-    
-    sessions = list(db.training_sessions.find(
-        {"workout_id": workout_id, "user_id": user.user_id},
-        {"_id": 0}
-    ).sort("date", 1))
-    
-    wb = Workbook()
-    ws = wb.active
-    ws.title = workout["name"][:31]  # Excel sheet name limit
-    
-    # Header
-    ws.append(["DragonFit - " + workout["name"]])
-    ws.append([])
-    
-    for day in workout.get("days", []):
-        ws.append([f"Día {day['day_number']}: {day['name']}"])
-        ws.append(["Ejercicio", "Series/Reps", "Notas"] + [s["date"] for s in sessions if s.get("day_index") == day["day_number"]-1])
-        
-        for i, exercise in enumerate(day.get("exercises", [])):
-            row = [exercise["name"], exercise.get("sets", ""), exercise.get("notes", "")]
-            # Add session data
-            for session in sessions:
-                if session.get("day_index") == day["day_number"]-1:
-                    ex_data = next((e for e in session.get("exercises", []) if e["exercise_index"] == i), None)
-                    if ex_data:
-                        row.append(f"{ex_data.get('weight', '')} - {ex_data.get('reps', '')}")
-                    else:
-                        row.append("")
-            ws.append(row)
-        ws.append([])
-    
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-    
+    return workout
+
+async def stream_artifact(file_id, workout_name: str, fmt: str) -> StreamingResponse:
+    length, chunks = await export_jobs.open_artifact(file_id)
     return StreamingResponse(
-        output,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment; filename=DragonFit_{workout['name']}.xlsx"}
+        chunks,
+        media_type=MEDIA_TYPES[fmt],
+        headers={
+            "Content-Disposition": f"attachment; filename=DragonFit_{workout_name}.{fmt}",
+            "Content-Length": str(length)
+        }
     )
 
+@app.get("/api/export/excel/{workout_id}")
+async def export_excel(workout_id: str, user: User = Depends(get_current_user)):
+    workout = await get_export_workout(workout_id, user)
+    file_id = await export_jobs.get_or_render(user.user_id, workout, "xlsx")
+    return await stream_artifact(file_id, workout["name"], "xlsx")
+
 @app.get("/api/export/pdf/{workout_id}")
 async def export_pdf(workout_id: str, user: User = Depends(get_current_user)):
-    workout = db.workouts.find_one({"workout_id": workout_id, "user_id": user.user_id}, {"_id": 0})
-    if not workout:
-        raise HTTPException(status_code=404, detail="Workout not found")
-    
-    sessions = list(db.training_sessions.find(
-        {"workout_id": workout_id, "user_id": user.user_id},
-        {"_id": 0}
-    ).sort("date", -1).limit(10))
-    
-    output = BytesIO()
-    doc = SimpleDocTemplate(output, pagesize=A4)
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        textColor=colors.HexColor('#22c55e')
-    )
-    
-    elements.append(Paragraph(f"DragonFit - {workout['name']}", title_style))
-    elements.append(Spacer(1, 20))
-    
-    for day in workout.get("days", []):
-        elements.append(Paragraph(f"Día {day['day_number']}: {day['name']}", styles['Heading2']))
-        
-        table_data = [["Ejercicio", "Series/Reps", "Notas"]]
-        for exercise in day.get("exercises", []):
-            table_data.append([exercise["name"], exercise.get("sets", ""), exercise.get("notes", "")])
-        
-        table = Table(table_data, colWidths=[200, 100, 150])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#22c55e')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#18181b')),
-            ('TEXTCOLOR', (0, 1), (-1, -1), colors.white),
-            ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#27272a'))
-        ]))
-        elements.append(table)
-        elements.append(Spacer(1, 20))
-    
-    doc.build(elements)
-    output.seek(0)
-    
-    return StreamingResponse(
-        output,
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename=DragonFit_{workout['name']}.pdf"}
-    )
+    workout = await get_export_workout(workout_id, user)
+    file_id = await export_jobs.get_or_render(user.user_id, workout, "pdf")
+    return await stream_artifact(file_id, workout["name"], "pdf")
+
+@app.post("/api/export/jobs")
+async def create_export_job(job: ExportJobCreate, user: User = Depends(get_current_user)):
+    """Queue an export; poll GET /api/export/jobs/{job_id} until status is done"""
+    workout = await get_export_workout(job.workout_id, user)
+    return await export_jobs.submit_job(user.user_id, workout, job.format)
+
+@app.get("/api/export/jobs/{job_id}")
+async def get_export_job(job_id: str, user: User = Depends(get_current_user)):
+    job = await export_jobs.get_job(user.user_id, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return job
+
+@app.get("/api/export/jobs/{job_id}/download")
+async def download_export_job(job_id: str, user: User = Depends(get_current_user)):
+    job = await export_jobs.get_job(user.user_id, job_id, include_file=True)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Export job is {job['status']}")
+    workout = await get_export_workout(job["workout_id"], user)
+    return await stream_artifact(job["file_id"], workout["name"], job["format"])
+
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def get_metrics(request: Request):
+    """Prometheus text format; set METRICS_TOKEN to require `Authorization: Bearer <token>`"""
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    cache = principal_cache.stats()
+    return PlainTextResponse(metrics.render({
+        "dragonfit_auth_cache_hits_total": ("counter", "Principal cache hits", cache["hits"]),
+        "dragonfit_auth_cache_misses_total": ("counter", "Principal cache misses", cache["misses"]),
+        "dragonfit_auth_cache_evictions_total": ("counter", "Principal cache evictions", cache["evictions"]),
+        "dragonfit_auth_cache_size": ("gauge", "Cached principals", cache["size"]),
+        "dragonfit_password_hash_in_flight": ("gauge", "bcrypt jobs queued or running", hashing.queue_depth()),
+        "dragonfit_oauth_breaker_open": ("gauge", "1 while the OAuth circuit breaker is open",
+                                         int(oauth.breaker.state != "closed")),
+    }), media_type="text/plain; version=0.0.4")
 
 @app.get("/api/health")
 async def health():
     return {"status": "healthy", "app": "DragonFit"}
 
 @app.get("/api/sessions/last/{workout_id}/{day_index}", response_model=SessionResponse)
-def get_last_session(
+async def get_last_session(
     workout_id: str,
     day_index: int,
+    request: Request,
+    response: Response,
     user: User = Depends(get_current_user)
 ):
     if not user or not user.user_id:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
     # Buscar la última sesión
-    last_session_cursor = db.training_sessions.find(
-        {
+    last_session, etag = await find_one_conditional(
+        db.training_sessions,
+        await purge.hide_purging(user.user_id, {
             "workout_id": workout_id,
             "day_index": day_index,
             "user_id": user.user_id
-        }
-    ).sort("created_at", -1).limit(1)
-
-    last_sessions = list(last_session_cursor)
+        }),
+        {"_id": 0},
+        "session_id",
+        request.headers.get("If-None-Match"),
+        sort=[("created_at", -1)]
+    )
 
-    if not last_sessions:
+    if etag is None:
         # Retornar vacío si no hay sesiones
         return SessionResponse(
             session_id="",
@@ -669,12 +1143,13 @@ def get_last_session(
             date="",
             exercises=[]
         )
+    if last_session is None:
+        return not_modified(etag)
 
-    last_session = last_sessions[0]
-    last_session["_id"] = str(last_session["_id"])
     for ex in last_session.get("exercises", []):
         ex["notes"] = ex.get("notes", "")
 
+    set_etag(response, etag)
     return SessionResponse(
         session_id=last_session["session_id"],
         workout_name=last_session.get("workout_name"),
@@ -682,44 +1157,3 @@ def get_last_session(
         date=last_session.get("date"),
         exercises=last_session.get("exercises", [])
     )
-
-
-
-@app.get("/api/sessions/{session_id}")
-async def get_session(session_id: str, user=Depends(get_current_user)):
-    # 1️⃣ Buscar sesión
-    session = db.training_sessions.find_one({
-        "session_id": session_id,
-        "user_id": user["user_id"]
-    })
-
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
-
-    # 2️⃣ Convertir ObjectId a string para que FastAPI pueda serializarlo
-    session["_id"] = str(session["_id"])
-
-    # 3️⃣ Buscar workout para obtener nombres de ejercicios
-    workout = db.workouts.find_one({
-        "workout_id": session["workout_id"],
-        "user_id": user["user_id"]
-    })
-
-    if workout and "days" in workout and session["day_index"] < len(workout["days"]):
-        day = workout["days"][session["day_index"]]
-        for exercise in session.get("exercises", []):
-            idx = exercise.get("exercise_index")
-            # Obtener el nombre del ejercicio si existe en el workout
-            if idx is not None and idx < len(day["exercises"]):
-                exercise["exercise_name"] = day["exercises"][idx]["name"]
-            else:
-                exercise["exercise_name"] = f"Ejercicio {idx if idx is not None else '?'}"
-
-            exercise["notes"] = exercise.get("notes", "")
-    else:
-        # Si no hay workout o day_index inválido, rellenar con nombre genérico
-        for exercise in session.get("exercises", []):
-            exercise["exercise_name"] = f"Ejercicio {exercise.get('exercise_index', '?')}"
-            exercise["notes"] = exercise.get("notes", "")
-
-    return session
@@ -0,0 +1,215 @@
+"""
+DragonFit - Session storage layout for analytics (documents or monthly buckets)
+
+`training_sessions` (one document per session) stays the record for the
+session endpoints, sync and exports. With SESSION_LAYOUT=buckets every write
+is also folded into one `session_buckets` document per user and month,
+holding the fields progress needs plus precomputed aggregates:
+
+    {
+        "user_id": "user_...", "month": "2024-05",
+        "sessions": [{"session_id", "workout_id", "workout_name", "day_index", "date",
+                      "exercises": [{"exercise_index", "exercise_id", "exercise_name",
+                                     "weight", "reps", "weight_values"}]}, ...],  # by date
+        "count": 18, "volume": 52310.0,
+        "weeks": {"2024-04-29": 3, ...},    # sessions per week (Monday), like user_stats
+        "first_date": "2024-05-02", "last_date": "2024-05-30"
+    }
+
+/api/progress then reads a few dozen buckets instead of thousands of
+sessions, and a stats rebuild sums bucket aggregates. Build or refresh the
+buckets (when enabling the layout, or after app.catalogue --migrate) with:
+
+    python -m app.session_store --migrate [--user USER_ID]
+"""
+import argparse
+import asyncio
+import os
+from typing import Optional
+
+from pymongo import UpdateOne
+
+from . import stats
+from .database import db, to_list
+
+LAYOUT = os.environ.get("SESSION_LAYOUT", "documents")
+
+PROGRESS_SESSION_PROJECTION = {
+    "_id": 0, "session_id": 1, "workout_id": 1, "workout_name": 1, "day_index": 1, "date": 1,
+    "exercises.exercise_index": 1, "exercises.exercise_id": 1, "exercises.exercise_name": 1,
+    "exercises.weight": 1, "exercises.reps": 1, "exercises.weight_values": 1
+}
+# Bucket aggregates need each entry's volume, which progress does not read
+BUCKET_SOURCE_PROJECTION = {"_id": 0, "session_id": 1, "workout_id": 1, "workout_name": 1, "day_index": 1,
+                            "date": 1, "exercises": 1}
+BUCKET_EXERCISE_FIELDS = ("exercise_index", "exercise_id", "exercise_name", "weight", "reps", "weight_values")
+
+
+def month_key(date_str: Optional[str]) -> str:
+    return (date_str or "")[:7]
+
+
+def bucket_entry(session: dict) -> dict:
+    """A session as stored inside its month bucket (what progress reads)"""
+    return {
+        "session_id": session["session_id"],
+        "workout_id": session["workout_id"],
+        "workout_name": session.get("workout_name", ""),
+        "day_index": session["day_index"],
+        "date": session["date"],
+        "exercises": [{k: ex[k] for k in BUCKET_EXERCISE_FIELDS if k in ex} for ex in session.get("exercises", [])]
+    }
+
+
+def _bucket_updates(user_id: str, sessions: list, sign: int) -> list:
+    months = {}
+    for session in sessions:
+        months.setdefault(month_key(session.get("date")), []).append(session)
+    ops = []
+    for month, group in months.items():
+        inc = {"count": sign * len(group), "volume": sign * sum(stats.session_volume(s) for s in group)}
+        for session in group:
+            key = f"weeks.{stats.week_key(session.get('date'))}"
+            inc[key] = inc.get(key, 0) + sign
+        query = {"user_id": user_id, "month": month}
+        if sign > 0:
+            dates = [s["date"] for s in group]
+            update = {
+                "$push": {"sessions": {"$each": [bucket_entry(s) for s in group], "$sort": {"date": 1}}},
+                "$inc": inc,
+                "$min": {"first_date": min(dates)},
+                "$max": {"last_date": max(dates)},
+            }
+            ops.append(UpdateOne(query, update, upsert=True))
+        else:
+            # first/last_date are left as outer bounds rather than recomputed
+            update = {"$pull": {"sessions": {"session_id": {"$in": [s["session_id"] for s in group]}}}, "$inc": inc}
+            ops.append(UpdateOne(query, update))
+    return ops
+
+
+async def on_sessions_created(user_id: str, sessions: list):
+    if LAYOUT == "buckets" and sessions:
+        await db.session_buckets.bulk_write(_bucket_updates(user_id, sessions, 1), ordered=False)
+
+
+async def on_sessions_deleted(user_id: str, sessions: list):
+    """`sessions` need session_id, date and exercises"""
+    if LAYOUT == "buckets" and sessions:
+        await db.session_buckets.bulk_write(_bucket_updates(user_id, sessions, -1), ordered=False)
+
+
+def _matches(session: dict, exercise_key: Optional[str]) -> bool:
+    if not exercise_key:
+        return True
+    if exercise_key.startswith("ex_"):
+        return any(ex.get("exercise_id") == exercise_key for ex in session.get("exercises", []))
+    day_index, exercise_index = (int(part) for part in exercise_key.split("_"))
+    return session["day_index"] == day_index and any(
+        ex.get("exercise_index") == exercise_index for ex in session.get("exercises", [])
+    )
+
+
+async def _document_sessions(user_id: str, date_from: Optional[str], date_to: Optional[str],
+                             workout_id: Optional[str], exercise_key: Optional[str], hidden: list) -> list:
+    query = {"user_id": user_id}
+    if workout_id:
+        query["workout_id"] = workout_id
+    elif hidden:
+        query["workout_id"] = {"$nin": hidden}
+    if date_from or date_to:
+        query["date"] = {}
+        if date_from:
+            query["date"]["$gte"] = date_from
+        if date_to:
+            query["date"]["$lte"] = date_to
+    if exercise_key and exercise_key.startswith("ex_"):
+        query["exercises.exercise_id"] = exercise_key
+    elif exercise_key:
+        key_day, key_exercise = (int(part) for part in exercise_key.split("_"))
+        query["day_index"] = key_day
+        query["exercises.exercise_index"] = key_exercise
+    return await to_list(db.training_sessions.find(query, PROGRESS_SESSION_PROJECTION).sort("date", 1))
+
+
+async def _bucket_sessions(user_id: str, date_from: Optional[str], date_to: Optional[str],
+                           workout_id: Optional[str], exercise_key: Optional[str], hidden: list) -> list:
+    query = {"user_id": user_id}
+    if date_from or date_to:
+        query["month"] = {}
+        if date_from:
+            query["month"]["$gte"] = month_key(date_from)
+        if date_to:
+            query["month"]["$lte"] = month_key(date_to)
+    result = []
+    async for bucket in db.session_buckets.find(query, {"_id": 0, "sessions": 1}).sort("month", 1):
+        for session in bucket["sessions"]:
+            if ((date_from and session["date"] < date_from) or (date_to and session["date"] > date_to)
+                    or (workout_id and session["workout_id"] != workout_id)
+                    or session["workout_id"] in hidden or not _matches(session, exercise_key)):
+                continue
+            result.append(session)
+    return result
+
+
+async def progress_sessions(user_id: str, date_from: Optional[str] = None, date_to: Optional[str] = None,
+                            workout_id: Optional[str] = None, exercise_key: Optional[str] = None,
+                            hidden: Optional[list] = None, layout: Optional[str] = None) -> list:
+    """Sessions for /api/progress, oldest first, minus workouts in `hidden` (being purged)"""
+    load = _bucket_sessions if (layout or LAYOUT) == "buckets" else _document_sessions
+    if workout_id and workout_id in (hidden or []):
+        return []
+    return await load(user_id, date_from, date_to, workout_id, exercise_key, hidden or [])
+
+
+async def bucket_rollup(user_id: str) -> dict:
+    """user_stats session totals from bucket aggregates (same shape as stats._sessions_inc)"""
+    rollup = {"total_sessions": 0, "total_volume": 0.0}
+    async for bucket in db.session_buckets.find({"user_id": user_id}, {"_id": 0, "count": 1, "volume": 1, "weeks": 1}):
+        rollup["total_sessions"] += bucket.get("count", 0)
+        rollup["total_volume"] += bucket.get("volume", 0.0)
+        for week, count in bucket.get("weeks", {}).items():
+            if not count:
+                continue
+            key = f"sessions_by_week.{week}"
+            rollup[key] = rollup.get(key, 0) + count
+    return rollup
+
+
+async def rebuild_user_buckets(user_id: str, batch_size: int = 1000) -> int:
+    """Recompute a user's buckets from training_sessions; returns the number of buckets"""
+    await db.session_buckets.delete_many({"user_id": user_id})
+    months = set()
+    batch = []
+    cursor = db.training_sessions.find({"user_id": user_id}, BUCKET_SOURCE_PROJECTION).sort("date", 1)
+    async for session in cursor:
+        batch.append(session)
+        if len(batch) >= batch_size:
+            months.update(month_key(s["date"]) for s in batch)
+            await db.session_buckets.bulk_write(_bucket_updates(user_id, batch, 1), ordered=False)
+            batch = []
+    if batch:
+        months.update(month_key(s["date"]) for s in batch)
+        await db.session_buckets.bulk_write(_bucket_updates(user_id, batch, 1), ordered=False)
+    return len(months)
+
+
+async def migrate(user_id: Optional[str] = None) -> int:
+    user_ids = [user_id] if user_id else await db.users.distinct("user_id")
+    for uid in user_ids:
+        await rebuild_user_buckets(uid)
+    return len(user_ids)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="DragonFit session storage layout")
+    parser.add_argument("--migrate", action="store_true", help="build monthly session buckets from training_sessions")
+    parser.add_argument("--user", help="only migrate this user_id")
+    args = parser.parse_args()
+    if args.migrate:
+        count = asyncio.run(migrate(args.user))
+        print(f"Built session buckets for {count} user(s)")
+        if LAYOUT != "buckets":
+            print("Set SESSION_LAYOUT=buckets on the API to read and maintain them")
+    else:
+        parser.print_help()
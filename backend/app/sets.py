@@ -0,0 +1,120 @@
+"""
+DragonFit - Normalized numeric set data
+
+Session entries keep the free text the user typed (`weight: "80kg"`,
+`reps: "10,10,8"`) and, since this module, a numeric form computed at
+write time so analytics never re-parse strings:
+
+    {
+        "weight": "80kg", "reps": "10,10,8",
+        "unit": "kg",
+        "weight_values": [80.0, 80.0, 80.0],   # per set, in `unit`
+        "rep_values": [10, 10, 8],             # per set
+        "volume": 2240.0                       # sum(weight x reps)
+    }
+
+Backfill existing sessions with:
+
+    python -m app.sets --migrate
+"""
+import argparse
+import asyncio
+import re
+from typing import List, Tuple
+
+from pymongo import UpdateOne
+
+from .database import db
+
+UNIT = "kg"
+LB_TO_KG = 0.45359237
+NUMERIC_FIELDS = ("unit", "weight_values", "rep_values", "volume")
+
+_SETS_X_REPS = re.compile(r"^(\d+)\s*[x×]\s*(\d+)$")
+
+
+def parse_weights(text: str) -> List[float]:
+    """Per-set weights in kg; "80kg", "82,5", "80/80/75", "180lb", "80x10" (legacy)"""
+    text = (text or "").lower()
+    factor = LB_TO_KG if "lb" in text else 1.0
+    values = []
+    for part in re.split(r"[/;]", text):
+        part = part.replace("kg", "").replace("lbs", "").replace("lb", "").replace(",", ".")
+        try:
+            values.append(round(float(part.split("x")[0].strip()) * factor, 2))
+        except ValueError:
+            pass
+    return values
+
+
+def parse_reps(text: str) -> List[int]:
+    """Per-set reps; "10,10,8", "10/10/8", "3x10" (3 sets of 10)"""
+    text = (text or "").strip().lower()
+    match = _SETS_X_REPS.match(text)
+    if match:
+        return [int(match.group(2))] * int(match.group(1))
+    return [int(r.strip()) for r in re.split(r"[,/;]", text) if r.strip().isdigit()]
+
+
+def normalize(weight: str, reps: str) -> dict:
+    weights = parse_weights(weight)
+    rep_values = parse_reps(reps)
+    # One weight for all sets (the usual case) or fewer weights than sets
+    if weights and len(weights) < len(rep_values):
+        weights = weights + [weights[-1]] * (len(rep_values) - len(weights))
+    return {
+        "unit": UNIT,
+        "weight_values": weights,
+        "rep_values": rep_values,
+        "volume": round(sum(w * r for w, r in zip(weights, rep_values)), 2),
+    }
+
+
+def numeric(entry: dict) -> dict:
+    """Numeric form of a session exercise entry (stored if present, else parsed)"""
+    if "weight_values" in entry:
+        return entry
+    return normalize(entry.get("weight", ""), entry.get("reps", ""))
+
+
+def top_weight(entry: dict) -> float:
+    values = numeric(entry)["weight_values"]
+    return values[0] if values else 0
+
+
+def exercise_volume(entry: dict) -> float:
+    return numeric(entry)["volume"]
+
+
+async def migrate(batch_size: int = 500) -> Tuple[int, int]:
+    """Add numeric fields to every session entry missing them; returns (scanned, updated)"""
+    scanned = updated = 0
+    ops = []
+    cursor = db.training_sessions.find(
+        {"exercises": {"$elemMatch": {"weight_values": {"$exists": False}}}},
+        {"_id": 1, "exercises": 1}
+    )
+    async for session in cursor:
+        scanned += 1
+        exercises = [dict(ex, **normalize(ex.get("weight", ""), ex.get("reps", "")))
+                     for ex in session.get("exercises", [])]
+        ops.append(UpdateOne({"_id": session["_id"]}, {"$set": {"exercises": exercises}}))
+        if len(ops) >= batch_size:
+            updated += (await db.training_sessions.bulk_write(ops, ordered=False)).modified_count
+            ops = []
+    if ops:
+        updated += (await db.training_sessions.bulk_write(ops, ordered=False)).modified_count
+    return scanned, updated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="DragonFit numeric set data")
+    parser.add_argument("--migrate", action="store_true", help="backfill numeric fields on existing sessions")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    if args.migrate:
+        scanned, updated = asyncio.run(migrate(args.batch_size))
+        print(f"Scanned {scanned} session(s), updated {updated}")
+        print("Run 'python -m app.stats --rebuild' to refresh rollups with the parsed values")
+    else:
+        parser.print_help()
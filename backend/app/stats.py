@@ -0,0 +1,197 @@
+"""
+DragonFit - Per-user statistics rollups
+
+`user_stats` holds one document per user that is kept up to date on every
+workout/session write, so /api/stats is a single read:
+
+    {
+        "user_id": "user_...",
+        "total_workouts": 3,
+        "total_sessions": 120,
+        "total_volume": 185230.0,
+        "sessions_by_week": {"2024-05-06": 4, ...},  # keyed by Monday of the week
+        "purging_workouts": ["workout_..."],         # deleted, sessions still being purged
+        "data_version": 57                           # bumped on every write
+    }
+
+Sessions of a deleted workout come off the totals when its purge starts
+(they are hidden from reads from then on), not batch by batch as the purge
+deletes them; `purging_workouts` is what session reads hide.
+
+Rebuild from scratch (all users or a single one) with:
+
+    python -m app.stats --rebuild [--user USER_ID]
+"""
+import argparse
+import asyncio
+from datetime import datetime, timezone, timedelta
+from typing import Optional
+
+from pymongo import ReturnDocument
+
+from . import session_store
+from .database import db, to_list
+from .sets import exercise_volume
+
+
+def week_key(date_str: Optional[str] = None) -> str:
+    """Monday (YYYY-MM-DD) of the week containing `date_str` (default: today)"""
+    try:
+        day = datetime.strptime(date_str[:10], "%Y-%m-%d") if date_str else datetime.now(timezone.utc)
+    except ValueError:
+        day = datetime.now(timezone.utc)
+    return (day - timedelta(days=day.weekday())).strftime("%Y-%m-%d")
+
+
+def session_volume(session: dict) -> float:
+    """Total weight x reps of a session"""
+    return sum(exercise_volume(ex) for ex in session.get("exercises", []))
+
+
+def _sessions_inc(sessions: list, sign: int) -> dict:
+    inc = {"total_sessions": 0, "total_volume": 0.0}
+    for session in sessions:
+        inc["total_sessions"] += sign
+        inc["total_volume"] += sign * session_volume(session)
+        key = f"sessions_by_week.{week_key(session.get('date'))}"
+        inc[key] = inc.get(key, 0) + sign
+    return inc
+
+
+async def _apply(user_id: str, inc: dict, update: Optional[dict] = None):
+    """Fold a write (already in the source collections) into the rollup.
+
+    With SESSION_LAYOUT=buckets the source is the buckets, so callers run
+    the session_store hook before this one.
+    """
+    inc = {k: v for k, v in inc.items() if v}
+    inc["data_version"] = 1
+    result = await db.user_stats.update_one({"user_id": user_id}, dict(update or {}, **{"$inc": inc}))
+    if result.matched_count == 0:
+        # No rollup yet (new user, or history from before rollups): an upserted
+        # $inc would only count this write, so build it from the source instead
+        await rebuild_user_stats(user_id)
+
+
+async def on_workout_created(user_id: str):
+    await _apply(user_id, {"total_workouts": 1})
+
+
+async def on_workout_updated(user_id: str):
+    await _apply(user_id, {})
+
+
+async def on_workout_deleted(user_id: str, sessions: list):
+    inc = _sessions_inc(sessions, -1)
+    inc["total_workouts"] = -1
+    await _apply(user_id, inc)
+
+
+async def on_sessions_created(user_id: str, sessions: list):
+    await _apply(user_id, _sessions_inc(sessions, 1))
+
+
+async def on_sessions_deleted(user_id: str, sessions: list):
+    await _apply(user_id, _sessions_inc(sessions, -1))
+
+
+async def on_purge_started(user_id: str, workout_id: str):
+    """Take the sessions of a deleted workout off the rollup before the purge deletes them"""
+    inc = {}
+    async for session in db.training_sessions.find({"user_id": user_id, "workout_id": workout_id},
+                                                   {"_id": 0, "date": 1, "exercises": 1}):
+        for key, value in _sessions_inc([session], -1).items():
+            inc[key] = inc.get(key, 0) + value
+    await _apply(user_id, inc, {"$addToSet": {"purging_workouts": workout_id}})
+
+
+async def on_purge_finished(user_id: str, workout_id: str):
+    await _apply(user_id, {}, {"$pull": {"purging_workouts": workout_id}})
+
+
+async def purging_workouts(user_id: str) -> list:
+    stats = await db.user_stats.find_one({"user_id": user_id}, {"_id": 0, "purging_workouts": 1})
+    return (stats or {}).get("purging_workouts", [])
+
+
+async def rebuild_user_stats(user_id: str) -> dict:
+    """Recompute a user's rollup from the source collections"""
+    total_workouts = await db.workouts.count_documents({"user_id": user_id})
+    purging = await db.workout_purges.distinct("workout_id", {"user_id": user_id, "status": "pending"})
+    if session_store.LAYOUT == "buckets":
+        # Per-month aggregates instead of every session, minus what is left to purge
+        rollup = await session_store.bucket_rollup(user_id)
+        if purging:
+            leftover = await to_list(db.training_sessions.find(
+                {"user_id": user_id, "workout_id": {"$in": purging}},
+                {"_id": 0, "date": 1, "exercises": 1}
+            ))
+            for key, value in _sessions_inc(leftover, -1).items():
+                rollup[key] = rollup.get(key, 0) + value
+    else:
+        sessions = await to_list(db.training_sessions.find(
+            {"user_id": user_id, "workout_id": {"$nin": purging}},
+            {"_id": 0, "date": 1, "exercises": 1}
+        ))
+        rollup = _sessions_inc(sessions, 1)
+    doc = {
+        "total_workouts": total_workouts,
+        "total_sessions": rollup.pop("total_sessions"),
+        "total_volume": rollup.pop("total_volume"),
+        "sessions_by_week": {k.split(".", 1)[1]: v for k, v in rollup.items()},
+        "purging_workouts": purging,
+        "rebuilt_at": datetime.now(timezone.utc)
+    }
+    # data_version keeps counting up so ETags derived from it never repeat
+    return await db.user_stats.find_one_and_update(
+        {"user_id": user_id},
+        {"$set": doc, "$inc": {"data_version": 1}},
+        projection={"_id": 0},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def load_user_stats(user_id: str) -> dict:
+    stats = await db.user_stats.find_one({"user_id": user_id}, {"_id": 0})
+    if stats is None:
+        # Users created before rollups existed: build on first read
+        stats = await rebuild_user_stats(user_id)
+    return stats
+
+
+def format_stats(stats: dict) -> dict:
+    return {
+        "total_workouts": stats.get("total_workouts", 0),
+        "total_sessions": stats.get("total_sessions", 0),
+        "sessions_this_week": stats.get("sessions_by_week", {}).get(week_key(), 0),
+        "total_volume": round(stats.get("total_volume", 0), 1)
+    }
+
+
+async def get_user_stats(user_id: str) -> dict:
+    return format_stats(await load_user_stats(user_id))
+
+
+def dashboard_etag_parts(user_id: str, stats: dict) -> tuple:
+    # The week key is part of the tag: sessions_this_week changes on Mondays
+    return (user_id, stats.get("data_version", 0), week_key())
+
+
+async def rebuild_all(user_id: Optional[str] = None) -> int:
+    user_ids = [user_id] if user_id else await db.users.distinct("user_id")
+    for uid in user_ids:
+        await rebuild_user_stats(uid)
+    return len(user_ids)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="DragonFit user_stats rollups")
+    parser.add_argument("--rebuild", action="store_true", help="recompute rollups from training_sessions")
+    parser.add_argument("--user", help="only rebuild this user_id")
+    args = parser.parse_args()
+    if args.rebuild:
+        count = asyncio.run(rebuild_all(args.user))
+        print(f"Rebuilt stats for {count} user(s)")
+    else:
+        parser.print_help()
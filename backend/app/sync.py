@@ -0,0 +1,178 @@
+"""
+DragonFit - Delta sync for offline clients (POST /api/sync)
+
+Every write to a workout or session stamps it with `sync_seq`, taken from a
+per-user counter in `sync_counters`. Deletes leave a tombstone carrying a
+sequence number of its own:
+
+    sync_tombstones: {"user_id", "collection", "entity_id", "sync_seq", "deleted_at"}
+
+A change token is the last sequence a client has seen for a collection, so
+"what changed since" is one indexed range query on (user_id, sync_seq) per
+collection plus one on the tombstones. Tombstones expire after
+SYNC_TOMBSTONE_DAYS (TTL index); a token older than that cannot be answered
+incrementally and gets a full snapshot with `reset: true`.
+
+Sequence numbers are taken before the write that carries them commits, so
+a lower one can land after a higher one. Writers therefore hold a
+reservation while they write (see `reserve`), and reads stop below the
+oldest one still open (`horizon`): a token never moves past a write that
+is still in flight.
+
+    sync_counters: {"user_id", "seq", "in_flight": [{"id", "first", "until"}]}
+
+Snapshots are paged in id order and pinned to the horizon of their first
+page; the token of the last page continues incrementally from there, so
+anything written meanwhile is sent again (clients keep the latest copy of
+each id).
+"""
+import base64
+import json
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Optional
+
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+
+from .database import db, to_list
+
+SYNC_PAGE_SIZE = int(os.environ.get("SYNC_PAGE_SIZE", "500"))
+TOMBSTONE_DAYS = int(os.environ.get("SYNC_TOMBSTONE_DAYS", "30"))
+# A reservation still open after this long (its writer died) stops holding reads back
+RESERVATION_SECONDS = int(os.environ.get("SYNC_RESERVATION_SECONDS", "60"))
+
+# collection name in the API -> (Mongo collection, id field, projection)
+COLLECTIONS = {
+    "workouts": ("workouts", "workout_id", {"_id": 0, "content_version": 0}),
+    "sessions": ("training_sessions", "session_id", {"_id": 0}),
+}
+
+
+@asynccontextmanager
+async def reserve(user_id: str, count: int = 1):
+    """Reserve `count` sequence numbers; yields the last one of the range.
+
+    Do the write inside the block: until it exits, sync reads stop short of
+    the range.
+    """
+    reservation_id = uuid.uuid4().hex
+    now = time.time()
+    counter = await db.sync_counters.find_one_and_update(
+        {"user_id": user_id},
+        [
+            {"$set": {"seq": {"$add": [{"$ifNull": ["$seq", 0]}, count]}}},
+            {"$set": {"in_flight": {"$concatArrays": [
+                # Expired reservations are dropped here, so the list stays short
+                {"$filter": {"input": {"$ifNull": ["$in_flight", []]}, "cond": {"$gt": ["$$this.until", now]}}},
+                [{"id": reservation_id, "first": {"$subtract": ["$seq", count - 1]},
+                  "until": now + RESERVATION_SECONDS}]
+            ]}}}
+        ],
+        projection={"_id": 0, "seq": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    try:
+        yield counter["seq"]
+    finally:
+        await db.sync_counters.update_one({"user_id": user_id}, {"$pull": {"in_flight": {"id": reservation_id}}})
+
+
+async def horizon(user_id: str) -> int:
+    """Highest sequence number with no write still in flight at or below it"""
+    counter = await db.sync_counters.find_one({"user_id": user_id}, {"_id": 0, "seq": 1, "in_flight": 1})
+    if not counter:
+        return 0
+    now = time.time()
+    open_firsts = [r["first"] for r in counter.get("in_flight", []) if r["until"] > now]
+    return min(open_firsts) - 1 if open_firsts else counter["seq"]
+
+
+async def record_deletes(user_id: str, collection: str, entity_ids: list):
+    """Leave tombstones for deleted workouts/sessions so clients can drop them"""
+    if not entity_ids:
+        return
+    now = datetime.now(timezone.utc)
+    async with reserve(user_id, len(entity_ids)) as last:
+        await db.sync_tombstones.insert_many([
+            {"user_id": user_id, "collection": collection, "entity_id": entity_id,
+             "sync_seq": last - len(entity_ids) + 1 + i, "deleted_at": now}
+            for i, entity_id in enumerate(entity_ids)
+        ])
+
+
+def encode_token(seq: int, at: Optional[int] = None, after: Optional[str] = None) -> str:
+    value = {"seq": seq, "at": at or int(time.time())}
+    if after:
+        value["after"] = after  # snapshot in progress: last id sent
+    raw = json.dumps(value)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_token(token: str) -> dict:
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        value = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        after = value.get("after")
+        return {"seq": int(value["seq"]), "at": int(value["at"]), "after": str(after) if after else None}
+    except (ValueError, TypeError, KeyError, AttributeError):
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+
+
+async def snapshot(user_id: str, collection: str, since: Optional[dict] = None,
+                   limit: int = SYNC_PAGE_SIZE) -> dict:
+    """Live documents in id order, at most `limit` (first sync, or an expired token)"""
+    name, id_field, projection = COLLECTIONS[collection]
+    if since is None:
+        since = {"seq": await horizon(user_id), "at": int(time.time()), "after": None}
+    query = {"user_id": user_id}
+    if since["after"]:
+        query[id_field] = {"$gt": since["after"]}
+    docs = await to_list(db[name].find(query, projection).sort(id_field, 1).limit(limit + 1))
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    return {
+        "changed": docs,
+        "deleted": [],
+        "token": encode_token(since["seq"], since["at"], docs[-1][id_field] if has_more else None),
+        "has_more": has_more,
+        "reset": since["after"] is None  # first page only: later pages add to it
+    }
+
+
+async def changes_since(user_id: str, collection: str, token: Optional[str],
+                        limit: int = SYNC_PAGE_SIZE) -> dict:
+    """Documents written and ids deleted after `token`, oldest first, at most `limit`"""
+    if not token:
+        return await snapshot(user_id, collection, limit=limit)
+    since = decode_token(token)
+    if time.time() - since["at"] > TOMBSTONE_DAYS * 24 * 60 * 60:
+        return await snapshot(user_id, collection, limit=limit)
+    if since["after"]:
+        return await snapshot(user_id, collection, since, limit)
+
+    name, _, projection = COLLECTIONS[collection]
+    after = {"user_id": user_id, "sync_seq": {"$gt": since["seq"], "$lte": await horizon(user_id)}}
+    docs = await to_list(db[name].find(after, projection).sort("sync_seq", 1).limit(limit + 1))
+    tombstones = await to_list(db.sync_tombstones.find(
+        dict(after, collection=collection), {"_id": 0, "entity_id": 1, "sync_seq": 1}
+    ).sort("sync_seq", 1).limit(limit + 1))
+
+    merged = sorted(
+        [(d["sync_seq"], "changed", d) for d in docs]
+        + [(t["sync_seq"], "deleted", t["entity_id"]) for t in tombstones],
+        key=lambda item: item[0]
+    )
+    has_more = len(merged) > limit
+    merged = merged[:limit]
+    return {
+        "changed": [item for _, kind, item in merged if kind == "changed"],
+        "deleted": [item for _, kind, item in merged if kind == "deleted"],
+        "token": encode_token(merged[-1][0] if merged else since["seq"]),
+        "has_more": has_more,
+        "reset": False
+    }
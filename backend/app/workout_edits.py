@@ -0,0 +1,162 @@
+"""
+DragonFit - Granular edits of a workout plan
+
+Each function builds one in-place update of a workout's `days` for a single
+`find_one_and_update` (see the /api/workouts/{id}/days endpoints), instead
+of rewriting the whole plan:
+
+    add / update / remove an exercise    $push / $set with arrayFilters / $pull
+    add / update a day                   $push / $set
+    remove / reorder days or exercises   update pipeline
+
+Days are addressed by position. Exercises are addressed by their catalogue
+exercise_id when the day lists it once, or by position (a day may repeat an
+exercise, and a blank one has no id). `filter` is merged into the workout
+query and only matches when the addressed day or exercise exists (and the
+edit still applies), so a miss never pads arrays with nulls; `missing` is
+the error to report then.
+"""
+from typing import List, NamedTuple, Optional, Tuple, Union
+
+ExerciseRef = Union[str, int]  # exercise_id, or position within the day
+
+
+class Edit(NamedTuple):
+    filter: dict
+    update: Union[dict, list]
+    missing: Tuple[int, str]
+    array_filters: Optional[list] = None
+
+
+def _day(day_index: int) -> dict:
+    return {f"days.{day_index}": {"$exists": True}}
+
+
+def _exercises(day_index: int) -> dict:
+    """Pipeline expression for the exercises of one day"""
+    return {"$let": {"vars": {"day": {"$arrayElemAt": ["$days", day_index]}}, "in": "$$day.exercises"}}
+
+
+def _listed_once(day_index: int, exercise_id: str) -> dict:
+    """Matches when the day lists `exercise_id` exactly once, so the id addresses one slot"""
+    return {"$expr": {"$eq": [{"$size": {"$filter": {
+        "input": {"$ifNull": [_exercises(day_index), []]},
+        "cond": {"$eq": ["$$this.exercise_id", exercise_id]}
+    }}}, 1]}}
+
+
+_NOT_LISTED_ONCE = (404, "Exercise not found, or repeated in the day (address it by position)")
+
+
+def _push(path: str, item: dict, position: Optional[int]) -> dict:
+    each = {"$each": [item]}
+    if position is not None:
+        each["$position"] = position
+    return {"$push": {path: each}}
+
+
+def _replace_day(day_index: int, fields: dict) -> dict:
+    """Pipeline expression for `days` with `fields` merged into one day"""
+    return {"$map": {
+        "input": {"$range": [0, {"$size": "$days"}]},
+        "as": "d",
+        "in": {"$cond": [
+            {"$eq": ["$$d", day_index]},
+            {"$mergeObjects": [{"$arrayElemAt": ["$days", "$$d"]}, fields]},
+            {"$arrayElemAt": ["$days", "$$d"]}
+        ]}
+    }}
+
+
+def with_version_bump(update: Union[dict, list], sync_seq: int) -> Union[dict, list]:
+    """`update` plus the bookkeeping every workout write does (ETag version, export cache, sync)"""
+    if isinstance(update, list):
+        return update + [{"$set": {
+            "sync_seq": sync_seq,
+            "version": {"$add": [{"$ifNull": ["$version", 0]}, 1]},
+            "content_version": {"$add": [{"$ifNull": ["$content_version", 0]}, 1]}
+        }}]
+    return dict(update, **{
+        "$set": dict(update.get("$set", {}), sync_seq=sync_seq),
+        "$inc": {"version": 1, "content_version": 1}
+    })
+
+
+def add_day(day: dict, position: Optional[int] = None) -> Edit:
+    return Edit({}, _push("days", day, position), (404, "Workout not found"))
+
+
+def update_day(day_index: int, fields: dict) -> Edit:
+    return Edit(_day(day_index), {"$set": {f"days.{day_index}.{k}": v for k, v in fields.items()}},
+                (404, "Day not found"))
+
+
+def remove_day(day_index: int) -> Edit:
+    return Edit(_day(day_index), [{"$set": {"days": {"$map": {
+        "input": {"$filter": {"input": {"$range": [0, {"$size": "$days"}]}, "cond": {"$ne": ["$$this", day_index]}}},
+        "in": {"$arrayElemAt": ["$days", "$$this"]}
+    }}}}], (404, "Day not found"))
+
+
+def reorder_days(order: List[int]) -> Edit:
+    """`order` lists the current day indexes in their new order"""
+    return Edit({"days": {"$size": len(order)}},
+                [{"$set": {"days": [{"$arrayElemAt": ["$days", i]} for i in order]}}],
+                (409, "Order must list every day of the workout once"))
+
+
+def add_exercise(day_index: int, exercise: dict, position: Optional[int] = None) -> Edit:
+    return Edit(_day(day_index), _push(f"days.{day_index}.exercises", exercise, position), (404, "Day not found"))
+
+
+def update_exercise(day_index: int, exercise: ExerciseRef, fields: dict, current_id: Optional[str] = None) -> Edit:
+    """`fields` may carry a new exercise_id (a rename that moved to another catalogue entry).
+
+    By position, `current_id` (what the rename was planned from) must still be there.
+    """
+    if isinstance(exercise, int):
+        path = f"days.{day_index}.exercises.{exercise}"
+        if "exercise_id" in fields:
+            match = {path: {"$exists": True}, f"{path}.exercise_id": current_id}
+            missing = (409, "Exercise not found or changed, reload it and retry")
+        else:
+            match, missing = {path: {"$exists": True}}, (404, "Exercise not found")
+        return Edit(match, {"$set": {f"{path}.{k}": v for k, v in fields.items()}}, missing)
+    return Edit(_listed_once(day_index, exercise),
+                {"$set": {f"days.{day_index}.exercises.$[ex].{k}": v for k, v in fields.items()}},
+                _NOT_LISTED_ONCE,
+                array_filters=[{"ex.exercise_id": exercise}])
+
+
+def remove_exercise(day_index: int, exercise: ExerciseRef) -> Edit:
+    if isinstance(exercise, int):
+        exercises = _exercises(day_index)
+        kept = {"$map": {
+            "input": {"$filter": {"input": {"$range": [0, {"$size": exercises}]}, "cond": {"$ne": ["$$this", exercise]}}},
+            "in": {"$arrayElemAt": [exercises, "$$this"]}
+        }}
+        return Edit({f"days.{day_index}.exercises.{exercise}": {"$exists": True}},
+                    [{"$set": {"days": _replace_day(day_index, {"exercises": kept})}}],
+                    (404, "Exercise not found"))
+    return Edit(_listed_once(day_index, exercise),
+                {"$pull": {f"days.{day_index}.exercises": {"exercise_id": exercise}}},
+                _NOT_LISTED_ONCE)
+
+
+def reorder_exercises(day_index: int, order: Union[List[int], List[str]]) -> Edit:
+    """`order` lists the day's exercise positions, or ids when none repeats, in their new order"""
+    exercises = _exercises(day_index)
+    if all(isinstance(i, int) for i in order):
+        return Edit({f"days.{day_index}.exercises": {"$size": len(order)}},
+                    [{"$set": {"days": _replace_day(day_index, {"exercises": [
+                        {"$arrayElemAt": [exercises, i]} for i in order
+                    ]})}}],
+                    (409, "Order must list every exercise of the day once"))
+    reordered = [
+        {"$arrayElemAt": [{"$filter": {"input": exercises, "cond": {"$eq": ["$$this.exercise_id", exercise_id]}}}, 0]}
+        for exercise_id in order
+    ]
+    return Edit({f"days.{day_index}.exercises": {"$size": len(order)},
+                 f"days.{day_index}.exercises.exercise_id": {"$all": order}},
+                [{"$set": {"days": _replace_day(day_index, {"exercises": reordered})}}],
+                (409, "Order must list every exercise of the day once (by position when one repeats)"))
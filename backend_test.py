@@ -7,6 +7,7 @@ Tests all API endpoints for the gym workout tracking app
 import requests
 import sys
 import json
+import time
 from datetime import datetime
 
 class DragonFitAPITester:
@@ -16,6 +17,7 @@ class DragonFitAPITester:
         self.user_id = None
         self.workout_id = None
         self.session_id = None
+        self.exercise_id = None
         self.tests_run = 0
         self.tests_passed = 0
         self.session = requests.Session()
@@ -45,6 +47,8 @@ class DragonFitAPITester:
                 response = self.session.post(url, json=data, headers=headers)
             elif method == 'PUT':
                 response = self.session.put(url, json=data, headers=headers)
+            elif method == 'PATCH':
+                response = self.session.patch(url, json=data, headers=headers)
             elif method == 'DELETE':
                 response = self.session.delete(url, headers=headers)
 
@@ -123,7 +127,8 @@ class DragonFitAPITester:
         success, data, status = self.make_request('POST', 'workouts', workout_data, 200)
         if success and 'workout_id' in data:
             self.workout_id = data['workout_id']
-            return self.log_test("Create Workout", True)
+            self.exercise_id = data['days'][0]['exercises'][0].get('exercise_id')
+            return self.log_test("Create Workout", self.exercise_id is not None)
         else:
             return self.log_test("Create Workout", False, f"Status: {status}, Response: {data}")
 
@@ -153,6 +158,73 @@ class DragonFitAPITester:
         success, data, status = self.make_request('PUT', f'workouts/{self.workout_id}', update_data)
         return self.log_test("Update Workout", success and data.get('name') == update_data['name'])
 
+    def test_update_workout_conditional(self):
+        """Test workout ETags: If-None-Match revalidation and If-Match updates"""
+        if not self.workout_id:
+            return self.log_test("Update Workout (conditional)", False, "No workout_id available")
+        
+        url = f"{self.base_url}/api/workouts/{self.workout_id}"
+        headers = {'Authorization': f'Bearer {self.token}'} if self.token else {}
+        
+        try:
+            response = self.session.get(url, headers=headers)
+            etag = response.headers.get('ETag', '')
+            checks = [response.status_code == 200 and bool(etag)]
+            response = self.session.get(url, headers={**headers, 'If-None-Match': etag})
+            checks.append(response.status_code == 304)
+            response = self.session.put(url, json={"description": "Actualizada con If-Match"},
+                                        headers={**headers, 'If-Match': etag})
+            new_etag = response.headers.get('ETag', '')
+            checks.append(response.status_code == 200 and new_etag not in ('', etag))
+            response = self.session.put(url, json={"description": "Copia obsoleta"},
+                                        headers={**headers, 'If-Match': etag})
+            checks.append(response.status_code == 412)
+            response = self.session.get(url, headers={**headers, 'If-None-Match': etag})
+            checks.append(response.status_code == 200 and response.json().get('description') == "Actualizada con If-Match")
+            return self.log_test("Update Workout (conditional)", all(checks), f"Checks: {checks}")
+        except Exception as e:
+            return self.log_test("Update Workout (conditional)", False, str(e))
+
+    def test_edit_workout_days(self):
+        """Test granular day/exercise edits"""
+        if not self.workout_id or not self.exercise_id:
+            return self.log_test("Edit Workout Days", False, "No workout_id available")
+        
+        base = f'workouts/{self.workout_id}/days'
+        checks = []
+        success, data, status = self.make_request('POST', base, {
+            "day_number": 3, "name": "Leg Day", "exercises": [{"name": "Sentadilla", "sets": "5x5"}]
+        })
+        checks.append(success and len(data['days']) == 3)
+        success, data, status = self.make_request('PATCH', f'{base}/0/exercises/{self.exercise_id}', {"notes": "Pausa abajo"})
+        checks.append(success and data['days'][0]['exercises'][0]['notes'] == "Pausa abajo")
+        order = [e['exercise_id'] for e in data['days'][0]['exercises']] if success else []
+        success, data, status = self.make_request('PUT', f'{base}/0/exercises/order', {"order": order[::-1]})
+        checks.append(success and [e['exercise_id'] for e in data['days'][0]['exercises']] == order[::-1])
+        success, data, status = self.make_request('PUT', f'{base}/0/exercises/order', {"order": order})
+        checks.append(success)
+        success, data, status = self.make_request('DELETE', f'{base}/2')
+        checks.append(success and [d['name'] for d in data['days']] == ["Push Day", "Pull Day"])
+        success, data, status = self.make_request('PATCH', f'{base}/5', {"name": "Nope"}, 404)
+        checks.append(success)
+        # A day may repeat an exercise or hold a blank one; those are addressed by position
+        success, data, status = self.make_request('POST', base, {
+            "day_number": 3, "name": "Dup", "exercises": [{"name": "Curl"}, {"name": "curl"}, {"name": ""}]
+        })
+        dup = data['days'][2]['exercises'] if success else [{}, {}, {}]
+        checks.append(success and dup[0]['exercise_id'] == dup[1]['exercise_id'] and dup[2]['exercise_id'] is None)
+        success, data, status = self.make_request('PATCH', f'{base}/2/exercises/{dup[0].get("exercise_id")}',
+                                                  {"notes": "?"}, 404)
+        checks.append(success)
+        success, data, status = self.make_request('PATCH', f'{base}/2/exercises/1', {"name": "Curl Martillo"})
+        renamed = data['days'][2]['exercises'] if success else [{}, {}]
+        checks.append(success and renamed[0]['name'] == "Curl" and renamed[1]['exercise_id'] != dup[0]['exercise_id'])
+        success, data, status = self.make_request('DELETE', f'{base}/2/exercises/2')
+        checks.append(success and len(data['days'][2]['exercises']) == 2)
+        success, data, status = self.make_request('DELETE', f'{base}/2')
+        checks.append(success and len(data['days']) == 2)
+        return self.log_test("Edit Workout Days", all(checks), f"Checks: {checks}")
+
     def test_create_training_session(self):
         """Test creating a training session"""
         if not self.workout_id:
@@ -198,17 +270,169 @@ class DragonFitAPITester:
         success, data, status = self.make_request('GET', f'sessions/{self.session_id}')
         return self.log_test("Get Session Detail", success and data.get('session_id') == self.session_id)
 
+    def test_get_session_not_modified(self):
+        """Test session revalidation with If-None-Match"""
+        if not self.session_id:
+            return self.log_test("Get Session (not modified)", False, "No session_id available")
+        
+        url = f"{self.base_url}/api/sessions/{self.session_id}"
+        headers = {'Authorization': f'Bearer {self.token}'} if self.token else {}
+        
+        try:
+            response = self.session.get(url, headers=headers)
+            etag = response.headers.get('ETag', '')
+            if response.status_code != 200 or not etag:
+                return self.log_test("Get Session (not modified)", False, f"Status: {response.status_code}, ETag: {etag}")
+            response = self.session.get(url, headers={**headers, 'If-None-Match': etag})
+            return self.log_test("Get Session (not modified)", response.status_code == 304, f"Status: {response.status_code}")
+        except Exception as e:
+            return self.log_test("Get Session (not modified)", False, str(e))
+
+    def test_get_sessions_paginated(self):
+        """Test keyset pagination (limit, X-Next-Cursor, cursor) and the summary view"""
+        url = f"{self.base_url}/api/sessions"
+        headers = {'Authorization': f'Bearer {self.token}'} if self.token else {}
+        
+        try:
+            everything = [s['session_id'] for s in self.session.get(url, headers=headers).json()]
+            if len(everything) < 2:
+                return self.log_test("Get Sessions (paginated)", False, f"Need 2 sessions, got {len(everything)}")
+            page_size = len(everything) - 1
+            response = self.session.get(url, params={"limit": page_size, "view": "summary"}, headers=headers)
+            first = response.json()
+            cursor = response.headers.get('X-Next-Cursor')
+            if response.status_code != 200 or not cursor:
+                return self.log_test("Get Sessions (paginated)", False, f"Status: {response.status_code}, Cursor: {cursor}")
+            response = self.session.get(url, params={"limit": page_size, "view": "summary", "cursor": cursor}, headers=headers)
+            second = response.json()
+            paged = [s['session_id'] for s in first + second]
+            success = (response.status_code == 200 and 'X-Next-Cursor' not in response.headers
+                       and paged == everything
+                       and all('exercise_count' in s and 'exercises' not in s for s in first + second))
+            return self.log_test("Get Sessions (paginated)", success, f"All: {everything}, Paged: {paged}")
+        except Exception as e:
+            return self.log_test("Get Sessions (paginated)", False, str(e))
+
+    def test_import_sessions(self):
+        """Test bulk CSV session import"""
+        if not self.workout_id:
+            return self.log_test("Import Sessions", False, "No workout_id available")
+        
+        body = "date,day_index,exercise_index,weight,reps\n2024-01-08,0,0,80kg,\"10,10,8\"\n2024-01-08,0,1,60kg,\"12,10\"\n2024-01-10,x,0,80kg,10\n"
+        url = f"{self.base_url}/api/sessions/import?workout_id={self.workout_id}"
+        headers = {'Content-Type': 'text/csv'}
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        try:
+            response = self.session.post(url, data=body.encode(), headers=headers)
+            data = response.json()
+            success = response.status_code == 200 and data.get('imported') == 1 and data.get('failed') == 1
+            return self.log_test("Import Sessions", success, "" if success else f"Status: {response.status_code}, Response: {data}")
+        except Exception as e:
+            return self.log_test("Import Sessions", False, str(e))
+
+    def test_sync(self):
+        """Test delta sync: full snapshot, then only changes since the token"""
+        success, data, status = self.make_request('POST', 'sync', {})
+        if not success or 'token' not in data.get('workouts', {}):
+            return self.log_test("Delta Sync", False, f"Status: {status}, Response: {data}")
+        
+        tokens = {name: data[name]['token'] for name in ('workouts', 'sessions')}
+        success, data, status = self.make_request('POST', 'sync', {
+            "tokens": tokens,
+            "mutations": [{"client_id": "m1", "collection": "workouts", "op": "create", "data": {"name": "Offline Workout"}}]
+        })
+        success = (success and data['mutations'][0].get('status') == 200
+                   and [w['name'] for w in data['workouts']['changed']] == ["Offline Workout"])
+        if not success:
+            return self.log_test("Delta Sync", False, f"Response: {data}")
+        
+        created_id = data['mutations'][0]['id']
+        tokens = {name: data[name]['token'] for name in ('workouts', 'sessions')}
+        success, data, status = self.make_request('POST', 'sync', {
+            "tokens": tokens,
+            "mutations": [{"client_id": "m2", "collection": "workouts", "op": "delete", "id": created_id}]
+        })
+        success = (success and data['mutations'][0].get('status') == 200
+                   and data['workouts']['deleted'] == [created_id])
+        return self.log_test("Delta Sync", success, "" if success else f"Response: {data}")
+
+    def test_delete_workout(self):
+        """Test workout deletion: sessions hidden at once, purged in the background"""
+        success, data, status = self.make_request('POST', 'workouts', {
+            "name": "Rutina a borrar", "days": [{"day_number": 1, "name": "A", "exercises": [{"name": "Sentadilla"}]}]
+        })
+        if not success:
+            return self.log_test("Delete Workout", False, f"Status: {status}, Response: {data}")
+        workout_id = data['workout_id']
+        self.make_request('POST', 'sessions', {
+            "workout_id": workout_id, "day_index": 0, "date": datetime.now().strftime("%Y-%m-%d"),
+            "exercises": [{"exercise_index": 0, "weight": "60kg", "reps": "5,5,5"}]
+        })
+        success, data, status = self.make_request('DELETE', f'workouts/{workout_id}', expected_status=202)
+        if not success or 'deletion' not in data:
+            return self.log_test("Delete Workout", False, f"Status: {status}, Response: {data}")
+        _, sessions, _ = self.make_request('GET', f'sessions?workout_id={workout_id}')
+        for _ in range(20):
+            _, job, _ = self.make_request('GET', f'workouts/{workout_id}/deletion')
+            if job.get('status') == 'done':
+                break
+            time.sleep(0.5)
+        success = sessions == [] and job.get('status') == 'done' and job.get('deleted') == job.get('total')
+        return self.log_test("Delete Workout", success, f"Sessions: {sessions}, Job: {job}")
+
     def test_get_progress(self):
         """Test getting progress data"""
         success, data, status = self.make_request('GET', 'progress')
         return self.log_test("Get Progress", success and isinstance(data, dict))
 
+    def test_get_progress_filtered(self):
+        """Test progress range filter and downsampling"""
+        key_filter = self.exercise_id or "0_0"
+        success, data, status = self.make_request('GET', f'progress?from=2000-01-01&exercise_key={key_filter}&max_points=3')
+        success = success and all(
+            key == key_filter and len(points) <= 3
+            for workout in data.values() for key, points in workout['exercises'].items()
+        )
+        return self.log_test("Get Progress (filtered)", success)
+
+    def test_get_exercises(self):
+        """Test exercise catalogue"""
+        success, data, status = self.make_request('GET', 'exercises')
+        success = success and any(e['exercise_id'] == self.exercise_id and e['name'] == "Press Banca" for e in data)
+        return self.log_test("Get Exercises", success)
+
+    def test_get_records(self):
+        """Test personal records index"""
+        success, data, status = self.make_request('GET', 'records')
+        success = success and isinstance(data, list) and all('e1rm' in r and 'top_weight' in r for r in data)
+        # One record per exercise, whichever workouts it was logged in
+        keys = [r.get('exercise_key') for r in data] if success else []
+        success = success and len(keys) == len(set(keys)) and all(r.get('workout_ids') for r in data)
+        return self.log_test("Get Records", success)
+
     def test_get_stats(self):
         """Test getting user statistics"""
         success, data, status = self.make_request('GET', 'stats')
         expected_keys = ['total_workouts', 'total_sessions', 'sessions_this_week', 'total_volume']
         return self.log_test("Get Stats", success and all(key in data for key in expected_keys))
 
+    def test_get_dashboard(self):
+        """Test aggregated dashboard with conditional GET"""
+        url = f"{self.base_url}/api/dashboard"
+        headers = {'Authorization': f'Bearer {self.token}'} if self.token else {}
+        
+        try:
+            response = self.session.get(url, headers=headers)
+            data = response.json()
+            if response.status_code != 200 or 'workouts' not in data or 'stats' not in data:
+                return self.log_test("Get Dashboard", False, f"Status: {response.status_code}, Response: {data}")
+            headers['If-None-Match'] = response.headers.get('ETag', '')
+            response = self.session.get(url, headers=headers)
+            return self.log_test("Get Dashboard", response.status_code == 304, f"Status: {response.status_code}")
+        except Exception as e:
+            return self.log_test("Get Dashboard", False, str(e))
+
     def test_export_excel(self):
         """Test Excel export"""
         if not self.workout_id:
@@ -239,6 +463,42 @@ class DragonFitAPITester:
         except Exception as e:
             return self.log_test("Export PDF", False, str(e))
 
+    def test_export_job(self):
+        """Test background export job: submit, poll, download"""
+        if not self.workout_id:
+            return self.log_test("Export Job", False, "No workout_id available")
+        
+        success, data, status = self.make_request('POST', 'export/jobs', {"workout_id": self.workout_id, "format": "xlsx"})
+        if not success or 'job_id' not in data:
+            return self.log_test("Export Job", False, f"Status: {status}, Response: {data}")
+        
+        job_id = data['job_id']
+        for _ in range(30):
+            success, data, status = self.make_request('GET', f'export/jobs/{job_id}')
+            if not success or data.get('status') != 'pending':
+                break
+            time.sleep(0.5)
+        if data.get('status') != 'done':
+            return self.log_test("Export Job", False, f"Status: {status}, Response: {data}")
+        
+        url = f"{self.base_url}/api/export/jobs/{job_id}/download"
+        headers = {'Authorization': f'Bearer {self.token}'} if self.token else {}
+        try:
+            response = self.session.get(url, headers=headers)
+            success = response.status_code == 200 and 'application/vnd.openxmlformats' in response.headers.get('content-type', '')
+            return self.log_test("Export Job", success)
+        except Exception as e:
+            return self.log_test("Export Job", False, str(e))
+
+    def test_metrics(self):
+        """Test Prometheus metrics endpoint"""
+        try:
+            response = self.session.get(f"{self.base_url}/api/metrics")
+            success = response.status_code == 200 and 'dragonfit_http_requests_total' in response.text
+            return self.log_test("Metrics", success, "" if success else f"Status: {response.status_code}")
+        except Exception as e:
+            return self.log_test("Metrics", False, str(e))
+
     def test_logout(self):
         """Test user logout"""
         success, data, status = self.make_request('POST', 'auth/logout')
@@ -273,19 +533,33 @@ class DragonFitAPITester:
         self.test_get_workouts()
         self.test_get_workout_detail()
         self.test_update_workout()
+        self.test_update_workout_conditional()
+        self.test_edit_workout_days()
         
         # Training session tests
         self.test_create_training_session()
         self.test_get_sessions()
         self.test_get_session_detail()
+        self.test_get_session_not_modified()
+        self.test_import_sessions()
+        self.test_get_sessions_paginated()
+        self.test_sync()
+        self.test_delete_workout()
         
         # Analytics tests
         self.test_get_progress()
+        self.test_get_progress_filtered()
+        self.test_get_exercises()
+        self.test_get_records()
         self.test_get_stats()
+        self.test_get_dashboard()
         
         # Export tests
         self.test_export_excel()
         self.test_export_pdf()
+        self.test_export_job()
+        
+        self.test_metrics()
         
         # Logout test
         self.test_logout()
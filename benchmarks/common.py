@@ -0,0 +1,98 @@
+"""
+DragonFit - Shared helpers for the benchmark scripts
+"""
+import statistics
+import uuid
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def summarize(latencies_ms, elapsed_s):
+    return {
+        "requests": len(latencies_ms),
+        "throughput_rps": round(len(latencies_ms) / elapsed_s, 2) if elapsed_s else 0.0,
+        "mean_ms": round(statistics.mean(latencies_ms), 2) if latencies_ms else 0.0,
+        "p50_ms": round(percentile(latencies_ms, 50), 2),
+        "p95_ms": round(percentile(latencies_ms, 95), 2),
+        "p99_ms": round(percentile(latencies_ms, 99), 2),
+    }
+
+
+BENCH_PASSWORD = "Bench123456"
+
+BENCH_WORKOUT = {
+    "name": "Bench Rutina",
+    "days": [
+        {"day_number": 1, "name": "Push", "exercises": [
+            {"name": "Press Banca", "sets": "4x8"},
+            {"name": "Press Militar", "sets": "3x10"},
+        ]},
+        {"day_number": 2, "name": "Pull", "exercises": [
+            {"name": "Dominadas", "sets": "4x6"},
+            {"name": "Remo con Barra", "sets": "3x10"},
+        ]},
+    ],
+}
+
+
+def bench_session(workout_id, i):
+    """Deterministic synthetic session number `i`"""
+    return {
+        "workout_id": workout_id,
+        "day_index": i % 2,
+        "date": f"{2020 + i // 336}-{(i // 28) % 12 + 1:02d}-{i % 28 + 1:02d}",
+        "exercises": [
+            {"exercise_index": 0, "weight": f"{60 + i % 40}kg", "reps": "10,10,8"},
+            {"exercise_index": 1, "weight": f"{30 + i % 20}kg", "reps": "12,10,10"},
+        ],
+    }
+
+
+async def register_user(client):
+    """Register a throwaway user; sets the bearer header and returns its email"""
+    email = f"bench_{uuid.uuid4().hex[:8]}@dragonfit.com"
+    resp = await client.post("/api/auth/register", json={
+        "email": email, "password": BENCH_PASSWORD, "name": "Bench User"
+    })
+    resp.raise_for_status()
+    client.headers["Authorization"] = f"Bearer {resp.json()['token']}"
+    return email
+
+
+async def seed_history(client, sessions):
+    """Create the bench workout plus `sessions` sessions; returns the workout_id"""
+    resp = await client.post("/api/workouts", json=BENCH_WORKOUT)
+    resp.raise_for_status()
+    workout_id = resp.json()["workout_id"]
+    for i in range(sessions):
+        resp = await client.post("/api/sessions", json=bench_session(workout_id, i))
+        resp.raise_for_status()
+    return workout_id
+
+
+def history_csv(sessions):
+    """`sessions` synthetic sessions as a POST /api/sessions/import CSV body"""
+    rows = ["date,day_index,exercise_index,weight,reps"]
+    for i in range(sessions):
+        session = bench_session(None, i)
+        for ex in session["exercises"]:
+            rows.append(f'{session["date"]},{session["day_index"]},{ex["exercise_index"]},{ex["weight"]},"{ex["reps"]}"')
+    return "\n".join(rows) + "\n"
+
+
+async def seed_history_bulk(client, sessions):
+    """Like seed_history, but through the bulk import endpoint (one request)"""
+    resp = await client.post("/api/workouts", json=BENCH_WORKOUT)
+    resp.raise_for_status()
+    workout_id = resp.json()["workout_id"]
+    if sessions:
+        resp = await client.post(f"/api/sessions/import?workout_id={workout_id}",
+                                 content=history_csv(sessions).encode(), headers={"Content-Type": "text/csv"})
+        resp.raise_for_status()
+    return workout_id
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+DragonFit - Concurrent request throughput benchmark
+
+Seeds a user with training history and then fires concurrent /api/progress
+requests while probing /api/health, against a live server. Run it once
+against a build using the blocking pymongo client and once against the
+async access layer and compare the JSON output:
+
+    python benchmarks/concurrency_bench.py --base-url http://localhost:8001 \
+        --sessions 500 --concurrency 50 --requests 500 > after.json
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import httpx
+
+from common import register_user, seed_history, summarize
+
+
+async def run(args):
+    timeout = httpx.Timeout(60.0)
+    limits = httpx.Limits(max_connections=args.concurrency + 5)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=timeout, limits=limits) as client:
+        await register_user(client)
+        workout_id = await seed_history(client, args.sessions)
+
+        queue = asyncio.Queue()
+        for _ in range(args.requests):
+            queue.put_nowait(None)
+
+        load_latencies = []
+        probe_latencies = []
+        errors = 0
+        done = asyncio.Event()
+
+        async def worker():
+            nonlocal errors
+            while not queue.empty():
+                queue.get_nowait()
+                start = time.perf_counter()
+                resp = await client.get(args.endpoint)
+                load_latencies.append((time.perf_counter() - start) * 1000)
+                if resp.status_code != 200:
+                    errors += 1
+
+        async def probe():
+            # /api/health does no I/O: its latency measures event loop stalls
+            while not done.is_set():
+                start = time.perf_counter()
+                await client.get("/api/health")
+                probe_latencies.append((time.perf_counter() - start) * 1000)
+                await asyncio.sleep(args.probe_interval)
+
+        probe_task = asyncio.create_task(probe())
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await probe_task
+
+        await client.delete(f"/api/workouts/{workout_id}")
+
+    return {
+        "base_url": args.base_url,
+        "endpoint": args.endpoint,
+        "sessions": args.sessions,
+        "concurrency": args.concurrency,
+        "errors": errors,
+        "load": summarize(load_latencies, elapsed),
+        "health_probe": summarize(probe_latencies, elapsed),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8001")
+    parser.add_argument("--endpoint", default="/api/progress")
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--probe-interval", type=float, default=0.05)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    json.dump(result, sys.stdout, indent=2)
+    print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
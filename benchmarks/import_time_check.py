@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+DragonFit - Cold-start import-time regression check
+
+Imports the API (`app.server`, what backend/api/index.py loads on a
+serverless cold start) in fresh interpreters under `-X importtime` and
+reports the best total, the slowest top-level packages and whether any of
+the dependencies that must load lazily (export renderers, passlib, httpx)
+slipped back into the import graph. Exits 1 on a deferred import or when
+--budget-ms is exceeded, so it can run in CI:
+
+    python benchmarks/import_time_check.py --runs 5 --budget-ms 900
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+
+# Only the export / login paths need these; they must not load at import
+DEFERRED = ("openpyxl", "reportlab", "passlib", "httpx")
+
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def profile(backend_dir, module):
+    env = dict(os.environ, MONGO_URL="mongodb://127.0.0.1:1", DB_NAME="import_check")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=backend_dir, env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise SystemExit(proc.stderr[-2000:])
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((name, int(cumulative_us), len(indent) // 2))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--module", default="app.server")
+    parser.add_argument("--backend-dir", default=BACKEND_DIR)
+    parser.add_argument("--budget-ms", type=float, help="fail when the best import time exceeds this")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    best_rows, best_total = None, None
+    for _ in range(args.runs):
+        rows = profile(args.backend_dir, args.module)
+        total = next(us for name, us, depth in rows if name == args.module and depth == 0)
+        if best_total is None or total < best_total:
+            best_rows, best_total = rows, total
+
+    modules = {name for name, _, _ in best_rows}
+    loaded_deferred = [dep for dep in DEFERRED if dep in modules]
+    # Cumulative time of each package imported directly by app code (depth 1)
+    packages = {}
+    for name, us, depth in best_rows:
+        if depth == 1:
+            packages[name] = max(packages.get(name, 0), us)
+    slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:args.top]
+
+    result = {
+        "module": args.module,
+        "runs": args.runs,
+        "import_ms": round(best_total / 1000, 1),
+        "slowest_ms": {name: round(us / 1000, 1) for name, us in slowest},
+        "deferred_loaded": loaded_deferred,
+        "budget_ms": args.budget_ms,
+    }
+    json.dump(result, sys.stdout, indent=2)
+    print()
+
+    failed = bool(loaded_deferred) or (args.budget_ms is not None and best_total / 1000 > args.budget_ms)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+DragonFit - Reproducible mixed-traffic load benchmark
+
+Starts its own mongod (throwaway dbpath) and uvicorn, seeds synthetic users
+with training history, then drives concurrent mixed traffic (login, log
+session, progress, stats, export) for a fixed number of requests. Prints
+throughput and p50/p95/p99 per endpoint as JSON; compare two runs with
+--compare:
+
+    python benchmarks/load_bench.py --users 20 --history 500 --requests 2000 > before.json
+    git checkout my-branch
+    python benchmarks/load_bench.py --users 20 --history 500 --requests 2000 --compare before.json
+
+Use --mongo-url to run against an existing server instead of spawning
+mongod, and --base-url to skip starting uvicorn (the app must then point at
+a disposable database). The traffic sequence is fixed by --seed.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+
+from common import BENCH_PASSWORD, bench_session, register_user, seed_history_bulk, summarize
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+DEFAULT_MIX = "login=1,log_session=3,progress=3,stats=5,export=1"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(check, timeout, what):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if check():
+                return
+        except Exception:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{what} did not start within {timeout}s")
+
+
+def start_mongod(binary, port):
+    dbpath = tempfile.mkdtemp(prefix="dragonfit-bench-")
+    proc = subprocess.Popen(
+        [binary, "--dbpath", dbpath, "--port", str(port), "--bind_ip", "127.0.0.1", "--quiet"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+    def ready():
+        with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+            return True
+    wait_for(ready, 30, "mongod")
+    return proc, dbpath
+
+
+def start_api(port, mongo_url, db_name, workers, bcrypt_rounds, extra_env=None):
+    env = dict(os.environ, MONGO_URL=mongo_url, DB_NAME=db_name, PASSWORD_BCRYPT_ROUNDS=str(bcrypt_rounds),
+               **(extra_env or {}))
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.server:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL
+    )
+    wait_for(lambda: httpx.get(f"http://127.0.0.1:{port}/api/health").status_code == 200, 60, "uvicorn")
+    return proc
+
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        if name.strip() not in OPERATIONS:
+            raise SystemExit(f"unknown operation in --mix: {name}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+# --- Operations: one request each, against a seeded user ---
+
+async def op_login(client, user, i):
+    return await client.post("/api/auth/login", json={"email": user["email"], "password": BENCH_PASSWORD})
+
+
+async def op_log_session(client, user, i):
+    return await client.post("/api/sessions", json=bench_session(user["workout_id"], user["history"] + i),
+                             headers=user["headers"])
+
+
+async def op_progress(client, user, i):
+    return await client.get("/api/progress", headers=user["headers"])
+
+
+async def op_stats(client, user, i):
+    return await client.get("/api/stats", headers=user["headers"])
+
+
+async def op_export(client, user, i):
+    fmt = "excel" if i % 2 else "pdf"
+    return await client.get(f"/api/export/{fmt}/{user['workout_id']}", headers=user["headers"])
+
+
+OPERATIONS = {
+    "login": op_login,
+    "log_session": op_log_session,
+    "progress": op_progress,
+    "stats": op_stats,
+    "export": op_export,
+}
+
+
+async def seed(client, users, history, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            async with httpx.AsyncClient(base_url=str(client.base_url), timeout=client.timeout) as own:
+                email = await register_user(own)
+                workout_id = await seed_history_bulk(own, history)
+                return {"email": email, "workout_id": workout_id, "history": history,
+                        "headers": {"Authorization": own.headers["Authorization"]}}
+
+    return await asyncio.gather(*(one() for _ in range(users)))
+
+
+async def drive(client, users, mix, requests, concurrency, rng):
+    names = list(mix)
+    plan = [(rng.choice(users), op) for op in rng.choices(names, weights=[mix[n] for n in names], k=requests)]
+    latencies = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    position = 0
+
+    async def worker():
+        nonlocal position
+        while position < len(plan):
+            i = position
+            position += 1
+            user, name = plan[i]
+            start = time.perf_counter()
+            try:
+                resp = await OPERATIONS[name](client, user, i)
+                ok = resp.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            latencies[name].append((time.perf_counter() - start) * 1000)
+            if not ok:
+                errors[name] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    endpoints = {name: dict(summarize(latencies[name], elapsed), errors=errors[name]) for name in names}
+    everything = [ms for values in latencies.values() for ms in values]
+    return endpoints, dict(summarize(everything, elapsed), errors=sum(errors.values()), elapsed_s=round(elapsed, 2))
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(result, baseline_path):
+    """Human-readable p50/p95/p99 deltas against a previous run, on stderr"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"{'endpoint':<12} {'metric':<15} {'before':>10} {'after':>10} {'change':>8}", file=sys.stderr)
+    rows = dict(result["endpoints"], total=result["total"])
+    base_rows = dict(baseline.get("endpoints", {}), total=baseline.get("total", {}))
+    for name, row in rows.items():
+        for metric in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+            before, after = base_rows.get(name, {}).get(metric), row.get(metric)
+            if not before or after is None:
+                continue
+            print(f"{name:<12} {metric:<15} {before:>10} {after:>10} {(after - before) / before * 100:>+7.1f}%",
+                  file=sys.stderr)
+
+
+async def run(args, base_url):
+    rng = random.Random(args.seed)
+    timeout = httpx.Timeout(120.0)
+    limits = httpx.Limits(max_connections=args.concurrency + 5)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        seed_start = time.perf_counter()
+        users = await seed(client, args.users, args.history, min(args.concurrency, 10))
+        seed_s = time.perf_counter() - seed_start
+        endpoints, total = await drive(client, users, parse_mix(args.mix), args.requests, args.concurrency, rng)
+        for user in users:
+            await client.delete(f"/api/workouts/{user['workout_id']}", headers=user["headers"])
+
+    return {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "users": args.users,
+            "history": args.history,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "mix": args.mix,
+            "seed": args.seed,
+            "api_workers": args.workers,
+            "seed_s": round(seed_s, 2),
+        },
+        "endpoints": endpoints,
+        "total": total,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--history", type=int, default=200, help="sessions seeded per user")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"weighted operations (default: {DEFAULT_MIX})")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--mongod", default=shutil.which("mongod") or "mongod", help="mongod binary")
+    parser.add_argument("--mongo-url", help="use this MongoDB instead of spawning mongod")
+    parser.add_argument("--base-url", help="use this API instead of spawning uvicorn")
+    parser.add_argument("--output", help="also write the JSON result to this file")
+    parser.add_argument("--compare", help="previous JSON result to diff against (printed on stderr)")
+    args = parser.parse_args()
+
+    processes = []
+    dbpath = None
+    db_name = f"dragonfit_bench_{uuid.uuid4().hex[:8]}"
+    mongo_url = args.mongo_url
+    try:
+        base_url = args.base_url
+        if not base_url:
+            if not mongo_url:
+                port = free_port()
+                mongod, dbpath = start_mongod(args.mongod, port)
+                processes.append(mongod)
+                mongo_url = f"mongodb://127.0.0.1:{port}"
+            api_port = free_port()
+            processes.append(start_api(api_port, mongo_url, db_name, args.workers, args.bcrypt_rounds))
+            base_url = f"http://127.0.0.1:{api_port}"
+        result = asyncio.run(run(args, base_url))
+    finally:
+        for proc in reversed(processes):
+            proc.terminate()
+            proc.wait(timeout=30)
+        if args.mongo_url and not args.base_url:
+            from pymongo import MongoClient
+            MongoClient(args.mongo_url).drop_database(db_name)
+        if dbpath:
+            shutil.rmtree(dbpath, ignore_errors=True)
+
+    json.dump(result, sys.stdout, indent=2)
+    print()
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.compare:
+        compare(result, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
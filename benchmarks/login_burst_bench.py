@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+DragonFit - Login burst vs. /api/workouts latency
+
+Measures /api/workouts latency with no other traffic, then again while a
+burst of concurrent logins runs against a live server. With bcrypt on the
+event loop the second p99 explodes; with the hashing pool it should stay
+close to the baseline:
+
+    python benchmarks/login_burst_bench.py --base-url http://localhost:8001 \
+        --logins 200 --login-concurrency 50
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import httpx
+
+from common import BENCH_PASSWORD, register_user, seed_history, summarize
+
+
+async def sample_workouts(client, stop, interval):
+    latencies = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get("/api/workouts")
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def run(args):
+    timeout = httpx.Timeout(120.0)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=timeout) as client, \
+            httpx.AsyncClient(base_url=args.base_url, timeout=timeout,
+                              limits=httpx.Limits(max_connections=args.login_concurrency)) as login_client:
+        email = await register_user(client)
+        workout_id = await seed_history(client, 0)
+
+        # Baseline
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_workouts(client, stop, args.interval))
+        await asyncio.sleep(args.baseline_seconds)
+        stop.set()
+        baseline = await sampler
+
+        # Under a login burst
+        statuses = {}
+        login_latencies = []
+        semaphore = asyncio.Semaphore(args.login_concurrency)
+
+        async def login():
+            async with semaphore:
+                start = time.perf_counter()
+                resp = await login_client.post("/api/auth/login", json={
+                    "email": email, "password": BENCH_PASSWORD
+                })
+                login_latencies.append((time.perf_counter() - start) * 1000)
+                statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_workouts(client, stop, args.interval))
+        start = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(args.logins)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        under_burst = await sampler
+
+        await client.delete(f"/api/workouts/{workout_id}")
+
+    return {
+        "base_url": args.base_url,
+        "logins": args.logins,
+        "login_concurrency": args.login_concurrency,
+        "login_statuses": statuses,
+        "login": summarize(login_latencies, elapsed),
+        "workouts_baseline": summarize(baseline, args.baseline_seconds),
+        "workouts_during_burst": summarize(under_burst, elapsed),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8001")
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--login-concurrency", type=int, default=25)
+    parser.add_argument("--baseline-seconds", type=float, default=5.0)
+    parser.add_argument("--interval", type=float, default=0.02)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    json.dump(result, sys.stdout, indent=2)
+    print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
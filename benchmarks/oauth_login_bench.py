@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+DragonFit - Concurrent OAuth login latency (POST /api/auth/session)
+
+Runs a local stub of the OAuth provider (with configurable latency), starts
+the API pointed at it (OAUTH_SESSION_URL) plus a throwaway mongod, and fires
+concurrent logins with fresh session ids. Reports login latency and how many
+TCP connections the API opened to the provider. With a per-request client
+that is one per login; with the shared pool it stays near the concurrency:
+
+    python benchmarks/oauth_login_bench.py --logins 500 --concurrency 50 --provider-latency-ms 20
+"""
+
+import argparse
+import asyncio
+import json
+import shutil
+import sys
+import threading
+import time
+import uuid
+
+import httpx
+import uvicorn
+
+from common import summarize
+from load_bench import free_port, start_api, start_mongod, wait_for
+
+
+def make_stub(latency_s):
+    """Minimal ASGI OAuth provider; records the client port of every request"""
+    peers = set()
+
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        peers.add(scope["client"][1])
+        session_id = dict(scope["headers"]).get(b"x-session-id", b"").decode()
+        await asyncio.sleep(latency_s)
+        body = json.dumps({
+            "email": f"oauth_{session_id}@dragonfit.com", "name": "OAuth Bench",
+            "picture": None, "session_token": f"tok_{session_id}",
+        }).encode()
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": body})
+
+    return app, peers
+
+
+def start_stub(app, port):
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    wait_for(lambda: server.started, 10, "OAuth stub")
+    return server
+
+
+async def run(base_url, logins, concurrency):
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=httpx.Timeout(60.0),
+                                 limits=httpx.Limits(max_connections=concurrency + 5)) as client:
+
+        async def login():
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                resp = await client.post("/api/auth/session", json={"session_id": uuid.uuid4().hex[:16]})
+                latencies.append((time.perf_counter() - start) * 1000)
+                if resp.status_code != 200:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(logins)))
+        elapsed = time.perf_counter() - start
+    return dict(summarize(latencies, elapsed), errors=errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--logins", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=30)
+    parser.add_argument("--provider-latency-ms", type=float, default=20)
+    parser.add_argument("--mongod", default=shutil.which("mongod") or "mongod")
+    parser.add_argument("--mongo-url", help="use this MongoDB instead of spawning mongod")
+    args = parser.parse_args()
+
+    stub, peers = make_stub(args.provider_latency_ms / 1000)
+    stub_port = free_port()
+    server = start_stub(stub, stub_port)
+    processes = []
+    dbpath = None
+    try:
+        mongo_url = args.mongo_url
+        if not mongo_url:
+            port = free_port()
+            mongod, dbpath = start_mongod(args.mongod, port)
+            processes.append(mongod)
+            mongo_url = f"mongodb://127.0.0.1:{port}"
+        api_port = free_port()
+        processes.append(start_api(
+            api_port, mongo_url, f"dragonfit_bench_{uuid.uuid4().hex[:8]}", 1, 4,
+            {"OAUTH_SESSION_URL": f"http://127.0.0.1:{stub_port}/session-data"}
+        ))
+        result = asyncio.run(run(f"http://127.0.0.1:{api_port}", args.logins, args.concurrency))
+    finally:
+        for proc in reversed(processes):
+            proc.terminate()
+            proc.wait(timeout=30)
+        server.should_exit = True
+        if dbpath:
+            shutil.rmtree(dbpath, ignore_errors=True)
+
+    json.dump({
+        "logins": args.logins,
+        "concurrency": args.concurrency,
+        "provider_latency_ms": args.provider_latency_ms,
+        "provider_connections": len(peers),
+        "login": result,
+    }, sys.stdout, indent=2)
+    print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+DragonFit - /api/progress serialization and wire-size microbenchmark
+
+Builds a realistic progress payload (same shape as /api/progress) and
+compares FastAPI's default path (jsonable_encoder + json.dumps) with the
+orjson response class, plus bytes on the wire raw / gzip / brotli. No
+server or database needed:
+
+    python benchmarks/serialization_bench.py --sessions 1000 --repeat 50
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from starlette.responses import JSONResponse  # noqa: E402
+
+from app.responses import dumps  # noqa: E402
+from app.compression import BROTLI_QUALITY, GZIP_LEVEL, brotli  # noqa: E402
+
+EXERCISES = ["Press Banca", "Press Militar", "Fondos", "Dominadas", "Remo con Barra", "Curl Bíceps"]
+
+
+def progress_payload(workouts, sessions, exercises_per_day):
+    payload = {}
+    for w in range(workouts):
+        workout_id = f"workout_{w:012d}"
+        series = {}
+        for i in range(sessions // workouts):
+            day = i % 2
+            date = f"{2020 + i // 336}-{(i // 28) % 12 + 1:02d}-{i % 28 + 1:02d}"
+            for e in range(exercises_per_day):
+                key = f"{day}_{e}"
+                series.setdefault(key, []).append({
+                    "date": date,
+                    "weight": 40.0 + (i % 30) * 2.5,
+                    "reps": "10,10,8,8",
+                    "exercise_name": EXERCISES[(day * exercises_per_day + e) % len(EXERCISES)],
+                    "exercise_id": key
+                })
+        payload[workout_id] = {
+            "workout_name": f"Rutina {w + 1}",
+            "sessions_count": sessions // workouts,
+            "exercises": series
+        }
+    return payload
+
+
+def timed(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workouts", type=int, default=2)
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--exercises", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    payload = progress_payload(args.workouts, args.sessions, args.exercises)
+    stock = JSONResponse(content=None)
+
+    default_ms, default_body = timed(lambda: stock.render(jsonable_encoder(payload)), args.repeat)
+    orjson_ms, body = timed(lambda: dumps(payload), args.repeat)
+    gzip_ms, gzipped = timed(lambda: gzip.compress(body, compresslevel=GZIP_LEVEL), args.repeat)
+    result = {
+        "payload": {"workouts": args.workouts, "sessions": args.sessions, "exercises_per_day": args.exercises},
+        "serialize_ms": {
+            "jsonable_encoder+json": round(default_ms, 3),
+            "orjson": round(orjson_ms, 3),
+            "speedup": round(default_ms / orjson_ms, 1) if orjson_ms else None,
+        },
+        "bytes": {"json": len(default_body), "orjson": len(body), "gzip": len(gzipped)},
+        "compress_ms": {"gzip": round(gzip_ms, 3)},
+    }
+    if brotli is not None:
+        br_ms, br_body = timed(lambda: brotli.compress(body, quality=BROTLI_QUALITY), args.repeat)
+        result["bytes"]["brotli"] = len(br_body)
+        result["compress_ms"]["brotli"] = round(br_ms, 3)
+
+    json.dump(result, sys.stdout, indent=2)
+    print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+DragonFit - Session storage layout benchmark (documents vs monthly buckets)
+
+Starts its own mongod and two API servers on the same database, one per
+SESSION_LAYOUT, seeds users with --sessions sessions each through the
+bucket-layout API (so both layouts hold the same history), then times the
+progress endpoint against each layout. Also reports, per layout, the
+documents a query has to read and the in-process cost of a stats rebuild
+and of building one user's buckets (what `app.session_store --migrate`
+does):
+
+    python benchmarks/session_layout_bench.py --users 3 --sessions 10000 --runs 20
+
+Use --mongo-url to run against an existing server instead of spawning
+mongod (a throwaway database is created and dropped).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import sys
+import time
+import uuid
+
+import httpx
+
+from common import register_user, seed_history_bulk, summarize
+from load_bench import BACKEND_DIR, free_port, git_revision, start_api, start_mongod
+
+LAYOUTS = ("documents", "buckets")
+# bench_session dates: 28 sessions a month from 2020-01
+RANGE = {"from": "2024-01-01", "to": "2024-03-31"}
+
+
+async def seed(base_url, users, sessions):
+    seeded = []
+    async with httpx.AsyncClient(base_url=base_url, timeout=httpx.Timeout(600.0)) as client:
+        for _ in range(users):
+            await register_user(client)
+            await seed_history_bulk(client, sessions)
+            me = (await client.get("/api/auth/me")).json()
+            exercises = (await client.get("/api/exercises")).json()
+            seeded.append({
+                "user_id": me["user_id"],
+                "headers": {"Authorization": client.headers["Authorization"]},
+                "exercise_id": next(e["exercise_id"] for e in exercises if e["name"] == "Press Banca"),
+            })
+    return seeded
+
+
+def operations(user):
+    return {
+        "progress_all": {},
+        "progress_3_months": dict(RANGE),
+        "progress_exercise": {"exercise_key": user["exercise_id"]},
+        "progress_exercise_downsampled": {"exercise_key": user["exercise_id"], "max_points": 100},
+    }
+
+
+async def time_endpoints(base_url, users, runs):
+    latencies = {}
+    async with httpx.AsyncClient(base_url=base_url, timeout=httpx.Timeout(120.0)) as client:
+        start = time.perf_counter()
+        for _ in range(runs):
+            for user in users:
+                for name, params in operations(user).items():
+                    t0 = time.perf_counter()
+                    resp = await client.get("/api/progress", params=params, headers=user["headers"])
+                    resp.raise_for_status()
+                    latencies.setdefault(name, []).append((time.perf_counter() - t0) * 1000)
+        elapsed = time.perf_counter() - start
+    return {name: summarize(values, elapsed) for name, values in latencies.items()}
+
+
+async def in_process(users):
+    """Documents read per query, stats rebuild and bucket build times (app code, no HTTP)"""
+    sys.path.insert(0, BACKEND_DIR)
+    from app import session_store, stats
+    from app.database import db
+
+    user_id = users[0]["user_id"]
+    result = {layout: {} for layout in LAYOUTS}
+    month_range = {"$gte": RANGE["from"][:7], "$lte": RANGE["to"][:7]}
+    result["documents"]["documents_read"] = {
+        "progress_all": await db.training_sessions.count_documents({"user_id": user_id}),
+        "progress_3_months": await db.training_sessions.count_documents(
+            {"user_id": user_id, "date": {"$gte": RANGE["from"], "$lte": RANGE["to"]}}),
+    }
+    result["buckets"]["documents_read"] = {
+        "progress_all": await db.session_buckets.count_documents({"user_id": user_id}),
+        "progress_3_months": await db.session_buckets.count_documents({"user_id": user_id, "month": month_range}),
+    }
+
+    for layout in LAYOUTS:
+        session_store.LAYOUT = layout
+        t0 = time.perf_counter()
+        await stats.rebuild_user_stats(user_id)
+        result[layout]["stats_rebuild_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+
+    t0 = time.perf_counter()
+    buckets = await session_store.rebuild_user_buckets(user_id)
+    result["buckets"]["migrate_user_s"] = round(time.perf_counter() - t0, 2)
+    result["buckets"]["buckets_per_user"] = buckets
+    return result
+
+
+def print_comparison(result):
+    print(f"{'operation':<32} {'documents p50':>14} {'buckets p50':>12} {'speedup':>8}", file=sys.stderr)
+    docs, buckets = result["documents"]["endpoints"], result["buckets"]["endpoints"]
+    for name in docs:
+        before, after = docs[name]["p50_ms"], buckets[name]["p50_ms"]
+        print(f"{name:<32} {before:>14} {after:>12} {before / after if after else 0:>7.1f}x", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=3)
+    parser.add_argument("--sessions", type=int, default=10000, help="sessions seeded per user")
+    parser.add_argument("--runs", type=int, default=20, help="passes over every user and operation")
+    parser.add_argument("--mongod", default=shutil.which("mongod") or "mongod", help="mongod binary")
+    parser.add_argument("--mongo-url", help="use this MongoDB instead of spawning mongod")
+    parser.add_argument("--output", help="also write the JSON result to this file")
+    args = parser.parse_args()
+
+    processes = []
+    dbpath = None
+    db_name = f"dragonfit_layout_{uuid.uuid4().hex[:8]}"
+    mongo_url = args.mongo_url
+    try:
+        if not mongo_url:
+            port = free_port()
+            mongod, dbpath = start_mongod(args.mongod, port)
+            processes.append(mongod)
+            mongo_url = f"mongodb://127.0.0.1:{port}"
+        os.environ.update(MONGO_URL=mongo_url, DB_NAME=db_name)
+
+        urls = {}
+        for layout in LAYOUTS:
+            api_port = free_port()
+            processes.append(start_api(api_port, mongo_url, db_name, 1, 4, {"SESSION_LAYOUT": layout}))
+            urls[layout] = f"http://127.0.0.1:{api_port}"
+
+        seed_start = time.perf_counter()
+        users = asyncio.run(seed(urls["buckets"], args.users, args.sessions))
+        seed_s = time.perf_counter() - seed_start
+
+        result = {
+            "meta": {
+                "revision": git_revision(),
+                "python": platform.python_version(),
+                "users": args.users,
+                "sessions_per_user": args.sessions,
+                "runs": args.runs,
+                "seed_s": round(seed_s, 2),
+            }
+        }
+        for layout in LAYOUTS:
+            result[layout] = {"endpoints": asyncio.run(time_endpoints(urls[layout], users, args.runs))}
+        for layout, extra in asyncio.run(in_process(users)).items():
+            result[layout].update(extra)
+    finally:
+        for proc in reversed(processes):
+            proc.terminate()
+            proc.wait(timeout=30)
+        if args.mongo_url:
+            from pymongo import MongoClient
+            MongoClient(args.mongo_url).drop_database(db_name)
+        if dbpath:
+            shutil.rmtree(dbpath, ignore_errors=True)
+
+    json.dump(result, sys.stdout, indent=2)
+    print()
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    print_comparison(result)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -351,13 +351,14 @@ const DashboardPage = () => {
 
   const fetchData = async () => {
     try {
-      const [workoutsRes, statsRes] = await Promise.all([
-        apiFetch("/api/workouts", { }),
-        apiFetch("/api/stats", { })
-      ]);
+      // One request; unchanged data is revalidated with ETag (304)
+      const response = await apiFetch("/api/dashboard", { });
 
-      if (workoutsRes.ok) setWorkouts(await workoutsRes.json());
-      if (statsRes.ok) setStats(await statsRes.json());
+      if (response.ok) {
+        const data = await response.json();
+        setWorkouts(data.workouts);
+        setStats(data.stats);
+      }
     } catch (error) {
       console.error('Error fetching data:', error);
     } finally {